@@ -1,5 +1,7 @@
 from django.contrib import admin
-from .models import Card, CardSet, CartItem, OtherProduct, OrderItem, Order
+from django.db import transaction
+from . import checkout, stock_ledger
+from .models import Card, CardSet, CartItem, OtherProduct, OrderItem, Order, StockMovement
 
 @admin.register(CardSet)
 class CardSetAdmin(admin.ModelAdmin):
@@ -8,8 +10,21 @@ class CardSetAdmin(admin.ModelAdmin):
     search_fields = ['name', 'code']
     ordering = ['-release_date']
 
+class StockLedgerAdmin(admin.ModelAdmin):
+    """Records stock edits (change form and list_editable) in the stock ledger under the admin user"""
+    
+    def save_model(self, request, obj, form, change):
+        stock_ledger.changed_by(obj, request.user)
+        super().save_model(request, obj, form, change)
+    
+    def changelist_view(self, request, extra_context=None):
+        # list_editable saves every row separately; write their movements together
+        with transaction.atomic(), stock_ledger.collect():
+            return super().changelist_view(request, extra_context)
+
+
 @admin.register(Card)
-class CardAdmin(admin.ModelAdmin):
+class CardAdmin(StockLedgerAdmin):
     list_display = ['name', 'card_type', 'rarity', 'price', 'stock_quantity', 'card_set', 'condition']
     list_filter = ['card_type', 'rarity', 'condition', 'card_set']
     search_fields = ['name', 'description']
@@ -41,7 +56,7 @@ class CartItemAdmin(admin.ModelAdmin):
     readonly_fields = ['total_price']
 
 @admin.register(OtherProduct)
-class OtherProductAdmin(admin.ModelAdmin):
+class OtherProductAdmin(StockLedgerAdmin):
     list_display = ['name', 'product_type', 'brand', 'sku', 'price', 'stock_quantity', 'condition']
     list_filter = ['product_type', 'condition', 'brand']
     search_fields = ['name', 'sku', 'brand']
@@ -56,6 +71,7 @@ class OrderAdmin(admin.ModelAdmin):
     readonly_fields = ['order_number', 'created_at', 'updated_at']
     date_hierarchy = 'created_at'
     ordering = ['-created_at']
+    actions = ['cancel_selected']
     
     fieldsets = (
         ('Order Information', {
@@ -76,6 +92,11 @@ class OrderAdmin(admin.ModelAdmin):
             'classes': ('collapse',)
         }),
     )
+    
+    @admin.action(description='Cancel selected orders and restock their items')
+    def cancel_selected(self, request, queryset):
+        cancelled = checkout.cancel_orders(queryset, user=request.user)
+        self.message_user(request, f'Cancelled {len(cancelled)} of {queryset.count()} orders.')
 
 
 @admin.register(OrderItem)
@@ -84,4 +105,23 @@ class OrderItemAdmin(admin.ModelAdmin):
     list_filter = ['order__status', 'created_at']
     search_fields = ['order__order_number', 'product_name', 'product_sku']
     readonly_fields = ['subtotal', 'created_at']
-    ordering = ['-created_at']
\ No newline at end of file
+    ordering = ['-created_at']
+
+
+@admin.register(StockMovement)
+class StockMovementAdmin(admin.ModelAdmin):
+    """The ledger is append-only: viewable here, never edited"""
+    list_display = ['created_at', 'card', 'other_product', 'delta', 'reason', 'order', 'user', 'note']
+    list_filter = ['reason', 'created_at']
+    search_fields = ['card__name', 'other_product__name', 'other_product__sku', 'order__order_number', 'note']
+    list_select_related = ['card', 'other_product', 'order', 'user']
+    ordering = ['-id']
+    
+    def has_add_permission(self, request):
+        return False
+    
+    def has_change_permission(self, request, obj=None):
+        return False
+    
+    def has_delete_permission(self, request, obj=None):
+        return False
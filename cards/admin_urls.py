@@ -11,6 +11,7 @@ urlpatterns = [
     path('warehouse/card/edit/<int:card_id>/', admin_views.admin_edit_card, name='edit_card'),
     path('warehouse/card/delete/<int:card_id>/', admin_views.admin_delete_card, name='delete_card'),
     path('warehouse/update-stock/', admin_views.admin_update_stock, name='update_stock'),
+    path('warehouse/update-stock/batch/', admin_views.admin_batch_update_stock, name='batch_update_stock'),
     
     # Card Sets (under warehouse)
     path('warehouse/card-sets/', admin_views.admin_card_sets, name='card_sets'),
@@ -24,6 +25,7 @@ urlpatterns = [
     path('orders/', admin_views.admin_orders, name='orders'),
     path('orders/<int:order_id>/', admin_views.admin_order_detail, name='order_detail'),
     path('orders/<int:order_id>/update-status/', admin_views.update_order_status, name='update_order_status'),
+    path('orders/bulk-cancel/', admin_views.admin_bulk_cancel_orders, name='bulk_cancel_orders'),
     path('orders/<int:order_id>/update-payment/', admin_views.admin_update_payment_status, name='update_payment_status'),
     path('orders/statistics/', admin_views.admin_order_statistics, name='order_statistics'),
     
@@ -3,7 +3,7 @@ from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required, user_passes_test
 from django.http import JsonResponse
 from django.contrib import messages
-from django.core.paginator import Paginator
+from django.db import transaction
 from django.db.models import Q, Count
 from .models import Card, CardSet, CartItem, OtherProduct, Tournament
 from django.views.decorators.http import require_POST
@@ -16,6 +16,10 @@ from django.db.models import Sum, Count
 from django import forms
 from django.template.exceptions import TemplateDoesNotExist
 from django.urls import reverse
+from django.utils import timezone
+from . import checkout, importer, search, stock_ledger, warehouse
+from .counts import CachedCountPaginator
+from .pagination import paginate, query_params
 
 @staff_member_required
 def admin_dashboard(request):
@@ -58,7 +62,7 @@ def admin_card_sets(request):
         card_sets = card_sets.filter(release_date__year=year_filter)
     
     # Pagination
-    paginator = Paginator(card_sets, 20)
+    paginator = CachedCountPaginator(card_sets, 20)
     page_number = request.GET.get('page')
     page_obj = paginator.get_page(page_number)
     
@@ -280,6 +284,7 @@ def admin_warehouse(request):
     form = None
     card_set_form = None
     bulk_form = None 
+    import_result = None
 
     # Handle form submissions
     if request.method == 'POST':
@@ -387,6 +392,11 @@ def admin_warehouse(request):
                         except (ValueError, TypeError):
                             errors.append("Invalid level value")
                 
+                # Set, name, rarity and condition identify a card (card_identity_unique)
+                if not errors and Card.objects.filter(
+                        card_set=card_set, name=name, rarity=rarity, condition=condition).exists():
+                    errors.append("A card with this name, rarity and condition already exists in this set")
+
                 # If no errors, create the card
                 if not errors:
                     try:
@@ -464,11 +474,37 @@ def admin_warehouse(request):
                         
             except Exception as e:
                 messages.error(request, f'Unexpected error: {str(e)}')
-    else:
-        # Initialize empty forms for GET requests
-        from .forms import CardForm, CardSetForm, BulkCardUploadForm
+        
+        elif 'bulk_upload' in request.POST:
+            from .forms import BulkCardUploadForm
+            bulk_form = BulkCardUploadForm(request.POST, request.FILES)
+            if bulk_form.is_valid():
+                try:
+                    result = importer.import_cards(
+                        importer.text_stream(bulk_form.cleaned_data['csv_file']), user=request.user
+                    )
+                except importer.CSVFormatError as e:
+                    messages.error(request, f'Invalid CSV file: {e}')
+                else:
+                    messages.success(
+                        request,
+                        f'Imported {result.rows} rows: {result.created} cards created, {result.updated} updated'
+                    )
+                    if not result.failed:
+                        return redirect('admin_dashboard:warehouse')
+                    # Show the rejected rows on the page
+                    import_result = result
+            else:
+                for error in bulk_form.errors.get('csv_file', []):
+                    messages.error(request, error)
+
+    # Initialize empty forms (also after a failed POST)
+    from .forms import CardForm, CardSetForm, BulkCardUploadForm
+    if form is None:
         form = CardForm()
+    if card_set_form is None:
         card_set_form = CardSetForm()
+    if bulk_form is None:
         bulk_form = BulkCardUploadForm()
 
     # Handle search and filtering for GET requests
@@ -477,11 +513,7 @@ def admin_warehouse(request):
     # Search functionality
     search_query = request.GET.get('search', '')
     if search_query:
-        cards = cards.filter(
-            Q(name__icontains=search_query) |
-            Q(description__icontains=search_query) |
-            Q(card_set__name__icontains=search_query)
-        )
+        cards = search.filter_queryset(cards, 'card', search_query)
     
     # Filter by card type
     card_type_filter = request.GET.get('card_type', '')
@@ -509,15 +541,15 @@ def admin_warehouse(request):
 
     # Ordering
     order_by = request.GET.get('order_by', 'name')
-    if order_by in ['name', '-name', 'price', '-price', 'stock_quantity', '-stock_quantity', 'created_at', '-created_at']:
+    if search_query and 'order_by' not in request.GET:
+        cards = cards.order_by('search_tier', 'search_rank', 'name')
+    elif order_by in ['name', '-name', 'price', '-price', 'stock_quantity', '-stock_quantity', 'created_at', '-created_at']:
         cards = cards.order_by(order_by)
     else:
         cards = cards.order_by('name')
 
     # Pagination
-    paginator = Paginator(cards, 20)  # 20 cards per page
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    page_obj = paginate(request, cards, 20)  # 20 cards per page
     
     # Get all card sets for filters and dropdowns
     card_sets = CardSet.objects.all().order_by('name')
@@ -525,9 +557,11 @@ def admin_warehouse(request):
     context = {
         'cards': page_obj,
         'card_sets': card_sets, 
+        'query_params': query_params(request),
         'form': form,
         'card_set_form': card_set_form,
         'bulk_form': bulk_form,
+        'import_result': import_result,
         'search_query': search_query,
         'card_type_filter': card_type_filter,
         'rarity_filter': rarity_filter,
@@ -584,7 +618,9 @@ def admin_edit_card(request, card_id):
                 card.defense = None
                 card.level = None
             
-            card.save()
+            stock_ledger.changed_by(card, request.user)
+            with transaction.atomic():
+                card.save()
             
             messages.success(request, f'Card "{card.name}" updated successfully!')
             return redirect('admin_dashboard:warehouse')
@@ -630,7 +666,10 @@ def admin_update_stock(request):
             
             card = get_object_or_404(Card, id=card_id)
             card.stock_quantity = new_stock
-            card.save()
+            # Atomic so the ledger diff is taken against a locked row (see stock_ledger.py)
+            stock_ledger.changed_by(card, request.user)
+            with transaction.atomic():
+                card.save()
             
             return JsonResponse({
                 'success': True,
@@ -651,6 +690,33 @@ def admin_update_stock(request):
     return JsonResponse({'success': False, 'message': 'Invalid request method'})
 
 
+@staff_member_required
+@require_POST
+def admin_batch_update_stock(request):
+    """AJAX endpoint: apply queued stock edits [{card_id, quantity | delta}, ...] in one transaction"""
+    try:
+        payload = json.loads(request.body or b'null')
+    except (ValueError, UnicodeDecodeError):
+        return JsonResponse({'success': False, 'message': 'Invalid JSON'}, status=400)
+    
+    changes = payload.get('changes') if isinstance(payload, dict) else payload
+    if not isinstance(changes, list) or not changes:
+        return JsonResponse({'success': False, 'message': 'No changes'}, status=400)
+    if len(changes) > warehouse.MAX_CHANGES:
+        return JsonResponse({
+            'success': False,
+            'message': f'Too many changes (max {warehouse.MAX_CHANGES})'
+        }, status=400)
+    
+    results = warehouse.apply_stock_changes(changes, request.user)
+    updated = sum(1 for result in results if result['success'])
+    return JsonResponse({
+        'success': updated == len(results),
+        'message': f'Updated {updated} of {len(results)} changes',
+        'results': results,
+    })
+
+
 @staff_member_required
 def admin_posts(request):
     """Posts management"""
@@ -687,11 +753,7 @@ def admin_other_products(request):
     # Search functionality
     search_query = request.GET.get('q', '')
     if search_query:
-        products = products.filter(
-            Q(name__icontains=search_query) | 
-            Q(sku__icontains=search_query) |
-            Q(brand__icontains=search_query)
-        )
+        products = search.filter_queryset(products, 'other_product', search_query)
     
     # Product type filter
     product_type_filter = request.GET.get('product_type', '')
@@ -709,11 +771,13 @@ def admin_other_products(request):
     
     # Ordering
     order_by = request.GET.get('order_by', 'name')
-    if order_by in ['name', '-name', 'price', '-price', 'stock_quantity', '-stock_quantity', 'created_at', '-created_at']:
+    if search_query and 'order_by' not in request.GET:
+        products = products.order_by('search_tier', 'search_rank', 'name')
+    elif order_by in ['name', '-name', 'price', '-price', 'stock_quantity', '-stock_quantity', 'created_at', '-created_at']:
         products = products.order_by(order_by)
     
     # Pagination
-    paginator = Paginator(products, 20)
+    paginator = CachedCountPaginator(products, 20)
     page_number = request.GET.get('page')
     page_obj = paginator.get_page(page_number)
     
@@ -813,7 +877,9 @@ def admin_edit_other_product(request, product_id):
             if 'image' in request.FILES:
                 product.image = request.FILES['image']
             
-            product.save()
+            stock_ledger.changed_by(product, request.user)
+            with transaction.atomic():
+                product.save()
             
             messages.success(request, f'Sản phẩm "{product.name}" đã được cập nhật thành công!')
             return redirect('admin_dashboard:other_products')
@@ -919,7 +985,8 @@ def admin_bulk_post_action(request):
 @staff_member_required
 def admin_orders(request):
     """Enhanced orders management with filtering and search"""
-    orders = Order.objects.select_related('user').prefetch_related('items').all()
+    # item_count / line_count live on Order, so no item prefetch
+    orders = Order.objects.select_related('user').all()
     
     # Search functionality
     search_query = request.GET.get('q', '')
@@ -954,9 +1021,7 @@ def admin_orders(request):
     orders = orders.order_by(order_by)
     
     # Pagination
-    paginator = Paginator(orders, 20)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    page_obj = paginate(request, orders, 20)
     
     # DEBUG: Check what's in the page
     print(f"DEBUG: Page has {len(page_obj)} orders")
@@ -972,6 +1037,7 @@ def admin_orders(request):
     
     context = {
         'orders': page_obj,
+        'query_params': query_params(request),
         'search_query': search_query,
         'status_filter': status_filter,
         'payment_filter': payment_filter,
@@ -1135,12 +1201,11 @@ def admin_users(request):
     new_users_month = User.objects.filter(date_joined__gte=current_month_start).count()
     
     # Pagination
-    paginator = Paginator(users, 20)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    page_obj = paginate(request, users, 20)
     
     context = {
         'users': page_obj,
+        'query_params': query_params(request),
         'total_users': total_users,
         'active_users': active_users,
         'staff_count': staff_count,
@@ -1310,7 +1375,7 @@ def admin_tournaments(request):
     )['total'] or 0
     
     # Pagination
-    paginator = Paginator(tournaments, 10)
+    paginator = CachedCountPaginator(tournaments, 10)
     page_number = request.GET.get('page')
     tournaments_page = paginator.get_page(page_number)
     
@@ -1558,7 +1623,7 @@ def admin_settings(request):
 def update_settings(request):
     """Update settings based on form submission"""
     section = request.POST.get('section')
-    settings = SiteSettings.get_settings()
+    settings = SiteSettings.get_settings(cached=False)
     
     try:
         if section == 'general':
@@ -1661,7 +1726,7 @@ def admin_shipping_settings(request):
     from .models import ShippingSettings
     from .forms import ShippingSettingsForm
     
-    settings = ShippingSettings.get_settings()
+    settings = ShippingSettings.get_settings(cached=False)
     
     if request.method == 'POST':
         form = ShippingSettingsForm(request.POST, instance=settings)
@@ -1690,7 +1755,22 @@ def update_order_status(request, order_id):
         new_status = request.POST.get('status')
         note = request.POST.get('note', '')
         
-        if new_status in dict(Order.STATUS_CHOICES):
+        if new_status == 'cancelled' and order.status != 'cancelled':
+            # Cancelling puts the stock back; same routine as the customer's cancel button
+            if checkout.cancel_orders(Order.objects.filter(pk=order.pk), user=request.user):
+                messages.success(request, f"Đã hủy đơn hàng #{order.order_number} và hoàn lại tồn kho.")
+            elif Order.objects.filter(pk=order.pk).exclude(status='cancelled').update(
+                    status='cancelled', updated_at=timezone.now()):
+                # Processing/shipped orders may already be packed or in transit, so the stock
+                # is not put back automatically; staff restock by hand once it is returned
+                messages.warning(
+                    request,
+                    f"Đã hủy đơn hàng #{order.order_number} (đang ở trạng thái '{order.get_status_display()}') "
+                    "nhưng KHÔNG hoàn lại tồn kho. Hãy điều chỉnh tồn kho thủ công khi hàng được trả về.",
+                )
+            else:
+                messages.info(request, f"Đơn hàng #{order.order_number} đã được hủy trước đó.")
+        elif new_status in dict(Order.STATUS_CHOICES):
             old_status = order.get_status_display()
             order.status = new_status
             order.save()
@@ -1706,6 +1786,22 @@ def update_order_status(request, order_id):
     
     return redirect('admin_dashboard:orders')
 
+@staff_member_required
+def admin_bulk_cancel_orders(request):
+    """Cancel the selected orders and return their stock in one pass"""
+    if request.method == 'POST':
+        order_ids = [order_id for order_id in request.POST.getlist('order_ids') if order_id.isdigit()]
+        if not order_ids:
+            messages.warning(request, "Chưa chọn đơn hàng nào.")
+        else:
+            cancelled = checkout.cancel_orders(Order.objects.filter(pk__in=order_ids), user=request.user)
+            skipped = len(order_ids) - len(cancelled)
+            messages.success(request, f"Đã hủy {len(cancelled)} đơn hàng và hoàn lại tồn kho.")
+            if skipped:
+                messages.warning(request, f"{skipped} đơn hàng đã được xử lý nên không thể hủy.")
+    
+    return redirect('admin_dashboard:orders')
+
 @staff_member_required
 def admin_hero_slider(request):
     if request.method == 'POST':
@@ -0,0 +1,402 @@
+"""
+In-memory, typo-tolerant autocomplete over card names and card set names.
+
+Each worker keeps a prefix trie (for "starts with" matches at any word boundary) and
+a trigram index (for misspellings such as "blueyes" or "ash blosom"). Signal handlers
+update the local index in place and bump a version in the shared cache; other workers
+notice the new version and pull only the changed rows. Only new cards, renames and
+deletions are published (stock and price saves leave the index alone), and every
+published version records the card ids deleted with it, so a sync never lists every card.
+"""
+import heapq
+import math
+import re
+import threading
+import time
+import unicodedata
+from datetime import timedelta
+
+from django.core.cache import cache
+from django.urls import reverse
+from django.utils import timezone
+
+from . import versioning
+from .models import Card, CardSet
+
+VERSION_KEY = 'cards:autocomplete:version'
+
+# Card ids deleted at each published version (formatted with the version)
+REMOVED_KEY = 'cards:autocomplete:removed:{}'
+REMOVED_TIMEOUT = 24 * 60 * 60
+
+# A worker this many versions behind reloads everything instead of reading tombstones
+MAX_SYNC_VERSIONS = 1000
+
+# How long (seconds) a worker goes without checking the shared version
+CHECK_INTERVAL = 5.0
+
+# Suggestions kept per trie node; also the maximum `limit` of a lookup
+TOP_K = 20
+
+# Minimum trigram similarity (Jaccard) for correcting a single word
+WORD_MIN_SIMILARITY = 0.25
+
+# Minimum share of the query's trigrams a name must contain to be a fuzzy match
+MIN_COVERAGE = 0.5
+
+# Trie depth cap; longer prefixes are checked against the entries stored at the cap
+MAX_DEPTH = 16
+
+NON_WORD_RE = re.compile(r'[\W_]+')
+
+
+def normalize(text):
+    """Lowercase, strip accents and punctuation: 'Blue-Eyes' -> 'blue eyes'"""
+    text = unicodedata.normalize('NFKD', text or '')
+    if not text.isascii():
+        text = ''.join(ch for ch in text if not unicodedata.combining(ch))
+    return NON_WORD_RE.sub(' ', text.lower()).strip()
+
+
+def trigrams(normalized):
+    """Trigrams of the name with spaces removed, so 'blue eyes' and 'blueeyes' agree"""
+    compact = f"  {normalized.replace(' ', '')} "
+    return {compact[i:i + 3] for i in range(len(compact) - 2)}
+
+
+class _Node:
+    __slots__ = ('children', 'terminals', 'top')
+
+    def __init__(self):
+        self.children = {}
+        self.terminals = ()
+        self.top = None  # cached best entries under this node; None when stale
+
+
+class AutocompleteIndex:
+    """Prefix trie plus trigram index over (kind, id) entries"""
+
+    def __init__(self):
+        self.root = _Node()
+        self.entries = {}        # key -> {'name', 'normalized', 'rank', 'url_arg'}
+        self.postings = {}       # trigram -> set of keys
+        self.words = {}          # word -> number of entries using it
+        self.word_postings = {}  # trigram -> set of words
+        self.lock = threading.RLock()
+
+    def __len__(self):
+        return len(self.entries)
+
+    # Building
+
+    def add(self, key, name, url_arg=None):
+        normalized = normalize(name)
+        with self.lock:
+            current = self.entries.get(key)
+            if current is not None:
+                if current['normalized'] == normalized and current['name'] == name:
+                    return
+                self.remove(key)
+            if not normalized:
+                return
+            grams = trigrams(normalized)
+            self.entries[key] = {
+                'name': name,
+                'normalized': normalized,
+                'rank': (len(normalized), normalized),
+                'url_arg': url_arg,
+            }
+            for suffix in self._suffixes(normalized):
+                node = self.root
+                node.top = None
+                for ch in suffix[:MAX_DEPTH]:
+                    child = node.children.get(ch)
+                    if child is None:
+                        child = node.children[ch] = _Node()
+                    node = child
+                    node.top = None
+                if not node.terminals:
+                    node.terminals = set()
+                node.terminals.add(key)
+            for gram in grams:
+                self.postings.setdefault(gram, set()).add(key)
+            for word in set(normalized.split(' ')):
+                if word not in self.words:
+                    self.words[word] = 0
+                    for gram in trigrams(word):
+                        self.word_postings.setdefault(gram, set()).add(word)
+                self.words[word] += 1
+
+    def remove(self, key):
+        with self.lock:
+            entry = self.entries.pop(key, None)
+            if entry is None:
+                return
+            for suffix in self._suffixes(entry['normalized']):
+                path = self._walk(suffix[:MAX_DEPTH])
+                if path is None:
+                    continue
+                if path[-1].terminals:
+                    path[-1].terminals.discard(key)
+                for node in path:
+                    node.top = None
+            for gram in trigrams(entry['normalized']):
+                keys = self.postings.get(gram)
+                if keys is not None:
+                    keys.discard(key)
+                    if not keys:
+                        del self.postings[gram]
+            for word in set(entry['normalized'].split(' ')):
+                self.words[word] -= 1
+                if not self.words[word]:
+                    del self.words[word]
+                    for gram in trigrams(word):
+                        self.word_postings[gram].discard(word)
+
+    @staticmethod
+    def _suffixes(normalized):
+        # Index the name from every word start so "eyes" finds "Blue-Eyes White Dragon"
+        words = normalized.split(' ')
+        return [' '.join(words[i:]) for i in range(len(words))]
+
+    def _walk(self, text):
+        node = self.root
+        path = [node]
+        for ch in text:
+            node = node.children.get(ch)
+            if node is None:
+                return None
+            path.append(node)
+        return path
+
+    def _rank(self, key):
+        return self.entries[key]['rank']
+
+    def _top(self, node):
+        if node.top is None:
+            candidates = set(node.terminals)
+            for child in node.children.values():
+                candidates.update(self._top(child))
+            node.top = heapq.nsmallest(TOP_K, candidates, key=self._rank)
+        return node.top
+
+    # Lookups
+
+    def prefix_matches(self, normalized, limit):
+        with self.lock:
+            path = self._walk(normalized[:MAX_DEPTH])
+            if path is None:
+                return []
+            if len(normalized) <= MAX_DEPTH:
+                return self._top(path[-1])[:limit]
+            # Past the depth cap the node holds every entry sharing the first MAX_DEPTH chars
+            matches = [
+                key for key in path[-1].terminals
+                if any(suffix.startswith(normalized) for suffix in self._suffixes(self.entries[key]['normalized']))
+            ]
+            return heapq.nsmallest(limit, matches, key=self._rank)
+
+    def correct_word(self, word):
+        """Return the closest known word by trigram similarity, or None"""
+        if word in self.words:
+            return word
+        grams = trigrams(word)
+        best = None
+        for candidate in set().union(*(self.word_postings.get(gram, ()) for gram in grams)):
+            other = trigrams(candidate)
+            shared = len(grams & other)
+            similarity = shared / (len(grams) + len(other) - shared)
+            if similarity >= WORD_MIN_SIMILARITY and (best is None or (similarity, -self.words[candidate]) > best[0]):
+                best = ((similarity, -self.words[candidate]), candidate)
+        return best[1] if best else None
+
+    def corrected_query(self, normalized):
+        """Spell-correct each word; the last word is kept if it is already a valid prefix"""
+        words = normalized.split(' ')
+        corrected = []
+        with self.lock:
+            for position, word in enumerate(words):
+                if position == len(words) - 1 and self._walk(word[:MAX_DEPTH]) is not None:
+                    corrected.append(word)
+                    continue
+                corrected.append(self.correct_word(word) or word)
+        return ' '.join(corrected)
+
+    def fuzzy_matches(self, normalized, limit, exclude=()):
+        grams = trigrams(normalized)
+        with self.lock:
+            lists = sorted((self.postings.get(gram, ()) for gram in grams), key=len)
+            # A match needs at least `needed` shared trigrams, so it must appear in one
+            # of the shortest len(lists) - needed + 1 posting lists
+            needed = max(1, math.ceil(MIN_COVERAGE * len(grams)))
+            probe = len(lists) - needed + 1
+            candidates = set().union(*lists[:probe]) if probe > 0 else set()
+            candidates.difference_update(exclude)
+            scored = []
+            for key in candidates:
+                shared = sum(1 for keys in lists if key in keys)
+                if shared >= needed:
+                    scored.append((-shared, self.entries[key]['rank'], key))
+        return [key for _, _, key in heapq.nsmallest(limit, scored)]
+
+    def suggest(self, query, limit=8):
+        """Return up to `limit` entry keys.
+
+        Exact prefix matches come first, then prefix matches of the spell-corrected
+        query, then whole-name trigram matches.
+        """
+        normalized = normalize(query)
+        if not normalized:
+            return []
+        limit = min(limit, TOP_K)
+        keys = self.prefix_matches(normalized, limit)
+        if len(keys) < limit:
+            corrected = self.corrected_query(normalized)
+            if corrected and corrected != normalized:
+                keys += [key for key in self.prefix_matches(corrected, limit) if key not in keys]
+                keys = keys[:limit]
+        if len(keys) < limit:
+            keys += self.fuzzy_matches(normalized, limit - len(keys), exclude=set(keys))
+        return keys
+
+
+# Process-wide index
+
+_index = None
+_state = {'version': None, 'checked_at': 0.0, 'synced_at': None}
+_load_lock = threading.Lock()
+
+
+def _load_sets(index):
+    live = set()
+    for set_id, name, code in CardSet.objects.values_list('id', 'name', 'code'):
+        index.add(('set', set_id), name, code)
+        live.add(('set', set_id))
+    for key in [key for key in index.entries if key[0] == 'set' and key not in live]:
+        index.remove(key)
+
+
+def _full_load():
+    index = AutocompleteIndex()
+    started = time.time()
+    for card_id, name in Card.objects.values_list('id', 'name').iterator(chunk_size=2000):
+        index.add(('card', card_id), name)
+    _load_sets(index)
+    _state['synced_at'] = started
+    return index
+
+
+def _removed_between(old_version, new_version):
+    """Card ids deleted in versions (old, new], or None if some tombstones are missing"""
+    if not 0 < new_version - old_version <= MAX_SYNC_VERSIONS:
+        return None
+    keys = [REMOVED_KEY.format(version) for version in range(old_version + 1, new_version + 1)]
+    found = cache.get_many(keys)
+    if len(found) < len(keys):
+        # Evicted, or a bump whose tombstone is still being written
+        return None
+    return [card_id for card_ids in found.values() for card_id in card_ids]
+
+
+def _sync(index, removed):
+    """Pull rows changed by other workers since the last sync and drop removed cards"""
+    started = time.time()
+    # Small overlap so a save racing with the previous sync is never missed
+    since = timezone.now() - timedelta(seconds=started - _state['synced_at'] + CHECK_INTERVAL)
+    for card_id, name in Card.objects.filter(updated_at__gte=since).values_list('id', 'name'):
+        index.add(('card', card_id), name)
+    for card_id in removed:
+        index.remove(('card', card_id))
+    _load_sets(index)
+    _state['synced_at'] = started
+
+
+def get_index():
+    """Return the worker's index, loading or syncing it when needed"""
+    global _index
+    now = time.monotonic()
+    if _index is not None and now - _state['checked_at'] < CHECK_INTERVAL:
+        return _index
+    with _load_lock:
+        version = versioning.get_version(VERSION_KEY)
+        if _index is None:
+            _index = _full_load()
+        elif version != _state['version']:
+            removed = _removed_between(_state['version'], version)
+            if removed is None:
+                _index = _full_load()
+            else:
+                _sync(_index, removed)
+        _state['version'] = version
+        _state['checked_at'] = now
+    return _index
+
+
+def _publish_change(removed=()):
+    version = versioning.bump_version(VERSION_KEY)
+    # Written for every version, so a sync can tell "nothing deleted" from "evicted"
+    cache.set(REMOVED_KEY.format(version), list(removed), timeout=REMOVED_TIMEOUT)
+    # Skip our own next sync only if no other worker published a change in between
+    if _state['version'] is not None and version == _state['version'] + 1:
+        _state['version'] = version
+
+
+def card_changed(card, created=False, update_fields=None):
+    """Index a saved card; other workers only hear about new cards and renames"""
+    if update_fields is not None and 'name' not in update_fields:
+        return
+    # Set by Card.from_db; a card built in memory has none and is always published
+    loaded_name = getattr(card, '_loaded_name', None)
+    card._loaded_name = card.name
+    if not created and loaded_name == card.name:
+        return
+    if _index is not None:
+        _index.add(('card', card.pk), card.name)
+    _publish_change()
+
+
+def cards_changed(cards):
+    """card_changed() for a batch of new or renamed cards, publishing a single version bump"""
+    if not cards:
+        return
+    if _index is not None:
+        for card in cards:
+            _index.add(('card', card.pk), card.name)
+    _publish_change()
+
+
+def card_removed(card_id):
+    if _index is not None:
+        _index.remove(('card', card_id))
+    _publish_change(removed=[card_id])
+
+
+def card_set_changed(card_set):
+    if _index is not None:
+        _index.add(('set', card_set.pk), card_set.name, card_set.code)
+    _publish_change()
+
+
+def card_set_removed(card_set_id):
+    if _index is not None:
+        _index.remove(('set', card_set_id))
+    _publish_change()
+
+
+def suggest(query, limit=8):
+    """Return suggestion dicts for the JSON endpoint"""
+    index = get_index()
+    card_list_url = reverse('card_list')
+    results = []
+    for key in index.suggest(query, limit):
+        # A card deleted by another thread since suggest() returned is simply skipped
+        entry = index.entries.get(key)
+        if entry is None:
+            continue
+        kind, object_id = key
+        if kind == 'card':
+            url = reverse('card_detail', kwargs={'pk': object_id})
+        else:
+            url = f"{card_list_url}?set={entry['url_arg']}"
+        results.append({'type': kind, 'id': object_id, 'name': entry['name'], 'url': url})
+    return results
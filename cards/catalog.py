@@ -0,0 +1,18 @@
+"""
+Catalog version counter.
+
+A single number in the shared cache that changes whenever a card, other product or
+card set is saved or deleted (see signals.py). Caches derived from the catalog put it
+in their keys, so one bump retires every stale entry at once.
+"""
+from . import versioning
+
+VERSION_KEY = 'cards:catalog:version'
+
+
+def get_version():
+    return versioning.get_version(VERSION_KEY)
+
+
+def bump_version():
+    return versioning.bump_version(VERSION_KEY)
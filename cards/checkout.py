@@ -0,0 +1,314 @@
+"""
+Turning a user's cart into an order.
+
+place_order() runs in one transaction: it locks the cart's cards and other products
+with SELECT ... FOR UPDATE (one query per table, always cards first and in id order, so
+two checkouts sharing items queue up instead of deadlocking), checks stock against the
+locked rows, writes the order and all its lines in one bulk_create, and takes the stock
+with one conditional UPDATE per table. The UPDATE only matches rows that still have
+enough stock, so even on a database without row locks (SQLite) a short row rolls the
+whole order back instead of overselling.
+
+The checkout form carries an idempotency key (new_key()). place_order() claims it by
+inserting a CheckoutKey row first thing in its transaction; the unique (user, key)
+index makes a double-clicked or retried submit wait for the first one and then get its
+order back instead of placing a second. A failed attempt rolls its claim back, so the
+same key can be retried.
+
+The order number is allocated inside the same transaction, after the key claim and the
+stock check, so the day's counter row is the last lock taken and is held only for the
+writes; a checkout that fails rolls its number back instead of leaving a gap.
+
+Opening the checkout page calls reserve_cart(), which goes through the same lock and
+check and then holds the quantities for a few minutes (see reservations.py). Stock held
+by other users' active holds is not available; the buyer's own holds are released when
+the order is placed.
+
+cancel_orders() is the reverse for any number of orders at once: it locks the orders,
+reads all their lines in one query, puts the stock back with one grouped F() increment
+per product table and marks the orders cancelled with one UPDATE.
+
+Both write their StockMovement rows (see stock_ledger.py) with one bulk_create in the
+same transaction as the stock UPDATE.
+
+QuerySet.update() and bulk_create() skip the post_save signals, so the catalog caches
+are invalidated here once the order commits.
+"""
+import uuid
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db import IntegrityError, models, transaction
+from django.db.models import Case, F, Q, When
+from django.utils import timezone
+
+from . import catalog, homepage, order_numbers, reservations, stock_ledger
+from .models import Card, CartItem, CheckoutKey, Order, OrderItem, OtherProduct
+
+TAX_RATE = Decimal('0.085')  # 8.5% tax
+
+# Orders in these states can still be cancelled (stock goes back on the shelf)
+CANCELLABLE_STATUSES = ('pending', 'confirmed')
+
+# Cart/order line field -> product model, in lock order
+PRODUCT_FIELDS = (('card', Card), ('other_product', OtherProduct))
+
+
+class CheckoutError(Exception):
+    pass
+
+
+class EmptyCart(CheckoutError):
+    pass
+
+
+class InsufficientStock(CheckoutError):
+    def __init__(self, product, available):
+        self.product = product
+        self.available = available
+        super().__init__(f'Insufficient stock for {product.name}. Available: {available}')
+
+
+def totals(subtotal):
+    """Return (tax, shipping, total) for a cart subtotal"""
+    tax = subtotal * TAX_RATE
+    shipping = Decimal('0.00')  # Free shipping
+    return tax, shipping, subtotal + tax + shipping
+
+
+def lock(model, ids):
+    """Lock rows by primary key in ascending order; return {pk: instance}"""
+    rows = model.objects.select_for_update().filter(pk__in=ids).order_by('pk')
+    return {row.pk: row for row in rows}
+
+
+def take_stock(model, quantities):
+    """Decrement stock for {pk: quantity} in one UPDATE that only matches rows with enough stock"""
+    ids = sorted(quantities)
+    enough = Q()
+    for pk in ids:
+        enough |= Q(pk=pk, stock_quantity__gte=quantities[pk])
+    updated = model.objects.filter(enough).update(
+        stock_quantity=Case(
+            *[When(pk=pk, then=F('stock_quantity') - quantities[pk]) for pk in ids],
+            output_field=models.PositiveIntegerField(),
+        ),
+        updated_at=timezone.now(),
+    )
+    if updated != len(ids):
+        # Someone got there first; report the first short row and roll back
+        for row in model.objects.filter(pk__in=ids).order_by('pk'):
+            if row.stock_quantity < quantities[row.pk]:
+                raise InsufficientStock(row, row.stock_quantity)
+        raise CheckoutError('An item in your cart is no longer available.')
+
+
+def return_stock(model, quantities):
+    """Increment stock for {pk: quantity} in one UPDATE"""
+    ids = sorted(quantities)
+    model.objects.filter(pk__in=ids).update(
+        stock_quantity=Case(
+            *[When(pk=pk, then=F('stock_quantity') + quantities[pk]) for pk in ids],
+            output_field=models.PositiveIntegerField(),
+        ),
+        updated_at=timezone.now(),
+    )
+
+
+def stock_changed():
+    """Retire catalog caches after a bulk stock change commits"""
+    transaction.on_commit(catalog.bump_version)
+    transaction.on_commit(homepage.invalidate)
+
+
+def _line(item):
+    """Return (field, product id) for a cart line, or None if it points at nothing"""
+    if item.card_id:
+        return 'card', item.card_id
+    if item.other_product_id:
+        return 'other_product', item.other_product_id
+    return None
+
+
+def _available(product, held):
+    # Hidden accessories can no longer be bought, even if they are still in a cart
+    if not getattr(product, 'is_active', True):
+        return 0
+    return max(product.stock_quantity - held.get(product.pk, 0), 0)
+
+
+def _cart_lines(user):
+    """Return (cart_items, [(item, (field, pk))], {field: {pk: quantity}}) for the user's cart"""
+    cart_items = list(CartItem.objects.filter(user=user).order_by('pk'))
+    lines = [(item, _line(item)) for item in cart_items]
+    lines = [(item, key) for item, key in lines if key]
+    if not lines:
+        raise EmptyCart('Your cart is empty.')
+    quantities = {field: defaultdict(int) for field, _ in PRODUCT_FIELDS}
+    for item, (field, pk) in lines:
+        quantities[field][pk] += item.quantity
+    return cart_items, lines, quantities
+
+
+def _lock_and_check(user, quantities):
+    """Lock the wanted products and check them against stock not held by others; return {field: {pk: product}}"""
+    products = {}
+    for field, model in PRODUCT_FIELDS:
+        wanted = quantities[field]
+        products[field] = lock(model, wanted) if wanted else {}
+        held = reservations.held(field, list(wanted), exclude_user=user) if wanted else {}
+        for pk, quantity in wanted.items():
+            product = products[field][pk]
+            if _available(product, held) < quantity:
+                raise InsufficientStock(product, _available(product, held))
+    return products
+
+
+def reserve_cart(user):
+    """Hold the user's cart while they check out; return when the hold expires.
+
+    Raises EmptyCart or InsufficientStock, leaving any earlier holds in place.
+    """
+    with transaction.atomic():
+        _, _, quantities = _cart_lines(user)
+        _lock_and_check(user, quantities)
+        return reservations.replace(user, quantities)
+
+
+def new_key():
+    return uuid.uuid4().hex
+
+
+def _keyed_order(user, key):
+    claim = CheckoutKey.objects.filter(user=user, key=key, order__isnull=False).select_related('order').first()
+    if claim is None:
+        return None
+    claim.order.replayed = True
+    return claim.order
+
+
+def place_order(user, shipping, key=None):
+    """Create a paid, confirmed order from the user's cart and empty the cart.
+
+    `shipping` holds the Order shipping/payment fields from the checkout form. With an
+    idempotency `key`, a repeated call returns the first order (with order.replayed set)
+    without touching the cart or stock again.
+    Raises EmptyCart or InsufficientStock; nothing is written in that case.
+    """
+    if key:
+        order = _keyed_order(user, key)
+        if order is not None:
+            return order
+    try:
+        order = _place_order(user, shipping, key)
+    except IntegrityError:
+        # A concurrent submit with the same key committed first
+        order = _keyed_order(user, key) if key else None
+        if order is None:
+            raise
+        return order
+    order.replayed = False
+    return order
+
+
+def _place_order(user, shipping, key):
+    with transaction.atomic():
+        # Claim the key before anything else; a duplicate blocks here on the unique index
+        claim = CheckoutKey.objects.create(user=user, key=key) if key else None
+        cart_items, lines, quantities = _cart_lines(user)
+        products = _lock_and_check(user, quantities)
+
+        # Price from the locked rows, not from a read taken before the lock
+        priced = [(item, field, products[field][pk]) for item, (field, pk) in lines]
+        subtotal = sum((product.price * item.quantity for item, _, product in priced), Decimal('0'))
+        tax, shipping_cost, total = totals(subtotal)
+        # Last lock taken: the counter row stays locked until commit, and a failure from
+        # here on rolls the number back with everything else
+        order = Order.objects.create(
+            user=user,
+            order_number=order_numbers.allocate(),
+            status='confirmed',
+            payment_status='paid',
+            subtotal=subtotal,
+            tax=tax,
+            shipping_cost=shipping_cost,
+            total_amount=total,
+            # bulk_create below skips the OrderItem signals, so set the counts here
+            item_count=sum(item.quantity for item, _, _ in priced),
+            line_count=len(priced),
+            **shipping,
+        )
+        OrderItem.objects.bulk_create([
+            OrderItem(
+                order=order,
+                **{field: product},
+                product_name=product.name,
+                product_sku=getattr(product, 'sku', ''),  # Cards don't have SKU
+                quantity=item.quantity,
+                price=product.price,
+                subtotal=product.price * item.quantity,
+            )
+            for item, field, product in priced
+        ])
+        for field, model in PRODUCT_FIELDS:
+            if quantities[field]:
+                take_stock(model, quantities[field])
+        stock_ledger.record([
+            stock_ledger.movement(field, pk, -quantity, 'sale', order=order, user=user)
+            for field, wanted in quantities.items()
+            for pk, quantity in wanted.items()
+        ])
+        CartItem.objects.filter(pk__in=[item.pk for item in cart_items]).delete()
+        reservations.release(user)
+        if claim is not None:
+            claim.order = order
+            claim.save(update_fields=['order'])
+        stock_changed()
+    return order
+
+
+def cancel_orders(orders, user=None):
+    """Cancel the still-cancellable orders in a queryset and restock their items.
+
+    `user` is who cancelled (recorded in the stock ledger). Returns the list of orders that were cancelled; orders already shipped, delivered or
+    cancelled are left alone.
+    """
+    with transaction.atomic():
+        # Locking the orders makes a concurrent cancel of the same order wait and then skip it
+        # (re-filtered by pk, since FOR UPDATE is not allowed on a DISTINCT admin changelist query)
+        cancelled = list(
+            Order.objects.select_for_update()
+            .filter(pk__in=orders.values('pk'), status__in=CANCELLABLE_STATUSES)
+            .order_by('pk')
+        )
+        if not cancelled:
+            return []
+        by_id = {order.pk: order for order in cancelled}
+        ids = list(by_id)
+
+        quantities = {field: defaultdict(int) for field, _ in PRODUCT_FIELDS}
+        returned = defaultdict(int)  # (order id, field, product id) -> quantity, for the ledger
+        for order_id, card_id, product_id, quantity in OrderItem.objects.filter(order_id__in=ids).values_list(
+                'order_id', 'card_id', 'other_product_id', 'quantity'):
+            # Lines whose product was deleted (FK set to NULL) have nothing to restock
+            if card_id:
+                quantities['card'][card_id] += quantity
+                returned[(order_id, 'card', card_id)] += quantity
+            elif product_id:
+                quantities['other_product'][product_id] += quantity
+                returned[(order_id, 'other_product', product_id)] += quantity
+        for field, model in PRODUCT_FIELDS:
+            if quantities[field]:
+                # Same lock order as place_order, so a cancel and a checkout cannot deadlock
+                lock(model, quantities[field])
+                return_stock(model, quantities[field])
+        stock_ledger.record([
+            stock_ledger.movement(field, pk, quantity, 'cancellation', order=by_id[order_id], user=user)
+            for (order_id, field, pk), quantity in returned.items()
+        ])
+
+        Order.objects.filter(pk__in=ids).update(status='cancelled', updated_at=timezone.now())
+        for order in cancelled:
+            order.status = 'cancelled'
+        stock_changed()
+    return cancelled
@@ -0,0 +1,72 @@
+"""
+ETag functions for conditional GETs on catalog pages.
+
+Used with django.views.decorators.http.condition, so a matching If-None-Match gets a
+304 before the view body runs. Pages also show per-visitor content (navbar cart badge,
+login state), so every ETag includes the visitor and the settings version. There are no
+Last-Modified functions: a row timestamp cannot express the visitor, and a client that
+only sends If-Modified-Since would get a 304 after logging in or filling its cart.
+Requests with pending flash messages are never answered with a 304, because the
+messages would not be shown.
+"""
+import hashlib
+
+from django.contrib.messages import get_messages
+
+from . import catalog, settings_cache
+from .models import Card, OtherProduct, ShippingSettings
+from .navbar_data import get_cart_count
+
+
+def _skip(request):
+    return bool(len(get_messages(request)))
+
+
+def _viewer(request):
+    user = getattr(request, 'user', None)
+    if user is not None and user.is_authenticated:
+        return f'{user.pk}:{get_cart_count(user)}'
+    return 'anon'
+
+
+def make_etag(request, *parts):
+    raw = ':'.join(str(part) for part in (*parts, settings_cache.get_version(), _viewer(request)))
+    return hashlib.md5(raw.encode()).hexdigest()
+
+
+def _updated_at(model, pk, **filters):
+    return model.objects.filter(pk=pk, **filters).values_list('updated_at', flat=True).first()
+
+
+# card_detail: the card row plus the catalog version (related cards)
+
+def card_detail_etag(request, pk):
+    updated_at = _updated_at(Card, pk)
+    if updated_at is None or _skip(request):
+        return None
+    return make_etag(request, 'card', pk, updated_at.timestamp(), catalog.get_version())
+
+
+# other_products_detail
+
+def product_detail_etag(request, pk):
+    updated_at = _updated_at(OtherProduct, pk, is_active=True)
+    if updated_at is None or _skip(request):
+        return None
+    return make_etag(request, 'product', pk, updated_at.timestamp(), catalog.get_version())
+
+
+# card_list: any catalog change may alter any listing, so only the version is used
+
+def card_list_etag(request):
+    if _skip(request):
+        return None
+    return make_etag(request, 'card_list', request.GET.urlencode(), catalog.get_version())
+
+
+# shipping_info: served from the cached ShippingSettings row, so no query at all
+
+def shipping_info_etag(request):
+    if _skip(request):
+        return None
+    return make_etag(request, 'shipping', ShippingSettings.get_settings().updated_at.timestamp())
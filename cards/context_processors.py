@@ -1,21 +1,45 @@
-from .models import CardSet, OtherProduct, CartItem
-from django.db.models import Sum
+from django.utils.functional import SimpleLazyObject
+
+from .models import OtherProduct
+from .navbar_data import get_card_sets, get_cart_count
+
+
+class ContextUsage:
+    """Per-request record of which lazy context values were provided and resolved"""
+
+    def __init__(self):
+        self.provided = []
+        self.resolved = []
+
+
+def lazy_value(request, name, func):
+    """Wrap func so it only runs if a template reads the value, recording the read"""
+    usage = getattr(request, 'context_usage', None)
+    if usage is None:
+        return SimpleLazyObject(func)
+
+    usage.provided.append(name)
+
+    def resolve():
+        usage.resolved.append(name)
+        return func()
+
+    return SimpleLazyObject(resolve)
+
 
 def card_sets_processor(request):
     """
     Context processor to make card sets, product types, and cart count available globally.
+    Values are lazy: nothing is looked up unless the template actually uses it.
     """
-    card_sets = CardSet.objects.all().order_by('-release_date')
-    product_types = OtherProduct.PRODUCT_TYPE_CHOICES
-    
-    cart_count = 0
-    if request.user.is_authenticated:
-        # Calculate total items in cart (sum of quantities)
-        result = CartItem.objects.filter(user=request.user).aggregate(total=Sum('quantity'))
-        cart_count = result['total'] or 0
+    def cart_count():
+        if request.user.is_authenticated:
+            # Total items in cart (sum of quantities)
+            return get_cart_count(request.user)
+        return 0
     
     return {
-        'all_card_sets': card_sets,
-        'all_product_types': product_types,
-        'cart_count': cart_count,
+        'all_card_sets': lazy_value(request, 'all_card_sets', get_card_sets),
+        'all_product_types': OtherProduct.PRODUCT_TYPE_CHOICES,
+        'cart_count': lazy_value(request, 'cart_count', cart_count),
     }
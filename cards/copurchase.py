@@ -0,0 +1,219 @@
+"""
+Item-to-item co-purchase model built from OrderItem history with sparse matrices.
+
+Cards and other products become the columns of a binary orders x items matrix B, and
+the co-occurrence matrix C = BᵀB counts, for every pair of items, the orders holding
+both. C is saved to disk between runs, so `update` folds in only the orders newer than
+the last one it has seen and rewrites the CoPurchase rows of the items they touched.
+`build` starts over from the full history (run it nightly; it is also what forgets
+orders cancelled after they were counted).
+
+Only this offline job needs NumPy/SciPy. Pages read the CoPurchase table through
+recommendations.py.
+"""
+import os
+from array import array
+from pathlib import Path
+
+import numpy as np
+from django.conf import settings
+from django.db import transaction
+from scipy import sparse
+
+from . import catalog
+from .models import CoPurchase, OrderItem
+
+# Pairs stored per item
+TOP_K = 20
+
+BATCH_SIZE = 5000
+
+# Orders with more distinct items than this are bulk buys, not a signal
+MAX_BASKET = 50
+
+# An item code packs the kind into the low bit: id * 2 + kind index
+KINDS = ('card', 'other_product')
+
+
+def model_path():
+    default = Path(__file__).resolve().parent.parent / 'var' / 'copurchase.npz'
+    return Path(getattr(settings, 'COPURCHASE_MODEL_PATH', default))
+
+
+def decode(code):
+    code = int(code)
+    return KINDS[code & 1], code >> 1
+
+
+def order_lines(after_order_id=0):
+    """Return (order_ids, item_codes) int64 arrays for lines of orders after an id"""
+    orders = array('q')
+    codes = array('q')
+    rows = (
+        OrderItem.objects.filter(order_id__gt=after_order_id)
+        .exclude(order__status='cancelled')
+        .order_by()
+        .values_list('order_id', 'card_id', 'other_product_id')
+        .iterator(chunk_size=BATCH_SIZE)
+    )
+    for order_id, card_id, product_id in rows:
+        if card_id is not None:
+            orders.append(order_id)
+            codes.append(card_id * 2)
+        elif product_id is not None:
+            orders.append(order_id)
+            codes.append(product_id * 2 + 1)
+    return np.frombuffer(orders, dtype=np.int64), np.frombuffer(codes, dtype=np.int64)
+
+
+def basket_matrix(order_ids, columns, n_items):
+    """Binary orders x items CSR matrix, keeping baskets of 2..MAX_BASKET items"""
+    if not len(order_ids):
+        return sparse.csr_matrix((0, n_items), dtype=np.int32)
+    _, rows = np.unique(order_ids, return_inverse=True)
+    baskets = sparse.csr_matrix(
+        (np.ones(len(rows), dtype=np.int32), (rows, columns)),
+        shape=(int(rows.max()) + 1, n_items),
+    )
+    # The same item on two lines of one order counts once
+    baskets.data[:] = 1
+    sizes = np.diff(baskets.indptr)
+    return baskets[(sizes >= 2) & (sizes <= MAX_BASKET)]
+
+
+def cooccurrence(baskets):
+    """Items x items matrix of orders containing both items, zero diagonal"""
+    matrix = (baskets.T @ baskets).tocsr()
+    matrix.setdiag(0)
+    matrix.eliminate_zeros()
+    return matrix
+
+
+class CoPurchaseModel:
+    """Co-occurrence counts plus the column -> item code mapping"""
+
+    def __init__(self, codes=None, matrix=None, last_order_id=0):
+        self.codes = np.empty(0, dtype=np.int64) if codes is None else codes
+        self.matrix = sparse.csr_matrix((len(self.codes),) * 2, dtype=np.int32) if matrix is None else matrix
+        self.last_order_id = last_order_id
+
+    def _grow(self, item_codes):
+        new = np.setdiff1d(np.unique(item_codes), self.codes)
+        if not len(new):
+            return
+        self.codes = np.concatenate([self.codes, new])
+        size = len(self.codes)
+        matrix = self.matrix
+        indptr = np.concatenate([matrix.indptr, np.full(size - matrix.shape[0], matrix.indptr[-1])])
+        self.matrix = sparse.csr_matrix((matrix.data, matrix.indices, indptr), shape=(size, size))
+
+    def add_lines(self, order_ids, item_codes):
+        """Fold order lines into the counts; return the columns whose counts changed"""
+        if not len(order_ids):
+            return np.empty(0, dtype=np.int64)
+        self._grow(item_codes)
+        sorter = np.argsort(self.codes)
+        columns = sorter[np.searchsorted(self.codes, item_codes, sorter=sorter)]
+        baskets = basket_matrix(order_ids, columns, len(self.codes))
+        self.matrix = (self.matrix + cooccurrence(baskets)).tocsr()
+        self.last_order_id = max(self.last_order_id, int(order_ids.max()))
+        return np.unique(baskets.indices)
+
+    def top_pairs(self, columns, k=TOP_K):
+        """Yield (column, other_columns, counts) for each column, most frequent first"""
+        matrix = self.matrix
+        for column in columns:
+            start, end = matrix.indptr[column], matrix.indptr[column + 1]
+            if start == end:
+                continue
+            counts = matrix.data[start:end]
+            others = matrix.indices[start:end]
+            if len(counts) > k:
+                best = np.argpartition(-counts, k)[:k]
+                counts, others = counts[best], others[best]
+            # Ties break on item code: columns are numbered differently by build() and update()
+            order = np.lexsort((self.codes[others], -counts))
+            yield column, others[order], counts[order]
+
+    def save(self, path):
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        partial = path.with_name(path.stem + '.partial.npz')
+        np.savez_compressed(
+            partial,
+            codes=self.codes,
+            data=self.matrix.data,
+            indices=self.matrix.indices,
+            indptr=self.matrix.indptr,
+            last_order_id=np.int64(self.last_order_id),
+        )
+        os.replace(partial, path)
+
+    @classmethod
+    def load(cls, path):
+        if not Path(path).exists():
+            return None
+        with np.load(path) as saved:
+            size = len(saved['codes'])
+            matrix = sparse.csr_matrix(
+                (saved['data'], saved['indices'], saved['indptr']), shape=(size, size)
+            )
+            return cls(saved['codes'], matrix, int(saved['last_order_id']))
+
+
+def store(model, columns, replace_all=False):
+    """Rewrite the CoPurchase rows for the items at `columns`"""
+    codes = model.codes
+    with transaction.atomic():
+        if replace_all:
+            CoPurchase.objects.all().delete()
+        else:
+            for kind_index, kind in enumerate(KINDS):
+                ids = [int(codes[column]) >> 1 for column in columns if codes[column] & 1 == kind_index]
+                for start in range(0, len(ids), 900):
+                    CoPurchase.objects.filter(item_kind=kind, item_id__in=ids[start:start + 900]).delete()
+        batch = []
+        for column, others, counts in model.top_pairs(columns):
+            item_kind, item_id = decode(codes[column])
+            for rank, (other, count) in enumerate(zip(others, counts)):
+                other_kind, other_id = decode(codes[other])
+                batch.append(CoPurchase(
+                    item_kind=item_kind, item_id=item_id,
+                    other_kind=other_kind, other_id=other_id,
+                    orders=int(count), rank=rank,
+                ))
+            if len(batch) >= BATCH_SIZE:
+                CoPurchase.objects.bulk_create(batch)
+                batch = []
+        CoPurchase.objects.bulk_create(batch)
+    # Detail pages embed the recommendations, so their ETags must change
+    catalog.bump_version()
+
+
+def build(path=None):
+    """Recompute the model from the whole order history"""
+    model = CoPurchaseModel()
+    model.add_lines(*order_lines())
+    model.save(path or model_path())
+    store(model, range(len(model.codes)), replace_all=True)
+    return model
+
+
+def update(path=None):
+    """Fold in orders placed since the last run; builds from scratch if no model is saved.
+
+    Orders are picked up by id, so an order committed after a newer one was already
+    counted is only seen by the next build().
+    """
+    path = path or model_path()
+    model = CoPurchaseModel.load(path)
+    if model is None:
+        return build(path)
+    order_ids, item_codes = order_lines(model.last_order_id)
+    if not len(order_ids):
+        return model
+    touched = model.add_lines(order_ids, item_codes)
+    model.save(path)
+    if len(touched):
+        store(model, touched)
+    return model
@@ -0,0 +1,89 @@
+"""
+Cached row counts for paginated listings.
+
+Paginator asks for an exact COUNT(*) on every request, even when the page only shows
+"page 1 of many". CachedCountPaginator gets its count from get_count(), which caches the
+exact count per normalized query for a short time and, on PostgreSQL, uses the planner's
+row estimate for large unfiltered tables instead of scanning them.
+"""
+import hashlib
+
+from django.core.cache import cache
+from django.core.paginator import Paginator
+from django.db import connections
+from django.utils.functional import cached_property
+
+from . import catalog
+from .models import Card, CardSet, OtherProduct
+
+COUNT_TIMEOUT = 60
+
+# Unfiltered PostgreSQL tables with at least this many rows use the planner estimate
+ESTIMATE_THRESHOLD = 100000
+
+# Counts over these models also key on the catalog version, so edits show up at once
+CATALOG_MODELS = (Card, CardSet, OtherProduct)
+
+
+def count_key(queryset):
+    """Cache key for the count of a queryset; ordering does not change it"""
+    sql, params = queryset.order_by().query.sql_with_params()
+    raw = f'{queryset.db}|{sql}|{params!r}'
+    if issubclass(queryset.model, CATALOG_MODELS):
+        raw = f'{catalog.get_version()}|{raw}'
+    return f'cards:count:{hashlib.md5(raw.encode()).hexdigest()}'
+
+
+def estimated_count(queryset):
+    """Planner row estimate for a large unfiltered PostgreSQL table, or None"""
+    query = queryset.query
+    connection = connections[queryset.db]
+    if connection.vendor != 'postgresql' or query.where or query.distinct or query.is_sliced:
+        return None
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT reltuples FROM pg_class WHERE oid = %s::regclass',
+            [queryset.model._meta.db_table],
+        )
+        row = cursor.fetchone()
+    # reltuples is -1 (or 0) until the table has been analyzed
+    if row is None or row[0] < ESTIMATE_THRESHOLD:
+        return None
+    return int(row[0])
+
+
+def get_count(queryset):
+    """Return the (possibly approximate) number of rows in a queryset"""
+    if queryset.query.is_empty():
+        return 0
+    key = count_key(queryset)
+    count = cache.get(key)
+    if count is None:
+        count = estimated_count(queryset)
+        if count is None:
+            count = queryset.count()
+        cache.set(key, count, COUNT_TIMEOUT)
+    return count
+
+
+def bounded_count(queryset, limit):
+    """Count rows up to limit + 1; a count within the limit is exact and gets cached"""
+    if queryset.query.is_empty():
+        return 0
+    key = count_key(queryset)
+    count = cache.get(key)
+    if count is None:
+        count = queryset.order_by()[:limit + 1].count()
+        if count <= limit:
+            cache.set(key, count, COUNT_TIMEOUT)
+    return count
+
+
+class CachedCountPaginator(Paginator):
+    """Paginator whose count comes from get_count()"""
+
+    @cached_property
+    def count(self):
+        if not hasattr(self.object_list, 'query'):
+            return super().count
+        return get_count(self.object_list)
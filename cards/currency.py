@@ -0,0 +1,90 @@
+"""
+Precompiled currency formatters used by the format_currency filter.
+
+A formatter is built once per currency code and works on Decimal directly, so large
+VND amounts never lose precision through a float conversion. That is the reason for
+them: formatting itself is no faster than the old float if/elif chain (both take the
+same time per 1,000 prices, see manage.py benchmark_price_format). The active formatter is
+re-resolved only when the cached SiteSettings row changes (see settings_cache).
+"""
+from decimal import Decimal
+
+from .models import SiteSettings
+
+# code: (symbol, decimal places, format pattern)
+CURRENCY_FORMATS = {
+    'VND': ('₫', 0, '{:,}₫'),
+    'USD': ('$', 2, '${:,.2f}'),
+    'EUR': ('€', 2, '€{:,.2f}'),
+    'GBP': ('£', 2, '£{:,.2f}'),
+    'JPY': ('¥', 0, '¥{:,}'),
+}
+DEFAULT_FORMAT = ('$', 2, '{:,.2f}')
+
+_registry = {}
+_active = {'settings': None, 'formatter': None}
+
+
+def _to_decimal(value):
+    if isinstance(value, Decimal):
+        return value
+    if isinstance(value, float):
+        return Decimal(repr(value))
+    return Decimal(value)
+
+
+def _build_formatter(code):
+    symbol, places, pattern = CURRENCY_FORMATS.get(code, DEFAULT_FORMAT)
+    render = pattern.format
+
+    if places == 0:
+        # Currencies without minor units drop the fraction, as the old filter did
+        def formatter(value):
+            return render(int(_to_decimal(value)))
+    else:
+        def formatter(value):
+            return render(_to_decimal(value))
+
+    formatter.code = code
+    formatter.symbol = symbol
+    return formatter
+
+
+def get_formatter(code):
+    """Return the formatter for a currency code, building it on first use"""
+    formatter = _registry.get(code)
+    if formatter is None:
+        formatter = _registry[code] = _build_formatter(code)
+    return formatter
+
+
+def get_active_formatter():
+    """Return the formatter for the site currency.
+
+    SiteSettings.get_settings() hands back the same cached instance until the settings
+    version changes, so an identity check is enough to know when to re-resolve.
+    """
+    settings = SiteSettings.get_settings()
+    if _active['settings'] is not settings:
+        _active['formatter'] = get_formatter(settings.currency)
+        _active['settings'] = settings
+    return _active['formatter']
+
+
+def format_amount(value):
+    """Format a single amount in the site currency"""
+    return get_active_formatter()(value)
+
+
+def attach_price_display(objects, field='price', attr='price_display'):
+    """Set a preformatted price string on every object of a result page.
+
+    Templates such as includes/card_grid.html print `price_display` when it is present
+    instead of running the format_currency filter per item. It saves little: the two
+    card_grid renders in benchmark_price_format are within run-to-run noise of each
+    other; the cached fragments are what make a grid cheap.
+    """
+    formatter = get_active_formatter()
+    for obj in objects:
+        setattr(obj, attr, formatter(getattr(obj, field)))
+    return objects
@@ -0,0 +1,159 @@
+"""
+Facet counts for the card_list filters (card type, rarity, card set, price bucket).
+
+All counts come from one grouped query over the cards that match the search text and
+price range. The grouped rows are cached per normalized (search, price range) key and
+catalog version, so switching type/rarity/set filters, and the unfiltered landing page,
+are served without touching the database.
+"""
+import hashlib
+from decimal import Decimal
+
+from django.core.cache import cache
+from django.db.models import Case, Count, IntegerField, Value, When
+
+from . import catalog
+from .currency import get_active_formatter
+from .models import Card
+from .navbar_data import get_card_sets
+from .pagination import CURSOR_PARAM
+from .search import tokenize
+
+FACETS_TIMEOUT = 60 * 10
+
+# Lower bound of each price bucket per shop currency (SiteSettings.currency); each
+# bucket runs up to the next bound and the last one is open-ended. Buckets are
+# half-open, [min, max): a price on a bound counts towards the upper bucket. The
+# min_price/max_price filters are inclusive, so a bucket links to max - PRICE_STEP.
+PRICE_BOUNDS = {
+    'VND': (0, 50000, 100000, 200000, 500000, 1000000),
+    'USD': (0, 2, 5, 10, 25, 50),
+    'EUR': (0, 2, 5, 10, 25, 50),
+    'GBP': (0, 2, 5, 10, 25, 50),
+    'JPY': (0, 300, 600, 1200, 3000, 6000),
+}
+DEFAULT_PRICE_BOUNDS = PRICE_BOUNDS['USD']
+
+# Smallest price difference Card.price can store
+PRICE_STEP = Decimal(1).scaleb(-Card._meta.get_field('price').decimal_places)
+
+# Position of each facet in a grouped row
+TYPE, RARITY, CARD_SET, PRICE = range(4)
+
+
+def price_buckets(currency):
+    """Return [(min, max), ...] for a currency code; max is None for the last bucket"""
+    bounds = PRICE_BOUNDS.get(currency, DEFAULT_PRICE_BOUNDS)
+    return list(zip(bounds, bounds[1:] + (None,)))
+
+
+def filter_key(query, min_price, max_price):
+    """Normalize the non-facet filters into a short cache key"""
+    raw = '|'.join([' '.join(tokenize(query)), str(min_price or ''), str(max_price or '')])
+    return hashlib.md5(raw.encode()).hexdigest()
+
+
+def _price_bucket(buckets):
+    whens = [
+        When(price__lt=upper, then=Value(position))
+        for position, (lower, upper) in enumerate(buckets) if upper is not None
+    ]
+    return Case(*whens, default=Value(len(buckets) - 1), output_field=IntegerField())
+
+
+def grouped_counts(queryset, key, currency):
+    """Return [(card_type, rarity, card_set_id, price_bucket, count), ...] for a queryset"""
+    # Bucket positions depend on the currency's bounds
+    cache_key = f'cards:facets:{catalog.get_version()}:{currency}:{key}'
+    rows = cache.get(cache_key)
+    if rows is None:
+        rows = list(
+            queryset.order_by()
+            .annotate(price_bucket=_price_bucket(price_buckets(currency)))
+            .values_list('card_type', 'rarity', 'card_set_id', 'price_bucket')
+            .annotate(count=Count('id'))
+        )
+        cache.set(cache_key, rows, FACETS_TIMEOUT)
+    return rows
+
+
+def _toggle_url(params, name, value, selected):
+    params = params.copy()
+    params.pop('page', None)
+    params.pop(CURSOR_PARAM, None)
+    if selected:
+        params.pop(name, None)
+    else:
+        params[name] = value
+    return f'?{params.urlencode()}'
+
+
+def card_facets(queryset, params, key, selected_type='', selected_rarity='', selected_set=None):
+    """Build the facet lists for card_list.
+
+    `queryset` must carry only the non-facet filters (stock, search, price range).
+    Each facet's counts apply the other facets' selections but not its own, so every
+    option shows how many cards selecting it would give.
+    """
+    formatter = get_active_formatter()
+    rows = grouped_counts(queryset, key, formatter.code)
+    selections = {TYPE: selected_type or None, RARITY: selected_rarity or None, CARD_SET: selected_set}
+
+    def counts_for(position):
+        counts = {}
+        for row in rows:
+            if all(value is None or row[other] == value
+                   for other, value in selections.items() if other != position):
+                counts[row[position]] = counts.get(row[position], 0) + row[-1]
+        return counts
+
+    type_counts = counts_for(TYPE)
+    rarity_counts = counts_for(RARITY)
+    set_counts = counts_for(CARD_SET)
+    price_counts = counts_for(PRICE)
+
+    facets = {
+        'card_type': [
+            {
+                'value': value, 'label': label, 'count': type_counts.get(value, 0),
+                'selected': value == selected_type,
+                'url': _toggle_url(params, 'type', value, value == selected_type),
+            }
+            for value, label in Card.CARD_TYPE_CHOICES
+        ],
+        'rarity': [
+            {
+                'value': value, 'label': label, 'count': rarity_counts.get(value, 0),
+                'selected': value == selected_rarity,
+                'url': _toggle_url(params, 'rarity', value, value == selected_rarity),
+            }
+            for value, label in Card.RARITY_CHOICES
+        ],
+        'card_set': [
+            {
+                'value': card_set.id, 'label': card_set.name, 'count': set_counts.get(card_set.id, 0),
+                'selected': card_set.id == selected_set,
+                'url': _toggle_url(params, 'set', str(card_set.id), card_set.id == selected_set),
+            }
+            for card_set in get_card_sets()
+            if set_counts.get(card_set.id) or card_set.id == selected_set
+        ],
+        'price': [],
+    }
+
+    for position, (lower, upper) in enumerate(price_buckets(formatter.code)):
+        bucket_params = params.copy()
+        bucket_params.pop('page', None)
+        bucket_params.pop(CURSOR_PARAM, None)
+        bucket_params['min_price'] = lower
+        if upper is None:
+            bucket_params.pop('max_price', None)
+            label = f'{formatter(lower)}+'
+        else:
+            bucket_params['max_price'] = upper - PRICE_STEP
+            label = f'{formatter(lower)} - {formatter(upper)}'
+        facets['price'].append({
+            'value': position, 'label': label, 'count': price_counts.get(position, 0),
+            'url': f'?{bucket_params.urlencode()}',
+        })
+    return facets
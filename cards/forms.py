@@ -172,8 +172,9 @@ class BulkCardUploadForm(forms.Form):
         if csv_file:
             if not csv_file.name.endswith('.csv'):
                 raise ValidationError('File must be a CSV file.')
-            if csv_file.size > 5 * 1024 * 1024:  # 5MB limit
-                raise ValidationError('File size must be less than 5MB.')
+            # The importer streams the file, so the limit only bounds upload time
+            if csv_file.size > 50 * 1024 * 1024:  # 50MB limit (about 500k rows)
+                raise ValidationError('File size must be less than 50MB.')
         return csv_file
     
 
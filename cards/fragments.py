@@ -0,0 +1,52 @@
+"""
+Per-card rendered fragment cache for card grids.
+
+Each card of includes/card_grid.html is rendered from includes/card_grid_item.html once
+and cached. The key holds everything the markup depends on: the card's pk and
+updated_at, its price and stock (so bulk .update() calls that skip updated_at still
+miss), the site currency and whether the visitor is logged in. A grid fetches all of its
+fragments with one get_many and renders only the misses.
+"""
+from django.core.cache import cache
+from django.template.loader import get_template
+from django.utils.safestring import mark_safe
+
+from .currency import get_active_formatter
+
+ITEM_TEMPLATE = 'includes/card_grid_item.html'
+FRAGMENT_TIMEOUT = 60 * 60 * 24
+
+
+def fragment_key(card, authenticated, currency):
+    return (
+        f'cards:fragment:card:{card.pk}:{card.updated_at.timestamp()}:'
+        f'{card.price}:{card.stock_quantity}:{currency}:{int(authenticated)}'
+    )
+
+
+def render_card_grid(cards, user=None):
+    """Return the concatenated item markup for `cards`"""
+    template = get_template(ITEM_TEMPLATE)
+    authenticated = bool(user is not None and user.is_authenticated)
+    currency = get_active_formatter().code
+    cards = list(cards)
+
+    # Unsaved cards (no updated_at) are rendered but never cached
+    keys = [
+        fragment_key(card, authenticated, currency) if card.updated_at else None
+        for card in cards
+    ]
+    cached = cache.get_many([key for key in keys if key])
+
+    parts = []
+    missing = {}
+    for card, key in zip(cards, keys):
+        html = cached.get(key) if key else None
+        if html is None:
+            html = template.render({'card': card, 'user': user})
+            if key:
+                missing[key] = html
+        parts.append(html)
+    if missing:
+        cache.set_many(missing, FRAGMENT_TIMEOUT)
+    return mark_safe(''.join(parts))
@@ -0,0 +1,56 @@
+"""
+Precomputed homepage snapshot.
+
+Everything views.home shows (hero slides, featured and new cards, accessories, new sets
+and the stock counts) is built once into a single cached dict. The view serves it with
+one cache read. The snapshot is dropped when a card, product, set, slide or the site
+settings change (see signals.py), and it also expires after SNAPSHOT_TIMEOUT, so the
+counts never drift for long.
+"""
+from django.core.cache import cache
+from django.db.models import Count
+from django.utils import timezone
+
+from .currency import attach_price_display
+from .models import Card, CardSet, HeroSlider, OtherProduct
+
+SNAPSHOT_KEY = 'cards:home:snapshot'
+SNAPSHOT_TIMEOUT = 60 * 5
+
+
+def build_snapshot():
+    """Run the homepage queries and return the template context"""
+    in_stock = Card.objects.filter(stock_quantity__gt=0).select_related('card_set')
+    accessories = OtherProduct.objects.filter(stock_quantity__gt=0, is_active=True)
+    snapshot = {
+        'featured_cards': list(in_stock[:8]),
+        'hero_slides': list(HeroSlider.objects.filter(is_active=True).order_by('order')[:10]),
+        'featured_accessories': list(accessories.order_by('-created_at')[:4]),
+        'new_arrivals': list(in_stock.order_by('-created_at')[:8]),
+        'new_card_sets': list(
+            CardSet.objects.annotate(card_count=Count('card')).order_by('-release_date')[:8]
+        ),
+        'total_cards_available': in_stock.count(),
+        'total_accessories': accessories.count(),
+        'snapshot_built_at': timezone.now(),
+    }
+    for key in ('featured_cards', 'featured_accessories', 'new_arrivals'):
+        attach_price_display(snapshot[key])
+    return snapshot
+
+
+def get_snapshot():
+    snapshot = cache.get(SNAPSHOT_KEY)
+    if snapshot is None:
+        snapshot = rebuild()
+    return snapshot
+
+
+def rebuild():
+    snapshot = build_snapshot()
+    cache.set(SNAPSHOT_KEY, snapshot, SNAPSHOT_TIMEOUT)
+    return snapshot
+
+
+def invalidate():
+    cache.delete(SNAPSHOT_KEY)
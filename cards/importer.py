@@ -0,0 +1,248 @@
+"""
+Streaming CSV import of cards (the warehouse bulk upload form and manage.py import_cards).
+
+Rows are read one at a time and written in batches. Each batch is matched against the
+existing cards with one query and written with one bulk_create upsert (INSERT ... ON
+CONFLICT DO UPDATE) in its own transaction. A card is identified by its set, name,
+rarity and condition, which the database enforces (card_identity_unique) and the
+upsert conflicts on; a row for a card that already exists overwrites its description,
+type, price, stock and monster stats, so importing a file twice is harmless. Only the
+current batch and the first MAX_REPORTED_ERRORS errors are kept in memory, however
+long the file is.
+
+bulk_create skips the model signals, so each batch does their work itself: search
+entries, the autocomplete index, the catalog and homepage caches, and an 'import'
+movement in the stock ledger for every stock change.
+"""
+import csv
+import io
+from decimal import Decimal, InvalidOperation
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from . import autocomplete, checkout, search, stock_ledger
+from .models import Card, CardSet
+
+REQUIRED_COLUMNS = ('name', 'card_type', 'rarity', 'card_set_code', 'condition', 'price', 'stock_quantity')
+
+# Default rows per bulk_create (setting CARD_IMPORT_BATCH_SIZE)
+BATCH_SIZE = 1000
+
+# Row errors kept for the report; later ones are only counted
+MAX_REPORTED_ERRORS = 200
+
+CARD_TYPES = {value for value, _ in Card.CARD_TYPE_CHOICES}
+RARITIES = {value for value, _ in Card.RARITY_CHOICES}
+CONDITIONS = {value for value, _ in Card.CONDITION_CHOICES}
+
+# The card key; matches the card_identity_unique constraint
+UNIQUE_FIELDS = ['card_set', 'name', 'rarity', 'condition']
+
+# Written to cards that already exist
+UPDATE_FIELDS = ['description', 'card_type', 'price', 'stock_quantity', 'attack', 'defense', 'level', 'updated_at']
+
+MAX_PRICE = Decimal('99999999.99')
+NAME_LENGTH = Card._meta.get_field('name').max_length
+
+
+class CSVFormatError(ValueError):
+    """The file cannot be imported at all (e.g. required columns are missing)"""
+
+
+class RowError(ValueError):
+    pass
+
+
+class ImportResult:
+    def __init__(self):
+        self.rows = 0
+        self.created = 0
+        self.updated = 0
+        self.failed = 0
+        self.errors = []  # (line number, message)
+
+    def add_error(self, line, message):
+        self.failed += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append((line, message))
+
+
+def batch_size():
+    return getattr(settings, 'CARD_IMPORT_BATCH_SIZE', BATCH_SIZE)
+
+
+def text_stream(uploaded_file):
+    """Read an uploaded file as text without loading it into memory"""
+    uploaded_file.seek(0)
+    return io.TextIOWrapper(uploaded_file.file, encoding='utf-8-sig', newline='')
+
+
+# Row validation
+
+def _text(row, column):
+    return (row.get(column) or '').strip()
+
+
+def _choice(row, column, choices):
+    value = _text(row, column).lower()
+    if not value:
+        raise RowError(f'{column} is required')
+    if value not in choices:
+        raise RowError(f'Invalid {column} "{value}"')
+    return value
+
+
+def _integer(row, column, minimum=0, maximum=None, required=True):
+    value = _text(row, column)
+    if not value:
+        if required:
+            raise RowError(f'{column} is required')
+        return None
+    try:
+        number = int(value)
+    except ValueError:
+        raise RowError(f'Invalid {column} "{value}"')
+    if number < minimum or (maximum is not None and number > maximum):
+        limit = f'between {minimum} and {maximum}' if maximum is not None else f'at least {minimum}'
+        raise RowError(f'{column} must be {limit}')
+    return number
+
+
+def _price(row):
+    value = _text(row, 'price')
+    if not value:
+        raise RowError('price is required')
+    try:
+        price = Decimal(value)
+    except InvalidOperation:
+        raise RowError(f'Invalid price "{value}"')
+    if not price.is_finite() or price < 0 or price > MAX_PRICE:
+        raise RowError(f'price must be between 0 and {MAX_PRICE}')
+    if price.as_tuple().exponent < -2:
+        raise RowError('price can have at most 2 decimal places')
+    return price
+
+
+def parse_row(row, card_sets):
+    """Return (key, card set, field values) for one CSV row, or raise RowError"""
+    name = _text(row, 'name')
+    if not name:
+        raise RowError('name is required')
+    if len(name) > NAME_LENGTH:
+        raise RowError(f'name is longer than {NAME_LENGTH} characters')
+    code = _text(row, 'card_set_code').upper()
+    card_set = card_sets.get(code)
+    if card_set is None:
+        raise RowError(f'Unknown card_set_code "{code}"' if code else 'card_set_code is required')
+    card_type = _choice(row, 'card_type', CARD_TYPES)
+    rarity = _choice(row, 'rarity', RARITIES)
+    condition = _choice(row, 'condition', CONDITIONS)
+    values = {
+        'description': _text(row, 'description'),
+        'card_type': card_type,
+        'price': _price(row),
+        'stock_quantity': _integer(row, 'stock_quantity'),
+        'attack': None,
+        'defense': None,
+        'level': None,
+    }
+    if card_type == 'monster':
+        values['attack'] = _integer(row, 'attack', required=False)
+        values['defense'] = _integer(row, 'defense', required=False)
+        values['level'] = _integer(row, 'level', minimum=1, maximum=12, required=False)
+    return (card_set.pk, name, rarity, condition), card_set, values
+
+
+# Writing
+
+def _write_batch(batch, result, user):
+    """Upsert one batch: {key: (card set, values)}, the last row for a card winning"""
+    with transaction.atomic():
+        # Concurrent imports into the same sets take turns, so a card missing from the
+        # lookup below is not inserted by another import before this batch writes it
+        list(CardSet.objects.select_for_update().filter(pk__in={key[0] for key in batch}).order_by('pk'))
+        existing = {}
+        matches = (
+            Card.objects.select_for_update()
+            .filter(card_set_id__in={key[0] for key in batch}, name__in={key[1] for key in batch})
+            .order_by('pk')
+        )
+        for card in matches:
+            existing[(card.card_set_id, card.name, card.rarity, card.condition)] = card
+
+        now = timezone.now()
+        new_cards, old_cards, movements = [], [], []
+        for key, (card_set, values) in batch.items():
+            card = existing.get(key)
+            if card is None:
+                new_cards.append(Card(
+                    card_set=card_set, name=key[1], rarity=key[2], condition=key[3],
+                    set_release_date=card_set.release_date, **values,
+                ))
+                continue
+            before = card.stock_quantity
+            for field, value in values.items():
+                setattr(card, field, value)
+            card.updated_at = now
+            card.card_set = card_set  # already loaded; the search document needs its name
+            old_cards.append(card)
+            movements.append(stock_ledger.movement('card', card.pk, card.stock_quantity - before, 'import', user=user))
+
+        # One INSERT ... ON CONFLICT (card_set, name, rarity, condition) DO UPDATE: new cards
+        # are inserted, loaded ones updated in place (bulk_update's CASE per field grows with
+        # the square of the batch). A card added by hand since the lookup is updated too,
+        # rather than duplicated; its ledger row then reads as a full restock.
+        Card.objects.bulk_create(
+            new_cards + old_cards, update_conflicts=True, unique_fields=UNIQUE_FIELDS, update_fields=UPDATE_FIELDS,
+        )
+        movements.extend(
+            stock_ledger.movement('card', card.pk, card.stock_quantity, 'import', user=user)
+            for card in new_cards
+        )
+        stock_ledger.record(movements)
+        search.reindex_cards(new_cards + old_cards)
+        checkout.stock_changed()
+
+    # Names are part of the card key, so only new cards change the autocomplete index
+    autocomplete.cards_changed(new_cards)
+    result.created += len(new_cards)
+    result.updated += len(old_cards)
+
+
+def import_cards(stream, size=None, user=None):
+    """Import cards from a CSV text stream and return an ImportResult.
+
+    Batches are committed as they fill up, so rows before a fatal error (an unreadable
+    line) stay imported; the error is reported on its line. Raises CSVFormatError if
+    the header is missing required columns.
+    """
+    size = size or batch_size()
+    result = ImportResult()
+    reader = csv.DictReader(stream)
+    reader.fieldnames = [column.strip().lower() for column in reader.fieldnames or []]
+    missing = [column for column in REQUIRED_COLUMNS if column not in reader.fieldnames]
+    if missing:
+        raise CSVFormatError(f'Missing columns: {", ".join(missing)}')
+
+    # One query for every set code in the file
+    card_sets = {card_set.code.upper(): card_set for card_set in CardSet.objects.all()}
+    batch = {}
+    try:
+        for row in reader:
+            result.rows += 1
+            try:
+                key, card_set, values = parse_row(row, card_sets)
+            except RowError as e:
+                result.add_error(reader.line_num, str(e))
+                continue
+            batch[key] = (card_set, values)
+            if len(batch) >= size:
+                _write_batch(batch, result, user)
+                batch = {}
+    except (csv.Error, UnicodeDecodeError) as e:
+        result.add_error(reader.line_num + 1, f'Unreadable CSV, import stopped: {e}')
+    if batch:
+        _write_batch(batch, result, user)
+    return result
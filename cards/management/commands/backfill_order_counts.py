@@ -0,0 +1,25 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db.models import Max
+
+from cards.models import Order
+
+
+class Command(BaseCommand):
+    help = 'Recompute Order.item_count and line_count from the order items'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=5000, help='Orders per UPDATE')
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        last_id = Order.objects.aggregate(last=Max('pk'))['last'] or 0
+        batch = options['batch_size']
+        updated = 0
+        # One set-based UPDATE per id range keeps each statement's locks short
+        for start in range(0, last_id, batch):
+            updated += Order.recount_items(Order.objects.filter(pk__gt=start, pk__lte=start + batch))
+        self.stdout.write(self.style.SUCCESS(
+            f'Recounted items on {updated} orders in {time.perf_counter() - started:.1f}s'
+        ))
@@ -0,0 +1,77 @@
+import random
+import time
+
+from django.core.management.base import BaseCommand
+
+from cards.autocomplete import AutocompleteIndex
+
+WORDS = [
+    'Blue-Eyes', 'White', 'Dragon', 'Dark', 'Magician', 'Ash', 'Blossom', 'Joyous', 'Spring',
+    'Red-Eyes', 'Black', 'Elemental', 'HERO', 'Cyber', 'Stardust', 'Synchro', 'Knight',
+    'Sky', 'Striker', 'Ace', 'Raye', 'Maxx', 'Ghost', 'Ogre', 'Snow', 'Rabbit', 'Infinite',
+    'Impermanence', 'Called', 'by', 'the', 'Grave', 'Pot', 'of', 'Greed', 'Mirror', 'Force',
+    'Solemn', 'Judgment', 'Chaos', 'Emperor', 'Number', 'Utopia', 'Borrelsword', 'Accesscode',
+    'Talker', 'Apollousa', 'Bow', 'Sky', 'Tearlaments', 'Kashtira', 'Branded', 'Fusion',
+    'Albaz', 'Mirrorjade', 'Despia', 'Labrynth', 'Arianna', 'Lady', 'Floowandereeze',
+]
+
+TYPOS = ['blu eyes', 'blueyes whte', 'ash blosom', 'dark magican', 'elemntal hero', 'borelsword']
+PREFIXES = ['b', 'blue', 'blue-eyes w', 'ash', 'dark mag', 'eyes', 'number', 'sky str']
+
+
+def synthetic_names(count, seed):
+    rng = random.Random(seed)
+    names = set()
+    while len(names) < count:
+        names.add(' '.join(rng.sample(WORDS, rng.randint(2, 4))) + f' {rng.randint(1, 999)}')
+    return sorted(names)
+
+
+class Command(BaseCommand):
+    help = 'Benchmark the autocomplete trie and trigram index over a synthetic catalog'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--names', type=int, default=50000, help='Synthetic catalog size')
+        parser.add_argument('--queries', type=int, default=200, help='Lookups per query kind')
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        names = synthetic_names(options['names'], options['seed'])
+        index = AutocompleteIndex()
+
+        started = time.perf_counter()
+        for i, name in enumerate(names):
+            index.add(('card', i), name)
+        build_ms = (time.perf_counter() - started) * 1000
+        self.stdout.write(f'Built index of {len(index)} names in {build_ms:.0f} ms')
+
+        for label, queries in (('prefix', PREFIXES), ('typo', TYPOS)):
+            # First lookup of each query fills the per-node caches
+            cold = []
+            for query in queries:
+                started = time.perf_counter()
+                index.suggest(query, 8)
+                cold.append((time.perf_counter() - started) * 1000)
+
+            timings = []
+            for n in range(options['queries']):
+                query = queries[n % len(queries)]
+                started = time.perf_counter()
+                index.suggest(query, 8)
+                timings.append((time.perf_counter() - started) * 1000)
+            timings.sort()
+            p50 = timings[len(timings) // 2]
+            p95 = timings[int(len(timings) * 0.95)]
+            self.stdout.write(
+                f'{label:>6}: cold max {max(cold):7.2f} ms | warm p50 {p50:6.3f} ms, p95 {p95:6.3f} ms'
+            )
+
+        # Incremental update cost: rename one entry, then look it up again
+        started = time.perf_counter()
+        index.add(('card', 0), 'Blue-Eyes Ultimate Dragon 1')
+        index.suggest('blue-eyes u', 8)
+        self.stdout.write(f'update + lookup: {(time.perf_counter() - started) * 1000:.2f} ms')
+
+        for query in ('blue-eyes wh', 'ash blosom', 'dark magican'):
+            suggestions = [index.entries[key]['name'] for key in index.suggest(query, 3)]
+            self.stdout.write(f'  {query!r} -> {suggestions}')
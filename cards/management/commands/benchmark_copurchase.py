@@ -0,0 +1,55 @@
+import time
+
+import numpy as np
+from django.core.management.base import BaseCommand
+
+from cards.copurchase import CoPurchaseModel
+
+
+def synthetic_lines(lines, items, seed):
+    """Order lines with Zipf-like item popularity and 1-8 lines per order"""
+    rng = np.random.default_rng(seed)
+    sizes = rng.integers(1, 9, size=lines // 4)
+    sizes = sizes[np.cumsum(sizes) <= lines]
+    order_ids = np.repeat(np.arange(1, len(sizes) + 1, dtype=np.int64), sizes)
+    popularity = 1.0 / np.arange(1, items + 1)
+    popularity /= popularity.sum()
+    item_ids = rng.choice(np.arange(1, items + 1, dtype=np.int64), size=len(order_ids), p=popularity)
+    # Mix in other products (odd codes) for one line in ten
+    kinds = (rng.random(len(order_ids)) < 0.1).astype(np.int64)
+    return order_ids, item_ids * 2 + kinds
+
+
+class Command(BaseCommand):
+    help = 'Benchmark building the co-purchase model over synthetic order lines (no database)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lines', type=int, default=1_000_000, help='Synthetic order lines')
+        parser.add_argument('--items', type=int, default=50_000, help='Distinct items')
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        order_ids, item_codes = synthetic_lines(options['lines'], options['items'], options['seed'])
+        self.stdout.write(f'{len(order_ids)} lines in {order_ids[-1]} orders, {options["items"]} items')
+
+        # Full build over 90% of the orders, then an incremental update with the rest
+        split = np.searchsorted(order_ids, int(order_ids[-1] * 0.9), side='right')
+        model = CoPurchaseModel()
+
+        started = time.perf_counter()
+        model.add_lines(order_ids[:split], item_codes[:split])
+        build_s = time.perf_counter() - started
+        self.stdout.write(f'build:  {build_s:6.2f} s, {model.matrix.nnz} pairs')
+
+        started = time.perf_counter()
+        touched = model.add_lines(order_ids[split:], item_codes[split:])
+        update_s = time.perf_counter() - started
+        self.stdout.write(f'update: {update_s:6.2f} s for {len(order_ids) - split} lines, {len(touched)} items touched')
+
+        started = time.perf_counter()
+        pairs = sum(len(others) for _, others, _ in model.top_pairs(range(len(model.codes))))
+        self.stdout.write(f'top-k:  {time.perf_counter() - started:6.2f} s, {pairs} pairs for all items')
+
+        started = time.perf_counter()
+        pairs = sum(len(others) for _, others, _ in model.top_pairs(touched))
+        self.stdout.write(f'top-k of touched items: {time.perf_counter() - started:6.2f} s')
@@ -0,0 +1,63 @@
+import datetime
+import math
+import time
+import uuid
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import IntegrityError, transaction
+
+from cards import order_numbers
+from cards.models import Order, OrderNumberCounter
+
+# The counter day used by the benchmark, far from any real order
+BENCH_DAY = datetime.date(2000, 1, 1)
+
+
+def uuid_number():
+    """The previous scheme: 8 random hex digits"""
+    return f'ORD-{uuid.uuid4().hex[:8].upper()}'
+
+
+class Command(BaseCommand):
+    help = 'Compare order inserts per second with random UUID numbers and the per-day counter'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--orders', type=int, default=2000, help='Orders inserted per scheme')
+
+    def handle(self, *args, **options):
+        user = User.objects.create_user(f'benchmark-order-numbers-{time.time_ns()}')
+        try:
+            for label, number in (
+                ('uuid fragment', uuid_number),
+                ('daily counter', lambda: order_numbers.allocate(BENCH_DAY)),
+            ):
+                self.run(label, number, user, options['orders'])
+        finally:
+            Order.objects.filter(user=user).delete()
+            user.delete()
+            OrderNumberCounter.objects.filter(day=BENCH_DAY).delete()
+
+        # Chance that n random 32-bit numbers contain a duplicate (birthday bound)
+        for n in (10000, 100000, 1000000):
+            chance = 1 - math.exp(-n * (n - 1) / 2 / 16 ** 8)
+            self.stdout.write(f'uuid fragment collision chance after {n:>7} orders: {chance:.1%}')
+
+    def run(self, label, number, user, count):
+        collisions = 0
+        started = time.perf_counter()
+        for _ in range(count):
+            # One order per transaction, as at checkout
+            try:
+                with transaction.atomic():
+                    Order.objects.create(
+                        user=user, order_number=number(), subtotal=0, tax=0, total_amount=0,
+                        shipping_full_name='Benchmark', payment_method='cash_on_delivery',
+                    )
+            except IntegrityError:
+                collisions += 1
+        elapsed = time.perf_counter() - started
+        self.stdout.write(
+            f'{label:>14}: {count / elapsed:8.0f} inserts/s ({elapsed * 1000 / count:.2f} ms each), '
+            f'{collisions} collisions'
+        )
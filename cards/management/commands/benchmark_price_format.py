@@ -0,0 +1,88 @@
+import timeit
+from decimal import Decimal
+
+from django.contrib.auth.models import AnonymousUser
+from django.core.management.base import BaseCommand
+from django.template.loader import get_template
+from django.test.utils import override_settings
+from django.utils import timezone
+
+from cards.currency import attach_price_display, get_active_formatter
+from cards.models import Card, SiteSettings
+
+
+def legacy_format_currency(value, currency):
+    """The float-based if/elif formatter used before cards.currency existed"""
+    amount = float(value)
+    if currency == 'VND':
+        return f"{int(amount):,}₫"
+    elif currency == 'USD':
+        return f"${amount:,.2f}"
+    elif currency == 'EUR':
+        return f"€{amount:,.2f}"
+    elif currency == 'GBP':
+        return f"£{amount:,.2f}"
+    elif currency == 'JPY':
+        return f"¥{int(amount):,}"
+    return f"{amount:,.2f}"
+
+
+class Command(BaseCommand):
+    help = 'Micro-benchmark: render prices through includes/card_grid.html and compare formatters and the fragment cache'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--count', type=int, default=1000, help='Number of prices to render')
+        parser.add_argument('--repeat', type=int, default=5, help='Timing repetitions (best is reported)')
+
+    def handle(self, *args, **options):
+        count = options['count']
+        repeat = options['repeat']
+
+        # Unsaved cards with fixed pks are enough for the template; no catalog data is needed
+        cards = [
+            Card(pk=i + 1, name=f'Card {i}', card_type='monster', stock_quantity=i % 3,
+                 price=Decimal('123456789.99') + i)
+            for i in range(count)
+        ]
+        prices = [card.price for card in cards]
+        currency = SiteSettings.get_settings().currency
+        formatter = get_active_formatter()  # also warms the settings cache
+
+        template = get_template('includes/card_grid.html')
+        context = {'cards': cards, 'user': AnonymousUser()}
+
+        def best(func):
+            return min(timeit.repeat(func, number=1, repeat=repeat)) * 1000
+
+        legacy_ms = best(lambda: [legacy_format_currency(p, currency) for p in prices])
+        decimal_ms = best(lambda: [formatter(p) for p in prices])
+        filter_render_ms = best(lambda: template.render(context))
+
+        attach_price_display(cards)
+        bulk_render_ms = best(lambda: template.render(context))
+
+        # Stamped cards are cacheable; the first render fills the fragment cache. The
+        # default LocMemCache keeps only 300 entries, fewer than the fragments of one
+        # run, so it would cull and re-render most of them; give the run its own cache
+        # big enough to hold them all
+        stamp = timezone.now()
+        for card in cards:
+            card.updated_at = stamp
+        fragment_cache = {'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'benchmark_price_format',
+            'OPTIONS': {'MAX_ENTRIES': count * 2 + 100},
+        }}
+        with override_settings(CACHES=fragment_cache):
+            template.render(context)
+            cached_render_ms = best(lambda: template.render(context))
+
+        self.stdout.write(f'{count} prices, currency={currency}, best of {repeat}')
+        self.stdout.write(f'  legacy float formatter:       {legacy_ms:8.2f} ms')
+        self.stdout.write(f'  precompiled Decimal formatter:{decimal_ms:8.2f} ms')
+        self.stdout.write(f'  card_grid, per-item filter:   {filter_render_ms:8.2f} ms')
+        self.stdout.write(f'  card_grid, price_display:     {bulk_render_ms:8.2f} ms')
+        self.stdout.write(f'  card_grid, cached fragments:  {cached_render_ms:8.2f} ms')
+        # The formatters are kept for Decimal precision, not speed (the two times above match)
+        big = Decimal('98765432109876543.21')
+        self.stdout.write(f'  {big} -> legacy {legacy_format_currency(big, currency)}, Decimal {formatter(big)}')
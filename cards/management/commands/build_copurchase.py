@@ -0,0 +1,24 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from cards import copurchase
+
+
+class Command(BaseCommand):
+    help = 'Update the "frequently bought together" model with new orders (run from cron)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--full', action='store_true', help='Rebuild from the whole order history')
+        parser.add_argument('--path', help='Model file (default: COPURCHASE_MODEL_PATH or var/copurchase.npz)')
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        if options['full']:
+            model = copurchase.build(options['path'])
+        else:
+            model = copurchase.update(options['path'])
+        self.stdout.write(self.style.SUCCESS(
+            f'{len(model.codes)} items, {model.matrix.nnz} item pairs, '
+            f'last order {model.last_order_id}, {time.perf_counter() - started:.1f}s'
+        ))
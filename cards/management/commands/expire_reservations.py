@@ -0,0 +1,19 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from cards import reservations
+
+
+class Command(BaseCommand):
+    help = 'Delete expired checkout stock holds (run from cron)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=reservations.SWEEP_BATCH)
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        removed = reservations.expire(options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Removed {removed} expired holds in {time.perf_counter() - started:.1f}s'
+        ))
@@ -0,0 +1,35 @@
+import resource
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from cards import importer
+
+
+class Command(BaseCommand):
+    help = 'Create or update cards from a CSV file (same columns as the warehouse bulk upload)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='CSV file to import')
+        parser.add_argument('--batch-size', type=int, default=None,
+                            help=f'Rows per bulk write (default {importer.batch_size()})')
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        try:
+            with open(options['path'], encoding='utf-8-sig', newline='') as stream:
+                result = importer.import_cards(stream, size=options['batch_size'])
+        except (OSError, importer.CSVFormatError) as e:
+            raise CommandError(str(e))
+
+        for line, message in result.errors:
+            self.stderr.write(f'line {line}: {message}')
+        if result.failed > len(result.errors):
+            self.stderr.write(f'... and {result.failed - len(result.errors)} more errors')
+
+        # ru_maxrss is in kilobytes on Linux
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+        self.stdout.write(self.style.SUCCESS(
+            f'{result.rows} rows: {result.created} cards created, {result.updated} updated, '
+            f'{result.failed} rejected in {time.perf_counter() - started:.1f}s (peak memory {peak:.0f} MB)'
+        ))
@@ -0,0 +1,17 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from cards import related
+from cards.models import RelatedItem
+
+
+class Command(BaseCommand):
+    help = 'Recompute the related items shown on card and product detail pages (run from cron)'
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        related.rebuild()
+        self.stdout.write(self.style.SUCCESS(
+            f'Stored {RelatedItem.objects.count()} related items in {time.perf_counter() - started:.1f}s'
+        ))
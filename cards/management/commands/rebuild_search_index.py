@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from cards import search
+from cards.models import SearchEntry
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the full-text search entries for all cards and other products'
+
+    def handle(self, *args, **options):
+        search.rebuild_index()
+        self.stdout.write(self.style.SUCCESS(
+            f'Indexed {SearchEntry.objects.count()} entries using {type(search.get_backend()).__name__}'
+        ))
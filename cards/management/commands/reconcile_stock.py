@@ -0,0 +1,72 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Sum
+
+from cards import catalog, homepage
+from cards.models import Card, OtherProduct, StockMovement
+
+
+def ledger_totals(field, pks):
+    return dict(
+        StockMovement.objects.filter(**{f'{field}_id__in': list(pks)})
+        .order_by().values_list(f'{field}_id').annotate(total=Sum('delta'))
+    )
+
+
+class Command(BaseCommand):
+    help = 'Check every stock_quantity against the sum of its stock ledger movements'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=2000, help='Products compared per query')
+        parser.add_argument('--fix', action='store_true',
+                            help='Reset mismatched stock_quantity values to the ledger total')
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        mismatches = 0
+        for field, model in (('card', Card), ('other_product', OtherProduct)):
+            checked = 0
+            for chunk in self.chunks(model, options['chunk_size']):
+                totals = ledger_totals(field, chunk)
+                suspects = [pk for pk, stock in chunk.items() if stock != totals.get(pk, 0)]
+                if suspects:
+                    mismatches += self.confirm(field, model, suspects, options['fix'])
+                checked += len(chunk)
+            self.stdout.write(f'{field}: checked {checked}')
+
+        elapsed = time.perf_counter() - started
+        if mismatches and not options['fix']:
+            raise CommandError(f'{mismatches} products disagree with the ledger ({elapsed:.1f}s)')
+        if mismatches:
+            catalog.bump_version()
+            homepage.invalidate()
+            self.stdout.write(self.style.WARNING(f'Reset {mismatches} products to the ledger ({elapsed:.1f}s)'))
+        else:
+            self.stdout.write(self.style.SUCCESS(f'Stock matches the ledger ({elapsed:.1f}s)'))
+
+    def chunks(self, model, size):
+        """Yield {pk: stock_quantity} for consecutive pk ranges, one query each"""
+        last_pk = 0
+        while True:
+            chunk = dict(
+                model.objects.filter(pk__gt=last_pk).order_by('pk').values_list('pk', 'stock_quantity')[:size]
+            )
+            if not chunk:
+                return
+            yield chunk
+            last_pk = max(chunk)
+
+    def confirm(self, field, model, pks, fix):
+        """Re-check suspects with the rows locked (a checkout may have run between the two reads)"""
+        with transaction.atomic():
+            stock = dict(model.objects.select_for_update().filter(pk__in=pks).values_list('pk', 'stock_quantity'))
+            totals = ledger_totals(field, stock)
+            wrong = {pk: totals.get(pk, 0) for pk in stock if stock[pk] != totals.get(pk, 0)}
+            for pk, total in wrong.items():
+                self.stdout.write(f'{field} {pk}: stock_quantity {stock[pk]}, ledger {total}')
+                if fix:
+                    # The ledger is the record; the projection is what gets corrected
+                    model.objects.filter(pk=pk).update(stock_quantity=max(total, 0))
+        return len(wrong)
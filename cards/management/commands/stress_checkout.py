@@ -0,0 +1,134 @@
+import threading
+import time
+from collections import Counter
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import OperationalError, close_old_connections, connection
+from django.utils import timezone
+
+from cards import checkout
+from cards.models import Card, CardSet, CartItem, Order, OtherProduct
+
+PREFIX = 'stress-checkout'
+SHIPPING = {
+    'shipping_full_name': 'Stress Test',
+    'shipping_address': '1 Test Street',
+    'shipping_city': 'Test',
+    'shipping_state': 'Test',
+    'shipping_zip_code': '00000',
+    'shipping_phone': '0000000000',
+    'payment_method': 'cash_on_delivery',
+}
+
+
+class Command(BaseCommand):
+    help = 'Race many concurrent checkouts for the same cards and accessory and check that nothing is oversold or placed twice'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--buyers', type=int, default=30, help='Concurrent checkouts')
+        parser.add_argument('--stock', type=int, default=10, help='Starting stock of each card and the accessory')
+        parser.add_argument('--cards', type=int, default=3, help='Cards in every cart')
+        parser.add_argument('--quantity', type=int, default=2, help='Copies of each card per cart')
+        parser.add_argument('--submits', type=int, default=2,
+                            help='Concurrent submits per buyer, all with the same checkout key')
+        parser.add_argument('--keep', action='store_true', help='Keep the test rows afterwards')
+
+    def handle(self, *args, **options):
+        if connection.vendor == 'sqlite':
+            self.stdout.write(self.style.WARNING(
+                'SQLite has no row locks; without OPTIONS transaction_mode IMMEDIATE expect "database is locked" '
+                'failures, but never an oversell'))
+        card_set, cards, accessory, users = self.setup(options)
+        try:
+            outcomes = self.race(users, options['submits'])
+            self.verify(cards + [accessory], users, outcomes, options)
+        finally:
+            if not options['keep']:
+                Order.objects.filter(user__in=users).delete()
+                User.objects.filter(pk__in=[user.pk for user in users]).delete()
+                card_set.delete()
+                accessory.delete()
+
+    def setup(self, options):
+        card_set = CardSet.objects.create(
+            name=f'{PREFIX} set', code=f'ST{time.time_ns() % 10 ** 8}', release_date=timezone.localdate(),
+        )
+        cards = [
+            Card.objects.create(
+                name=f'{PREFIX} card {n}', description='', card_type='monster', rarity='common',
+                card_set=card_set, condition='near_mint', price=1000, stock_quantity=options['stock'],
+            )
+            for n in range(options['cards'])
+        ]
+        accessory = OtherProduct.objects.create(
+            name=f'{PREFIX} sleeves', product_type='sleeves', sku=f'{PREFIX}-{time.time_ns()}',
+            price=500, stock_quantity=options['stock'],
+        )
+        users = []
+        for n in range(options['buyers']):
+            user = User.objects.create_user(f'{PREFIX}-{time.time_ns()}-{n}')
+            # Each buyer adds the cards in a different order to provoke lock-order deadlocks
+            shifted = cards[n % len(cards):] + cards[:n % len(cards)]
+            CartItem.objects.bulk_create(
+                [CartItem(user=user, card=card, quantity=options['quantity']) for card in shifted]
+                + [CartItem(user=user, other_product=accessory, quantity=options['quantity'])]
+            )
+            users.append(user)
+        return card_set, cards, accessory, users
+
+    def race(self, users, submits):
+        attempts = [(user, key) for user in users for key in [checkout.new_key()] * submits]
+        barrier = threading.Barrier(len(attempts))
+        outcomes = Counter()
+        lock = threading.Lock()
+
+        def buy(user, key):
+            try:
+                barrier.wait()
+                order = checkout.place_order(user, SHIPPING, key=key)
+                outcome = 'replayed' if order.replayed else 'ordered'
+            except checkout.InsufficientStock:
+                outcome = 'out of stock'
+            except checkout.CheckoutError as e:
+                outcome = str(e)
+            except OperationalError as e:
+                outcome = f'database error ({e})'
+            finally:
+                close_old_connections()
+                connection.close()
+            with lock:
+                outcomes[outcome] += 1
+
+        threads = [threading.Thread(target=buy, args=attempt) for attempt in attempts]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.stdout.write(f'{len(attempts)} checkouts in {(time.perf_counter() - started) * 1000:.0f} ms')
+        for outcome, count in outcomes.most_common():
+            self.stdout.write(f'  {outcome}: {count}')
+        return outcomes
+
+    def verify(self, products, users, outcomes, options):
+        ordered = outcomes['ordered']
+        expected = min(options['buyers'], options['stock'] // options['quantity'])
+        problems = []
+        placed = Order.objects.filter(user__in=users).count()
+        if placed != ordered:
+            problems.append(f'{placed} orders in the database, {ordered} reported as placed')
+        if placed > len(users):
+            problems.append(f'{placed} orders from {len(users)} buyers: a checkout key was used twice')
+        sold = ordered * options['quantity']
+        for product in products:
+            product.refresh_from_db(fields=['stock_quantity'])
+            if product.stock_quantity != options['stock'] - sold:
+                problems.append(f'{product.name}: stock {product.stock_quantity}, expected {options["stock"] - sold}')
+            if sold > options['stock']:
+                problems.append(f'{product.name}: oversold ({sold} sold of {options["stock"]})')
+        if problems:
+            raise CommandError('\n'.join(problems))
+        if ordered < expected and connection.vendor != 'sqlite':
+            self.stdout.write(self.style.WARNING(f'Only {ordered} of {expected} possible orders went through'))
+        self.stdout.write(self.style.SUCCESS(f'No overselling: {ordered} orders, stock consistent'))
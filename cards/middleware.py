@@ -0,0 +1,30 @@
+import logging
+
+from django.conf import settings
+
+from .context_processors import ContextUsage
+
+logger = logging.getLogger(__name__)
+
+
+class ContextUsageMiddleware:
+    """
+    Report which lazy context-processor values each request actually resolved.
+
+    The report is logged at DEBUG level on the `cards.middleware` logger and, when
+    DEBUG is on, sent back in the X-Context-Resolved response header.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        request.context_usage = usage = ContextUsage()
+        response = self.get_response(request)
+
+        resolved = ','.join(usage.resolved) or '-'
+        unused = ','.join(name for name in usage.provided if name not in usage.resolved) or '-'
+        logger.debug('%s %s context resolved=%s unused=%s', request.method, request.path, resolved, unused)
+        if settings.DEBUG:
+            response['X-Context-Resolved'] = resolved
+        return response
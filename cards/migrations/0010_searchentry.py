@@ -0,0 +1,108 @@
+# Generated by Django 5.2.6 on 2026-10-17 01:49
+
+from django.db import migrations, models
+
+
+SQLITE_FORWARD = [
+    "CREATE VIRTUAL TABLE cards_searchentry_fts USING fts5("
+    "name, body, content='cards_searchentry', content_rowid='id', "
+    "tokenize='unicode61 remove_diacritics 2', prefix='2 3')",
+    "CREATE TRIGGER cards_searchentry_ai AFTER INSERT ON cards_searchentry BEGIN "
+    "INSERT INTO cards_searchentry_fts(rowid, name, body) VALUES (new.id, new.name, new.body); END",
+    "CREATE TRIGGER cards_searchentry_ad AFTER DELETE ON cards_searchentry BEGIN "
+    "INSERT INTO cards_searchentry_fts(cards_searchentry_fts, rowid, name, body) "
+    "VALUES ('delete', old.id, old.name, old.body); END",
+    "CREATE TRIGGER cards_searchentry_au AFTER UPDATE ON cards_searchentry BEGIN "
+    "INSERT INTO cards_searchentry_fts(cards_searchentry_fts, rowid, name, body) "
+    "VALUES ('delete', old.id, old.name, old.body); "
+    "INSERT INTO cards_searchentry_fts(rowid, name, body) VALUES (new.id, new.name, new.body); END",
+]
+
+SQLITE_BACKWARD = [
+    "DROP TRIGGER IF EXISTS cards_searchentry_au",
+    "DROP TRIGGER IF EXISTS cards_searchentry_ad",
+    "DROP TRIGGER IF EXISTS cards_searchentry_ai",
+    "DROP TABLE IF EXISTS cards_searchentry_fts",
+]
+
+POSTGRES_FORWARD = [
+    "ALTER TABLE cards_searchentry ADD COLUMN document tsvector GENERATED ALWAYS AS ("
+    "setweight(to_tsvector('simple', coalesce(name, '')), 'A') || "
+    "setweight(to_tsvector('simple', coalesce(body, '')), 'B')) STORED",
+    "CREATE INDEX cards_searchentry_document_gin ON cards_searchentry USING GIN (document)",
+]
+
+POSTGRES_BACKWARD = [
+    "DROP INDEX IF EXISTS cards_searchentry_document_gin",
+    "ALTER TABLE cards_searchentry DROP COLUMN IF EXISTS document",
+]
+
+
+def _run(schema_editor, statements):
+    with schema_editor.connection.cursor() as cursor:
+        for statement in statements:
+            cursor.execute(statement)
+
+
+def create_fulltext_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        try:
+            _run(schema_editor, SQLITE_FORWARD[:1])
+        except Exception:
+            # SQLite built without FTS5: cards.search falls back to a plain scan
+            return
+        _run(schema_editor, SQLITE_FORWARD[1:])
+    elif vendor == 'postgresql':
+        _run(schema_editor, POSTGRES_FORWARD)
+
+
+def drop_fulltext_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        _run(schema_editor, SQLITE_BACKWARD)
+    elif vendor == 'postgresql':
+        _run(schema_editor, POSTGRES_BACKWARD)
+
+
+def populate_entries(apps, schema_editor):
+    Card = apps.get_model('cards', 'Card')
+    OtherProduct = apps.get_model('cards', 'OtherProduct')
+    SearchEntry = apps.get_model('cards', 'SearchEntry')
+    
+    entries = []
+    for card in Card.objects.select_related('card_set').iterator():
+        body = ' '.join(filter(None, [card.card_set.name, card.description]))
+        entries.append(SearchEntry(kind='card', object_id=card.pk, name=card.name, body=body))
+    for product in OtherProduct.objects.iterator():
+        body = ' '.join(filter(None, [product.brand, product.sku, product.description]))
+        entries.append(SearchEntry(kind='other_product', object_id=product.pk, name=product.name, body=body))
+    SearchEntry.objects.bulk_create(entries, batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cards', '0009_heroslider'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SearchEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('card', 'Card'), ('other_product', 'Other Product')], max_length=20)),
+                ('object_id', models.PositiveBigIntegerField()),
+                ('name', models.CharField(max_length=400)),
+                ('body', models.TextField(blank=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Search Entry',
+                'verbose_name_plural': 'Search Entries',
+                'unique_together': {('kind', 'object_id')},
+            },
+        ),
+        migrations.RunPython(create_fulltext_index, drop_fulltext_index),
+        migrations.RunPython(populate_entries, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 5.2.6 on 2026-10-17 02:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cards', '0010_searchentry'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='card',
+            index=models.Index(condition=models.Q(('stock_quantity__gt', 0)), fields=['name', 'id'], name='card_name_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='card',
+            index=models.Index(condition=models.Q(('stock_quantity__gt', 0)), fields=['price', 'id'], name='card_price_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='card',
+            index=models.Index(condition=models.Q(('stock_quantity__gt', 0)), fields=['created_at', 'id'], name='card_newest_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='cardset',
+            index=models.Index(fields=['release_date'], name='cardset_release_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='otherproduct',
+            index=models.Index(condition=models.Q(('is_active', True), ('stock_quantity__gt', 0)), fields=['name', 'id'], name='product_name_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='otherproduct',
+            index=models.Index(condition=models.Q(('is_active', True), ('stock_quantity__gt', 0)), fields=['price', 'id'], name='product_price_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='otherproduct',
+            index=models.Index(condition=models.Q(('is_active', True), ('stock_quantity__gt', 0)), fields=['created_at', 'id'], name='product_newest_idx'),
+        ),
+    ]
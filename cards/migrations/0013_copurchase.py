@@ -0,0 +1,31 @@
+# Generated by Django 5.2.6 on 2026-10-17 02:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cards', '0012_relateditem'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CoPurchase',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('item_kind', models.CharField(choices=[('card', 'Card'), ('other_product', 'Other Product')], max_length=20)),
+                ('item_id', models.PositiveBigIntegerField()),
+                ('other_kind', models.CharField(choices=[('card', 'Card'), ('other_product', 'Other Product')], max_length=20)),
+                ('other_id', models.PositiveBigIntegerField()),
+                ('orders', models.PositiveIntegerField()),
+                ('rank', models.PositiveSmallIntegerField()),
+            ],
+            options={
+                'verbose_name': 'Co-Purchase',
+                'verbose_name_plural': 'Co-Purchases',
+                'ordering': ['rank'],
+                'unique_together': {('item_kind', 'item_id', 'rank')},
+            },
+        ),
+    ]
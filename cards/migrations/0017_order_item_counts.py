@@ -0,0 +1,36 @@
+# Generated by Django 5.2.6 on 2026-10-17 02:14
+
+from django.db import migrations, models
+from django.db.models.functions import Coalesce
+
+
+def count_items(apps, schema_editor):
+    """Fill the new counts from the existing order lines in one UPDATE"""
+    Order = apps.get_model('cards', 'Order')
+    OrderItem = apps.get_model('cards', 'OrderItem')
+    lines = OrderItem.objects.filter(order=models.OuterRef('pk')).order_by().values('order')
+    Order.objects.update(
+        item_count=Coalesce(models.Subquery(lines.annotate(total=models.Sum('quantity')).values('total')), 0),
+        line_count=Coalesce(models.Subquery(lines.annotate(total=models.Count('pk')).values('total')), 0),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cards', '0016_ordernumbercounter'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='item_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='line_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(count_items, migrations.RunPython.noop),
+    ]
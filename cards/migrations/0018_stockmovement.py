@@ -0,0 +1,51 @@
+# Generated by Django 5.2.6 on 2026-10-17 02:17
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def opening_balances(apps, schema_editor):
+    """Start the ledger with each product's current stock, so the projection reconciles"""
+    Card = apps.get_model('cards', 'Card')
+    OtherProduct = apps.get_model('cards', 'OtherProduct')
+    StockMovement = apps.get_model('cards', 'StockMovement')
+    
+    movements = []
+    for card_id, stock in Card.objects.exclude(stock_quantity=0).values_list('id', 'stock_quantity').iterator():
+        movements.append(StockMovement(card_id=card_id, delta=stock, reason='opening'))
+    for product_id, stock in OtherProduct.objects.exclude(stock_quantity=0).values_list('id', 'stock_quantity').iterator():
+        movements.append(StockMovement(other_product_id=product_id, delta=stock, reason='opening'))
+    StockMovement.objects.bulk_create(movements, batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cards', '0017_order_item_counts'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StockMovement',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('delta', models.IntegerField()),
+                ('reason', models.CharField(choices=[('opening', 'Opening balance'), ('sale', 'Sale'), ('cancellation', 'Order cancelled'), ('adjustment', 'Manual adjustment'), ('import', 'Bulk import')], max_length=20)),
+                ('note', models.CharField(blank=True, max_length=200)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('card', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='stock_movements', to='cards.card')),
+                ('order', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='stock_movements', to='cards.order')),
+                ('other_product', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='stock_movements', to='cards.otherproduct')),
+                ('user', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='stock_movements', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Stock Movement',
+                'verbose_name_plural': 'Stock Movements',
+                'ordering': ['id'],
+                'indexes': [models.Index(fields=['card', 'id'], name='movement_card_idx'), models.Index(fields=['other_product', 'id'], name='movement_product_idx')],
+            },
+        ),
+        migrations.RunPython(opening_balances, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 5.2.6 on 2026-10-17 03:40
+
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+
+def copy_release_dates(apps, schema_editor):
+    """Fill Card.set_release_date from each card's set in one UPDATE"""
+    Card = apps.get_model('cards', 'Card')
+    CardSet = apps.get_model('cards', 'CardSet')
+    Card.objects.update(
+        set_release_date=Subquery(CardSet.objects.filter(pk=OuterRef('card_set_id')).values('release_date')[:1]),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cards', '0018_stockmovement'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='card',
+            name='set_release_date',
+            field=models.DateField(editable=False, null=True),
+        ),
+        migrations.RunPython(copy_release_dates, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='card',
+            name='set_release_date',
+            field=models.DateField(editable=False),
+        ),
+        migrations.AddIndex(
+            model_name='card',
+            index=models.Index(condition=models.Q(('stock_quantity__gt', 0)), fields=['-set_release_date', '-card_set', 'name', 'id'], name='card_set_release_idx'),
+        ),
+    ]
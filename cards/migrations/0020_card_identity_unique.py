@@ -0,0 +1,41 @@
+# Generated by Django 5.2.6 on 2026-10-17 09:05
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def check_duplicates(apps, schema_editor):
+    """Refuse to add the constraint over duplicate cards instead of failing half-way.
+
+    Duplicates carry their own orders, carts and ledger rows, so merging them is left
+    to staff rather than guessed here.
+    """
+    Card = apps.get_model('cards', 'Card')
+    duplicates = list(
+        Card.objects.values('card_set__code', 'name', 'rarity', 'condition')
+        .annotate(copies=Count('pk')).filter(copies__gt=1).order_by('card_set__code', 'name')[:20]
+    )
+    if duplicates:
+        listed = '\n'.join(
+            f"  {row['card_set__code']} / {row['name']} / {row['rarity']} / {row['condition']}: {row['copies']} cards"
+            for row in duplicates
+        )
+        raise RuntimeError(
+            'Cards must be unique per set, name, rarity and condition. Merge or delete these '
+            f'duplicates, then run the migration again (first 20 shown):\n{listed}'
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cards', '0019_card_set_release_date'),
+    ]
+
+    operations = [
+        migrations.RunPython(check_duplicates, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='card',
+            constraint=models.UniqueConstraint(fields=('card_set', 'name', 'rarity', 'condition'), name='card_identity_unique'),
+        ),
+    ]
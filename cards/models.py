@@ -1,8 +1,13 @@
 from django.db import models
+from django.db.models.functions import Coalesce
 from django.contrib.auth.models import User
 from django.urls import reverse
 from django.db import models
-import uuid  
+from . import settings_cache
+from .ordering import (
+    CARD_LISTING_CONDITION, CARD_ORDERINGS, OTHER_PRODUCT_LISTING_CONDITION, OTHER_PRODUCT_ORDERINGS,
+    listing_indexes,
+)
 
 class CardSet(models.Model):
     name = models.CharField(max_length=200)
@@ -15,6 +20,7 @@ class CardSet(models.Model):
     
     class Meta:
         ordering = ['-release_date']
+        indexes = [models.Index(fields=['release_date'], name='cardset_release_idx')]
 
 class Card(models.Model):
     RARITY_CHOICES = [
@@ -61,6 +67,10 @@ class Card(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
+    # Copy of card_set.release_date for the set_release listing index; save() fills it
+    # and CardSet saves push changes down (see signals.py)
+    set_release_date = models.DateField(editable=False)
+    
     # Monster-specific fields (optional)
     attack = models.IntegerField(null=True, blank=True)
     defense = models.IntegerField(null=True, blank=True)
@@ -76,8 +86,30 @@ class Card(models.Model):
     def is_in_stock(self):
         return self.stock_quantity > 0
     
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        card = super().from_db(db, field_names, values)
+        # The autocomplete signal compares against it to skip saves that keep the name
+        card._loaded_name = card.__dict__.get('name')
+        card._loaded_card_set_id = card.__dict__.get('card_set_id')
+        return card
+    
+    def save(self, *args, **kwargs):
+        moved = self.card_set_id != getattr(self, '_loaded_card_set_id', self.card_set_id)
+        if self.set_release_date is None or moved:
+            self.set_release_date = self.card_set.release_date
+            if kwargs.get('update_fields') is not None:
+                kwargs['update_fields'] = {*kwargs['update_fields'], 'set_release_date'}
+        super().save(*args, **kwargs)
+        self._loaded_card_set_id = self.card_set_id
+    
     class Meta:
         ordering = ['name']
+        indexes = listing_indexes('card', CARD_ORDERINGS, CARD_LISTING_CONDITION)
+        constraints = [
+            # What the CSV importer matches rows on and upserts against
+            models.UniqueConstraint(fields=['card_set', 'name', 'rarity', 'condition'], name='card_identity_unique'),
+        ]
 
 
 
@@ -128,6 +160,7 @@ class OtherProduct(models.Model):
     
     class Meta:
         ordering = ['name'] 
+        indexes = listing_indexes('product', OTHER_PRODUCT_ORDERINGS, OTHER_PRODUCT_LISTING_CONDITION)
     
 class CartItem(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE)
@@ -217,6 +250,11 @@ class Order(models.Model):
     order_notes = models.TextField(blank=True, null=True)
     admin_notes = models.TextField(blank=True, null=True)
     
+    # Denormalized from items so listings need no item queries; kept in step by checkout
+    # and the OrderItem signals, rebuilt by manage.py backfill_order_counts
+    item_count = models.PositiveIntegerField(default=0)  # total quantity
+    line_count = models.PositiveIntegerField(default=0)
+    
     # Timestamps
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
@@ -234,13 +272,24 @@ class Order(models.Model):
     
     @staticmethod
     def generate_order_number():
-        """Generate unique order number"""
-        return f"ORD-{uuid.uuid4().hex[:8].upper()}"
+        """Generate unique order number (date + per-day sequence, see order_numbers.py)"""
+        from .order_numbers import allocate
+        return allocate()
     
     @property
     def total_items(self):
         """Get total number of items in order"""
-        return sum(item.quantity for item in self.items.all())
+        return self.item_count
+    
+    @classmethod
+    def recount_items(cls, queryset=None):
+        """Recompute item_count and line_count from OrderItem in one UPDATE (all orders by default)"""
+        lines = OrderItem.objects.filter(order=models.OuterRef('pk')).order_by().values('order')
+        queryset = cls.objects.all() if queryset is None else queryset
+        return queryset.update(
+            item_count=Coalesce(models.Subquery(lines.annotate(total=models.Sum('quantity')).values('total')), 0),
+            line_count=Coalesce(models.Subquery(lines.annotate(total=models.Count('pk')).values('total')), 0),
+        )
 
 
 class OrderItem(models.Model):
@@ -386,8 +435,14 @@ class SiteSettings(models.Model):
         return f"Settings - {self.site_name}"
     
     @classmethod
-    def get_settings(cls):
-        """Get or create settings instance"""
+    def get_settings(cls, cached=True):
+        """Get or create settings instance.
+
+        Reads are served from the process-local settings cache; pass cached=False
+        to get a fresh row that is safe to modify and save.
+        """
+        if cached:
+            return settings_cache.get_cached(cls)
         settings, created = cls.objects.get_or_create(pk=1)
         return settings
 
@@ -484,8 +539,10 @@ class ShippingSettings(models.Model):
         return "Shipping Settings"
     
     @classmethod
-    def get_settings(cls):
-        """Get or create shipping settings instance"""
+    def get_settings(cls, cached=True):
+        """Get or create shipping settings instance (see SiteSettings.get_settings)"""
+        if cached:
+            return settings_cache.get_cached(cls)
         settings, created = cls.objects.get_or_create(pk=1)
         return settings
 
@@ -506,4 +563,164 @@ class HeroSlider(models.Model):
         verbose_name_plural = 'Hero Sliders'
     
     def __str__(self):
-        return f"{self.title} (Order: {self.order})"
\ No newline at end of file
+        return f"{self.title} (Order: {self.order})"
+
+class SearchEntry(models.Model):
+    """Denormalized search document for a Card or OtherProduct (see cards/search.py)"""
+    KIND_CHOICES = [
+        ('card', 'Card'),
+        ('other_product', 'Other Product'),
+    ]
+    
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    object_id = models.PositiveBigIntegerField()
+    
+    # Weighted fields: name matches rank above body matches
+    name = models.CharField(max_length=400)
+    body = models.TextField(blank=True)
+    
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        unique_together = [('kind', 'object_id')]
+        verbose_name = 'Search Entry'
+        verbose_name_plural = 'Search Entries'
+    
+    def __str__(self):
+        return f"{self.kind}:{self.object_id} {self.name}"
+
+class RelatedItem(models.Model):
+    """Precomputed neighbour of a Card or OtherProduct for detail pages (see cards/related.py)"""
+    # Source: exactly one of these is set
+    card = models.ForeignKey(Card, on_delete=models.CASCADE, null=True, blank=True, related_name='related_items')
+    other_product = models.ForeignKey(OtherProduct, on_delete=models.CASCADE, null=True, blank=True, related_name='related_items')
+    
+    # Neighbour, of the same kind as the source
+    related_card = models.ForeignKey(Card, on_delete=models.CASCADE, null=True, blank=True, related_name='related_to')
+    related_other_product = models.ForeignKey(OtherProduct, on_delete=models.CASCADE, null=True, blank=True, related_name='related_to')
+    
+    rank = models.PositiveSmallIntegerField()
+    score = models.FloatField()
+    
+    class Meta:
+        ordering = ['rank']
+        indexes = [
+            models.Index(fields=['card', 'rank'], name='related_card_rank_idx'),
+            models.Index(fields=['other_product', 'rank'], name='related_product_rank_idx'),
+        ]
+        verbose_name = 'Related Item'
+        verbose_name_plural = 'Related Items'
+    
+    def __str__(self):
+        source = self.card_id or self.other_product_id
+        target = self.related_card_id or self.related_other_product_id
+        return f"{source} -> {target} ({self.score:.2f})"
+
+class CoPurchase(models.Model):
+    """'Frequently bought together' pair stored by the co-purchase job (see cards/copurchase.py)"""
+    item_kind = models.CharField(max_length=20, choices=SearchEntry.KIND_CHOICES)
+    item_id = models.PositiveBigIntegerField()
+    other_kind = models.CharField(max_length=20, choices=SearchEntry.KIND_CHOICES)
+    other_id = models.PositiveBigIntegerField()
+    
+    # Number of orders containing both items
+    orders = models.PositiveIntegerField()
+    rank = models.PositiveSmallIntegerField()
+    
+    class Meta:
+        unique_together = [('item_kind', 'item_id', 'rank')]
+        ordering = ['rank']
+        verbose_name = 'Co-Purchase'
+        verbose_name_plural = 'Co-Purchases'
+    
+    def __str__(self):
+        return f"{self.item_kind}:{self.item_id} + {self.other_kind}:{self.other_id} ({self.orders})"
+
+class StockReservation(models.Model):
+    """Stock held for a user's cart while they fill in the checkout form (see cards/reservations.py)"""
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='stock_reservations')
+    card = models.ForeignKey(Card, on_delete=models.CASCADE, null=True, blank=True, related_name='reservations')
+    other_product = models.ForeignKey(OtherProduct, on_delete=models.CASCADE, null=True, blank=True, related_name='reservations')
+    quantity = models.PositiveIntegerField()
+    
+    # A hold only counts while expires_at is in the future; the sweeper deletes the rest
+    expires_at = models.DateTimeField()
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        indexes = [
+            # Sum of active holds per product: index range scan on (product, expires_at > now)
+            models.Index(fields=['card', 'expires_at'], name='reservation_card_idx'),
+            models.Index(fields=['other_product', 'expires_at'], name='reservation_product_idx'),
+            models.Index(fields=['expires_at'], name='reservation_expiry_idx'),
+        ]
+        verbose_name = 'Stock Reservation'
+        verbose_name_plural = 'Stock Reservations'
+    
+    def __str__(self):
+        product = self.card_id and f"card {self.card_id}" or f"product {self.other_product_id}"
+        return f"{self.user_id}: {product} x {self.quantity} until {self.expires_at}"
+
+class CheckoutKey(models.Model):
+    """Idempotency key sent with the checkout form; a replayed submit returns the same order"""
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='checkout_keys')
+    key = models.CharField(max_length=64)
+    order = models.OneToOneField(Order, on_delete=models.CASCADE, null=True, blank=True, related_name='checkout_key')
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'key'], name='checkout_key_unique'),
+        ]
+        verbose_name = 'Checkout Key'
+        verbose_name_plural = 'Checkout Keys'
+    
+    def __str__(self):
+        return f"{self.user_id}: {self.key} -> {self.order_id}"
+
+class OrderNumberCounter(models.Model):
+    """Last order number handed out per day (see cards/order_numbers.py)"""
+    day = models.DateField(primary_key=True)
+    last_value = models.PositiveIntegerField(default=0)
+    
+    class Meta:
+        verbose_name = 'Order Number Counter'
+        verbose_name_plural = 'Order Number Counters'
+    
+    def __str__(self):
+        return f"{self.day}: {self.last_value}"
+
+class StockMovement(models.Model):
+    """One change to a product's stock; stock_quantity is the running sum (see cards/stock_ledger.py)"""
+    REASON_CHOICES = [
+        ('opening', 'Opening balance'),
+        ('sale', 'Sale'),
+        ('cancellation', 'Order cancelled'),
+        ('adjustment', 'Manual adjustment'),
+        ('import', 'Bulk import'),
+    ]
+    
+    card = models.ForeignKey(Card, on_delete=models.SET_NULL, null=True, blank=True, related_name='stock_movements')
+    other_product = models.ForeignKey(OtherProduct, on_delete=models.SET_NULL, null=True, blank=True, related_name='stock_movements')
+    delta = models.IntegerField()
+    reason = models.CharField(max_length=20, choices=REASON_CHOICES)
+    
+    # Where the change came from
+    order = models.ForeignKey(Order, on_delete=models.SET_NULL, null=True, blank=True, related_name='stock_movements')
+    user = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='stock_movements')
+    note = models.CharField(max_length=200, blank=True)
+    
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        ordering = ['id']
+        indexes = [
+            models.Index(fields=['card', 'id'], name='movement_card_idx'),
+            models.Index(fields=['other_product', 'id'], name='movement_product_idx'),
+        ]
+        verbose_name = 'Stock Movement'
+        verbose_name_plural = 'Stock Movements'
+    
+    def __str__(self):
+        product = self.card_id and f"card {self.card_id}" or f"product {self.other_product_id}"
+        return f"{product} {self.delta:+d} ({self.reason})"
@@ -0,0 +1,60 @@
+"""
+Cached data shown in the navbar on every page: the card set menu and the cart badge.
+
+The card set list is cached until a CardSet is saved or deleted (see signals.py).
+Cart counts are cached per user and adjusted in place by the cart views, so ordinary
+page renders never aggregate CartItem.
+"""
+from django.core.cache import cache
+from django.db.models import Sum
+
+from .models import CardSet, CartItem
+
+CARD_SETS_KEY = 'cards:navbar:card_sets'
+CART_COUNT_KEY = 'cards:navbar:cart_count:{}'
+CART_COUNT_TIMEOUT = 60 * 60 * 24
+
+
+def get_card_sets():
+    """Return all card sets, newest first"""
+    card_sets = cache.get(CARD_SETS_KEY)
+    if card_sets is None:
+        card_sets = list(CardSet.objects.all().order_by('-release_date'))
+        cache.set(CARD_SETS_KEY, card_sets, timeout=None)
+    return card_sets
+
+
+def invalidate_card_sets():
+    cache.delete(CARD_SETS_KEY)
+
+
+def get_cart_count(user):
+    """Return the total quantity in a user's cart"""
+    key = CART_COUNT_KEY.format(user.pk)
+    count = cache.get(key)
+    if count is None:
+        result = CartItem.objects.filter(user=user).aggregate(total=Sum('quantity'))
+        count = result['total'] or 0
+        cache.set(key, count, CART_COUNT_TIMEOUT)
+    return count
+
+
+def adjust_cart_count(user, delta):
+    """Apply a quantity change to the cached cart count"""
+    if not delta:
+        return
+    key = CART_COUNT_KEY.format(user.pk)
+    try:
+        cache.incr(key, delta)
+    except ValueError:
+        # Not cached yet; the next render recomputes it from the database
+        pass
+
+
+def reset_cart_count(user, count=None):
+    """Set the cached cart count, or drop it so it is recomputed on next use"""
+    key = CART_COUNT_KEY.format(user.pk)
+    if count is None:
+        cache.delete(key)
+    else:
+        cache.set(key, count, CART_COUNT_TIMEOUT)
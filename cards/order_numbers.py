@@ -0,0 +1,44 @@
+"""
+Monotonic order numbers: ORD-<yymmdd>-<per-day sequence>, e.g. ORD-261017-00042.
+
+The sequence lives in OrderNumberCounter, one row per day. allocate() bumps it with a
+single INSERT ... ON CONFLICT DO UPDATE ... RETURNING (PostgreSQL, and SQLite 3.35+),
+so the first order of a day and every later one take exactly one statement and never
+collide or retry. Numbers grow with time, so new orders append to the right-hand edge
+of the unique index instead of landing on random pages as UUID fragments did.
+
+The UPDATE locks the day's row until the surrounding transaction ends. Checkout
+allocates inside its transaction, after the cart has been validated and the stock
+locked and checked, so concurrent orders only queue on the counter for the final writes
+and a failed checkout rolls its number back instead of leaving a gap.
+"""
+from django.db import connection
+from django.utils import timezone
+
+from .models import OrderNumberCounter
+
+PREFIX = 'ORD'
+DIGITS = 5
+
+
+def format_number(day, value):
+    return f'{PREFIX}-{day:%y%m%d}-{value:0{DIGITS}d}'
+
+
+def next_value(day):
+    """Increment and return the counter for a day"""
+    table = connection.ops.quote_name(OrderNumberCounter._meta.db_table)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'INSERT INTO {table} (day, last_value) VALUES (%s, 1) '
+            f'ON CONFLICT (day) DO UPDATE SET last_value = {table}.last_value + 1 '
+            f'RETURNING last_value',
+            [connection.ops.adapt_datefield_value(day)],
+        )
+        return cursor.fetchone()[0]
+
+
+def allocate(day=None):
+    """Return the next order number for a day (today by default)"""
+    day = day or timezone.localdate()
+    return format_number(day, next_value(day))
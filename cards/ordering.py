@@ -0,0 +1,70 @@
+"""
+Whitelisted sort orders for the public card and product listings.
+
+Each public sort key maps to an order_by() tuple that ends in the primary key (so cursor
+pagination has a unique key) and to the index that serves it. The listings only show
+rows in stock, so the indexes are partial indexes over exactly those rows; models.py
+builds them from this registry with listing_indexes().
+"""
+from django.db import models
+from django.db.models import Q
+
+# key: (label, order_by, index fields or None when another entry's index covers it)
+CARD_ORDERINGS = {
+    'name': ('Tên (A-Z)', ('name', 'id'), ('name', 'id')),
+    '-name': ('Tên (Z-A)', ('-name', '-id'), None),
+    'price': ('Giá (Thấp đến Cao)', ('price', 'id'), ('price', 'id')),
+    '-price': ('Giá (Cao đến Thấp)', ('-price', '-id'), None),
+    'newest': ('Mới nhất', ('-created_at', '-id'), ('created_at', 'id')),
+    'set_release': (
+        'Bộ thẻ mới phát hành',
+        # Card.set_release_date is copied from the set, so the sort needs no join
+        ('-set_release_date', '-card_set_id', 'name', 'id'),
+        ('-set_release_date', '-card_set', 'name', 'id'),
+    ),
+}
+
+OTHER_PRODUCT_ORDERINGS = {
+    'name': ('Tên (A-Z)', ('name', 'id'), ('name', 'id')),
+    '-name': ('Tên (Z-A)', ('-name', '-id'), None),
+    'price': ('Giá (Thấp đến Cao)', ('price', 'id'), ('price', 'id')),
+    '-price': ('Giá (Cao đến Thấp)', ('-price', '-id'), None),
+    'newest': ('Mới nhất', ('-created_at', '-id'), ('created_at', 'id')),
+}
+
+# Older links used raw field names
+ALIASES = {
+    '-created_at': 'newest',
+}
+
+# Rows the public listings show; the partial indexes cover only these
+CARD_LISTING_CONDITION = Q(stock_quantity__gt=0)
+OTHER_PRODUCT_LISTING_CONDITION = Q(is_active=True, stock_quantity__gt=0)
+
+
+def listing_indexes(prefix, orderings, condition):
+    """Build the partial indexes an ordering registry needs, for a model's Meta.indexes"""
+    return [
+        models.Index(
+            fields=list(index_fields),
+            condition=condition,
+            name=f"{prefix}_{key.lstrip('-')}_idx",
+        )
+        for key, (label, order_by, index_fields) in orderings.items()
+        if index_fields
+    ]
+
+
+def ordering_choices(orderings):
+    """(key, label) pairs for a sort dropdown"""
+    return [(key, label) for key, (label, order_by, index_fields) in orderings.items()]
+
+
+def resolve_ordering(orderings, key):
+    """Return the whitelisted key for a GET value, or '' if it is not allowed"""
+    key = ALIASES.get(key, key)
+    return key if key in orderings else ''
+
+
+def order_queryset(queryset, orderings, key):
+    return queryset.order_by(*orderings[key][1])
@@ -0,0 +1,193 @@
+"""
+Keyset (cursor) pagination for the catalog and admin listings.
+
+Django's Paginator runs a COUNT(*) plus an OFFSET query, and both get slower the deeper
+the page. A cursor page instead remembers the ordering values of its last (or first) row
+and asks for the rows after (or before) them, which the database answers from an index
+no matter how far in the listing is.
+
+The position travels as an opaque, signed `cursor` GET parameter. Small result sets,
+explicit ?page= links and orderings that cannot be keyed (search rank, nullable or
+unknown fields) keep numbered pages, counted through counts.CachedCountPaginator.
+"""
+from django.core import signing
+from django.core.exceptions import FieldDoesNotExist
+from django.db.models import Q
+
+from .counts import CachedCountPaginator, bounded_count
+
+CURSOR_PARAM = 'cursor'
+
+# Result sets with at most this many pages keep the numbered page UI
+PAGE_MODE_MAX_PAGES = 10
+
+SALT = 'cards.pagination'
+
+
+class CursorPage:
+    """One page of a keyset-paginated queryset; iterates like a Paginator Page"""
+
+    is_cursor = True
+
+    def __init__(self, object_list, next_token=None, previous_token=None):
+        self.object_list = object_list
+        self.next_token = next_token
+        self.previous_token = previous_token
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    def has_next(self):
+        return self.next_token is not None
+
+    def has_previous(self):
+        return self.previous_token is not None
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+
+def _resolve(model, path):
+    """Return the field for an ordering path if it can key a cursor, else None"""
+    parts = path.split('__')
+    for position, name in enumerate(parts):
+        try:
+            field = model._meta.get_field(name)
+        except FieldDoesNotExist:
+            return None
+        if field.null:
+            return None
+        if position < len(parts) - 1:
+            if not field.many_to_one:
+                return None
+            model = field.related_model
+        elif field.is_relation and name != field.attname:
+            # A foreign key orders by the related model's ordering; its _id column is fine
+            return None
+    return field
+
+
+def keyset_fields(queryset):
+    """Return the ordering as [(path, descending), ...] ending in pk, or None"""
+    model = queryset.model
+    keys = []
+    for item in queryset.query.order_by or model._meta.ordering:
+        if not isinstance(item, str) or item == '?':
+            return None
+        descending = item.startswith('-')
+        path = item.lstrip('-')
+        if path in ('pk', model._meta.pk.name):
+            keys.append(('pk', descending))
+            return keys
+        if _resolve(model, path) is None:
+            return None
+        keys.append((path, descending))
+    keys.append(('pk', False))
+    return keys
+
+
+def _order(keys, reverse=False):
+    return [('-' if descending != reverse else '') + path for path, descending in keys]
+
+
+def _value(obj, path):
+    for name in path.split('__'):
+        obj = getattr(obj, name)
+    return obj
+
+
+def _dump(value):
+    # isoformat keeps microseconds, which DjangoJSONEncoder would truncate
+    if isinstance(value, (int, str)):
+        return value
+    if hasattr(value, 'isoformat'):
+        return value.isoformat()
+    return str(value)
+
+
+def _token(keys, obj, direction):
+    values = [_dump(_value(obj, path)) for path, _ in keys]
+    return signing.dumps({'k': _order(keys), 'v': values, 'd': direction}, salt=SALT, compress=True)
+
+
+def _seek(keys, values, reverse):
+    """Rows strictly after `values` in the ordering (before them when reverse)"""
+    condition = Q()
+    equal = Q()
+    for (path, descending), value in zip(keys, values):
+        lookup = 'lt' if descending != reverse else 'gt'
+        condition |= equal & Q(**{f'{path}__{lookup}': value})
+        equal &= Q(**{path: value})
+    return condition
+
+
+def cursor_page(queryset, per_page, token=None, keys=None):
+    """Return the CursorPage for a token (the first page when token is None).
+
+    Returns None when the token is invalid or was issued for another ordering.
+    """
+    keys = keys or keyset_fields(queryset)
+    reverse = False
+    if token:
+        try:
+            data = signing.loads(token, salt=SALT)
+        except signing.BadSignature:
+            return None
+        if data.get('k') != _order(keys):
+            return None
+        reverse = data['d'] == 'prev'
+        queryset = queryset.filter(_seek(keys, data['v'], reverse))
+
+    rows = list(queryset.order_by(*_order(keys, reverse))[:per_page + 1])
+    more = len(rows) > per_page
+    rows = rows[:per_page]
+    if reverse:
+        rows.reverse()
+
+    # Coming back with a 'prev' token means the rows after this page exist, and vice versa
+    has_next = True if reverse else more
+    has_previous = more if reverse else bool(token)
+    return CursorPage(
+        rows,
+        next_token=_token(keys, rows[-1], 'next') if rows and has_next else None,
+        previous_token=_token(keys, rows[0], 'prev') if rows and has_previous else None,
+    )
+
+
+def is_small(queryset, per_page):
+    """True when the result set fits in PAGE_MODE_MAX_PAGES pages"""
+    limit = per_page * PAGE_MODE_MAX_PAGES
+    return bounded_count(queryset, limit) <= limit
+
+
+def paginate(request, queryset, per_page):
+    """Return the page of `queryset` for this request.
+
+    A Paginator Page for small result sets, ?page= links and unkeyable orderings,
+    otherwise a CursorPage. Templates tell them apart with `page.is_cursor`.
+    """
+    keys = keyset_fields(queryset)
+    token = request.GET.get(CURSOR_PARAM)
+    if keys is not None and token:
+        page = cursor_page(queryset, per_page, token, keys)
+        if page is not None:
+            return page
+    page_number = request.GET.get('page')
+    if keys is None or page_number or is_small(queryset, per_page):
+        return CachedCountPaginator(queryset, per_page).get_page(page_number)
+    return cursor_page(queryset, per_page, keys=keys)
+
+
+def query_params(request):
+    """The request's non-empty GET parameters minus the page position, urlencoded"""
+    params = request.GET.copy()
+    for key in list(params):
+        if key in ('page', CURSOR_PARAM) or not params.get(key):
+            params.pop(key)
+    return params.urlencode()
@@ -0,0 +1,61 @@
+"""
+"Frequently bought together" lists for card_detail and the cart.
+
+Reads the CoPurchase pairs written by the offline co-purchase job (copurchase.py) and
+turns them into in-stock Card / OtherProduct objects. Each returned object gets a `kind`
+attribute ('card' or 'other_product') so templates can link to the right detail page.
+"""
+from collections import defaultdict
+
+from django.db.models import Q
+
+from .models import Card, CoPurchase, OtherProduct
+
+
+def _objects(scored, limit):
+    """Load the best `limit` available items from [(kind, id), ...] in order"""
+    wanted = defaultdict(list)
+    for kind, object_id in scored:
+        wanted[kind].append(object_id)
+    found = {}
+    if wanted['card']:
+        for card in Card.objects.filter(pk__in=wanted['card'], stock_quantity__gt=0).select_related('card_set'):
+            card.kind = 'card'
+            found[('card', card.pk)] = card
+    if wanted['other_product']:
+        for product in OtherProduct.objects.filter(
+                pk__in=wanted['other_product'], is_active=True, stock_quantity__gt=0):
+            product.kind = 'other_product'
+            found[('other_product', product.pk)] = product
+    return [found[key] for key in scored if key in found][:limit]
+
+
+def for_item(kind, object_id, limit=4):
+    """Items most often bought together with one item"""
+    pairs = CoPurchase.objects.filter(item_kind=kind, item_id=object_id).values_list('other_kind', 'other_id')
+    return _objects(list(pairs), limit)
+
+
+def for_cart(cart_items, limit=4):
+    """Items most often bought with the cart's contents, excluding what is already in it"""
+    in_cart = set()
+    for item in cart_items:
+        if item.card_id:
+            in_cart.add(('card', item.card_id))
+        elif item.other_product_id:
+            in_cart.add(('other_product', item.other_product_id))
+    if not in_cart:
+        return []
+
+    sources = Q()
+    for kind in ('card', 'other_product'):
+        ids = [object_id for item_kind, object_id in in_cart if item_kind == kind]
+        if ids:
+            sources |= Q(item_kind=kind, item_id__in=ids)
+    totals = defaultdict(int)
+    for other_kind, other_id, orders in CoPurchase.objects.filter(sources).values_list(
+            'other_kind', 'other_id', 'orders'):
+        if (other_kind, other_id) not in in_cart:
+            totals[(other_kind, other_id)] += orders
+    scored = sorted(totals, key=lambda key: (-totals[key], key))
+    return _objects(scored[:limit * 3], limit)
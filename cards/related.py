@@ -0,0 +1,152 @@
+"""
+Precomputed "related items" for card_detail and other_products_detail.
+
+A background job (manage.py rebuild_related_items, run from cron) scores every item
+against its candidates and stores the top TOP_N in RelatedItem. Detail pages then read
+neighbours with one indexed join instead of filtering the catalog per request.
+
+Candidates for a card are the cards of its set plus everything bought together with it;
+for an other product, the products of its type or brand plus co-purchases. Scores add
+up the shared attributes and the co-purchase frequency stored by the co-purchase job
+(copurchase.py), so run that job first.
+"""
+import heapq
+import math
+from collections import defaultdict
+
+from django.db import transaction
+
+from . import catalog
+from .models import Card, CoPurchase, OtherProduct, RelatedItem
+
+TOP_N = 12
+BATCH_SIZE = 1000
+
+# Largest attribute group (set, type, brand) scanned for candidates per item
+GROUP_LIMIT = 500
+
+# Score weights
+SAME_SET = 3.0
+SAME_TYPE = 1.0
+SAME_RARITY = 0.5
+SAME_PRODUCT_TYPE = 2.0
+SAME_BRAND = 2.0
+CO_PURCHASE = 4.0  # times log(1 + orders containing both)
+
+
+# Co-purchase counts
+
+def co_purchase_counts(kind):
+    """Return {item_id: {other_id: orders with both}} from the co-purchase job's pairs"""
+    counts = defaultdict(dict)
+    pairs = CoPurchase.objects.filter(item_kind=kind, other_kind=kind).values_list('item_id', 'other_id', 'orders')
+    for item_id, other_id, orders in pairs.iterator(chunk_size=BATCH_SIZE):
+        counts[item_id][other_id] = orders
+    return counts
+
+
+# Scoring
+
+def _top(item_id, candidates, score):
+    scored = [(score(other), other) for other in candidates if other != item_id]
+    return heapq.nlargest(TOP_N, scored)
+
+
+def card_neighbours(co_counts):
+    """Yield (card_id, [(score, related_id), ...]) for every card"""
+    info = {}
+    by_set = defaultdict(list)
+    for card_id, set_id, card_type, rarity in Card.objects.order_by('-created_at').values_list(
+            'id', 'card_set_id', 'card_type', 'rarity'):
+        info[card_id] = (set_id, card_type, rarity)
+        if len(by_set[set_id]) < GROUP_LIMIT:
+            by_set[set_id].append(card_id)
+
+    for card_id, (set_id, card_type, rarity) in info.items():
+        bought = co_counts.get(card_id, {})
+
+        def score(other):
+            other_set, other_type, other_rarity = info[other]
+            return (
+                SAME_SET * (other_set == set_id)
+                + SAME_TYPE * (other_type == card_type)
+                + SAME_RARITY * (other_rarity == rarity)
+                + CO_PURCHASE * math.log1p(bought.get(other, 0))
+            )
+
+        candidates = set(by_set[set_id]).union(other for other in bought if other in info)
+        yield card_id, _top(card_id, candidates, score)
+
+
+def product_neighbours(co_counts):
+    """Yield (product_id, [(score, related_id), ...]) for every other product"""
+    info = {}
+    by_type = defaultdict(list)
+    by_brand = defaultdict(list)
+    for product_id, product_type, brand in OtherProduct.objects.filter(is_active=True).order_by(
+            '-created_at').values_list('id', 'product_type', 'brand'):
+        info[product_id] = (product_type, brand)
+        if len(by_type[product_type]) < GROUP_LIMIT:
+            by_type[product_type].append(product_id)
+        if brand and len(by_brand[brand]) < GROUP_LIMIT:
+            by_brand[brand].append(product_id)
+
+    for product_id, (product_type, brand) in info.items():
+        bought = co_counts.get(product_id, {})
+
+        def score(other):
+            other_type, other_brand = info[other]
+            return (
+                SAME_PRODUCT_TYPE * (other_type == product_type)
+                + SAME_BRAND * bool(brand and other_brand == brand)
+                + CO_PURCHASE * math.log1p(bought.get(other, 0))
+            )
+
+        candidates = set(by_type[product_type]).union(by_brand.get(brand, ()) if brand else ())
+        candidates.update(other for other in bought if other in info)
+        yield product_id, _top(product_id, candidates, score)
+
+
+# Storage
+
+def _store(source_field, target_field, neighbours):
+    with transaction.atomic():
+        RelatedItem.objects.filter(**{f'{source_field}__isnull': False}).delete()
+        batch = []
+        for item_id, top in neighbours:
+            for rank, (score, related_id) in enumerate(top):
+                batch.append(RelatedItem(**{
+                    f'{source_field}_id': item_id,
+                    f'{target_field}_id': related_id,
+                    'rank': rank,
+                    'score': score,
+                }))
+            if len(batch) >= BATCH_SIZE:
+                RelatedItem.objects.bulk_create(batch)
+                batch = []
+        RelatedItem.objects.bulk_create(batch)
+
+
+def rebuild():
+    """Recompute every neighbour list; readers see the old lists until each kind commits"""
+    _store('card', 'related_card', card_neighbours(co_purchase_counts('card')))
+    _store('other_product', 'related_other_product', product_neighbours(co_purchase_counts('other_product')))
+    # Detail pages embed the neighbours, so their ETags must change
+    catalog.bump_version()
+
+
+# Reading
+
+def related_cards(card, limit=4):
+    """In-stock neighbours of a card, best first; empty until the job has run for it"""
+    return list(
+        Card.objects.filter(related_to__card=card, stock_quantity__gt=0)
+        .order_by('related_to__rank')[:limit]
+    )
+
+
+def related_products(product, limit=4):
+    return list(
+        OtherProduct.objects.filter(related_to__other_product=product, is_active=True, stock_quantity__gt=0)
+        .order_by('related_to__rank')[:limit]
+    )
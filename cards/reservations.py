@@ -0,0 +1,74 @@
+"""
+Timed stock holds for carts that are in checkout.
+
+Opening the checkout page reserves the cart's quantities for HOLD_MINUTES (setting
+STOCK_HOLD_MINUTES). While a hold is active, other buyers see
+
+    available = stock_quantity - sum(quantity of active holds by other users)
+
+computed with one grouped SUM per product table over the (product, expires_at)
+indexes. Holds are only ever inserted or deleted, never updated, and a hold stops
+counting the moment expires_at passes, so expiry needs no write at all; the sweeper
+(manage.py expire_reservations) just deletes dead rows in batches to keep the indexes
+small.
+
+Callers lock the product rows first (see checkout.py), which serializes holds and
+orders for the same product.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import Sum
+from django.utils import timezone
+
+from .models import StockReservation
+
+HOLD_MINUTES = 10
+SWEEP_BATCH = 1000
+
+
+def hold_minutes():
+    return getattr(settings, 'STOCK_HOLD_MINUTES', HOLD_MINUTES)
+
+
+def active(now=None):
+    return StockReservation.objects.filter(expires_at__gt=now or timezone.now())
+
+
+def held(field, ids, exclude_user=None):
+    """Return {product id: quantity in active holds} for one product table"""
+    holds = active().filter(**{f'{field}_id__in': ids})
+    if exclude_user is not None:
+        holds = holds.exclude(user=exclude_user)
+    return dict(holds.order_by().values_list(f'{field}_id').annotate(total=Sum('quantity')))
+
+
+def replace(user, quantities):
+    """Swap the user's holds for {field: {product id: quantity}}; return the expiry time"""
+    expires_at = timezone.now() + timedelta(minutes=hold_minutes())
+    release(user)
+    StockReservation.objects.bulk_create([
+        StockReservation(user=user, quantity=quantity, expires_at=expires_at, **{f'{field}_id': pk})
+        for field, wanted in quantities.items()
+        for pk, quantity in wanted.items()
+    ])
+    return expires_at
+
+
+def release(user):
+    StockReservation.objects.filter(user=user).delete()
+
+
+def expire(batch_size=SWEEP_BATCH):
+    """Delete expired holds in batches; return how many were removed"""
+    now = timezone.now()
+    removed = 0
+    while True:
+        batch = list(
+            StockReservation.objects.filter(expires_at__lte=now)
+            .order_by('expires_at')
+            .values_list('pk', flat=True)[:batch_size]
+        )
+        if not batch:
+            return removed
+        removed += StockReservation.objects.filter(pk__in=batch).delete()[0]
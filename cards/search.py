@@ -0,0 +1,226 @@
+"""
+Full-text search over the card catalog.
+
+Every Card and OtherProduct has a SearchEntry row holding its searchable text, kept in
+sync by the signal handlers in signals.py. The entries are indexed by the database:
+
+- SQLite: an FTS5 table (cards_searchentry_fts) fed by triggers, ranked with bm25()
+- PostgreSQL: a weighted tsvector column with a GIN index, ranked with ts_rank()
+- anything else: a plain icontains scan of the entry table
+
+Matches are filtered and ranked in SQL: rows whose name contains every search word
+come first (an explicit tier, not just a column weight), then the backend's score.
+"""
+import re
+
+from django.db import connection
+
+from .models import Card, OtherProduct, SearchEntry
+
+TOKEN_RE = re.compile(r'\w+')
+
+# Words used from a single search
+MAX_TOKENS = 8
+
+FTS_TABLE = 'cards_searchentry_fts'
+
+# bm25 column weights for the FTS5 (name, body) columns
+FTS_WEIGHTS = (10.0, 1.0)
+
+BATCH_SIZE = 500
+
+
+def tokenize(text):
+    """Split user input into lowercase word tokens"""
+    return [token.lower() for token in TOKEN_RE.findall(text or '')][:MAX_TOKENS]
+
+
+# Documents
+
+def card_document(card):
+    body = ' '.join(filter(None, [card.card_set.name, card.description]))
+    return card.name, body
+
+
+def product_document(product):
+    body = ' '.join(filter(None, [product.brand, product.sku, product.description]))
+    return product.name, body
+
+
+def index_card(card):
+    name, body = card_document(card)
+    SearchEntry.objects.update_or_create(
+        kind='card', object_id=card.pk, defaults={'name': name, 'body': body}
+    )
+
+
+def index_product(product):
+    name, body = product_document(product)
+    SearchEntry.objects.update_or_create(
+        kind='other_product', object_id=product.pk, defaults={'name': name, 'body': body}
+    )
+
+
+def remove_entry(kind, object_id):
+    SearchEntry.objects.filter(kind=kind, object_id=object_id).delete()
+
+
+def reindex_cards(cards):
+    """Rebuild the entries for an iterable of cards (use select_related('card_set'))"""
+    batch = []
+    for card in cards:
+        batch.append(card)
+        if len(batch) >= BATCH_SIZE:
+            _replace_entries('card', batch, card_document)
+            batch = []
+    if batch:
+        _replace_entries('card', batch, card_document)
+
+
+def reindex_products(products):
+    batch = []
+    for product in products:
+        batch.append(product)
+        if len(batch) >= BATCH_SIZE:
+            _replace_entries('other_product', batch, product_document)
+            batch = []
+    if batch:
+        _replace_entries('other_product', batch, product_document)
+
+
+def _replace_entries(kind, objects, document):
+    ids = [obj.pk for obj in objects]
+    SearchEntry.objects.filter(kind=kind, object_id__in=ids).delete()
+    entries = []
+    for obj in objects:
+        name, body = document(obj)
+        entries.append(SearchEntry(kind=kind, object_id=obj.pk, name=name, body=body))
+    SearchEntry.objects.bulk_create(entries)
+
+
+def rebuild_index():
+    """Recreate every search entry from the catalog tables"""
+    SearchEntry.objects.all().delete()
+    reindex_cards(Card.objects.select_related('card_set').order_by('pk').iterator(chunk_size=BATCH_SIZE))
+    reindex_products(OtherProduct.objects.order_by('pk').iterator(chunk_size=BATCH_SIZE))
+
+
+# Backends
+#
+# A backend joins the search entries into a Card/OtherProduct query (QuerySet.extra):
+# the join keeps only matching rows, and adds two columns for ordering:
+#   search_tier  0 when every search word is in the row's name, 1 for body-only matches
+#   search_rank  the full-text score of the row's entry, lower is better
+# Everything is computed in the one query, so counts, facets and pagination see every
+# match and the database pages through them in rank order.
+
+ENTRY_TABLE = SearchEntry._meta.db_table
+
+
+def _entry_join(kind, queryset):
+    """WHERE clauses tying the outer row to its search entry"""
+    outer = f'{connection.ops.quote_name(queryset.model._meta.db_table)}.id'
+    return [f'{ENTRY_TABLE}.kind = %s', f'{ENTRY_TABLE}.object_id = {outer}'], [kind]
+
+
+class BasicBackend:
+    """Portable fallback: substring match on the entry table"""
+
+    def join(self, queryset, kind, tokens):
+        where, params = _entry_join(kind, queryset)
+        # Tokens are \w+, so '_' is the only LIKE wildcard they can contain
+        patterns = ['%' + token.replace('_', '\\_') + '%' for token in tokens]
+        name_like = f"UPPER({ENTRY_TABLE}.name) LIKE UPPER(%s) ESCAPE '\\'"
+        body_like = f"UPPER({ENTRY_TABLE}.body) LIKE UPPER(%s) ESCAPE '\\'"
+        for pattern in patterns:
+            where.append(f'({name_like} OR {body_like})')
+            params += [pattern, pattern]
+        tier = ' AND '.join([name_like] * len(patterns))
+        return queryset.extra(
+            tables=[ENTRY_TABLE], where=where, params=params,
+            select={'search_tier': f'CASE WHEN {tier} THEN 0 ELSE 1 END', 'search_rank': '0'},
+            select_params=patterns,
+        )
+
+
+class SQLiteFTS5Backend:
+    @staticmethod
+    def query(tokens, column=None):
+        # Each token is a quoted prefix query; FTS5 ANDs them together
+        terms = ' '.join(f'"{token}"*' for token in tokens)
+        return f'{column} : ({terms})' if column else terms
+
+    def join(self, queryset, kind, tokens):
+        where, params = _entry_join(kind, queryset)
+        # Unary + keeps SQLite from probing FTS5 by rowid once per entry (a prefix query
+        # rebuilds its doclist on every probe); the MATCH scan drives the join instead
+        where += [f'+{FTS_TABLE}.rowid = {ENTRY_TABLE}.id', f'{FTS_TABLE} MATCH %s']
+        params.append(self.query(tokens))
+        # The name-only match runs once as a list subquery, not per row
+        tier = (
+            f'CASE WHEN {ENTRY_TABLE}.id IN (SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s) '
+            f'THEN 0 ELSE 1 END'
+        )
+        return queryset.extra(
+            tables=[ENTRY_TABLE, FTS_TABLE], where=where, params=params,
+            select={
+                'search_tier': tier,
+                # bm25() is negative, more negative for better matches
+                'search_rank': f'bm25({FTS_TABLE}, {FTS_WEIGHTS[0]}, {FTS_WEIGHTS[1]})',
+            },
+            select_params=[self.query(tokens, 'name')],
+        )
+
+
+class PostgresBackend:
+    @staticmethod
+    def query(tokens, weight=''):
+        # The name is weighted A in the document, so ':*A' only matches name words
+        return ' & '.join(f'{token}:*{weight}' for token in tokens)
+
+    def join(self, queryset, kind, tokens):
+        where, params = _entry_join(kind, queryset)
+        where.append(f"{ENTRY_TABLE}.document @@ to_tsquery('simple', %s)")
+        params.append(self.query(tokens))
+        return queryset.extra(
+            tables=[ENTRY_TABLE], where=where, params=params,
+            select={
+                'search_tier': f"CASE WHEN {ENTRY_TABLE}.document @@ to_tsquery('simple', %s) THEN 0 ELSE 1 END",
+                'search_rank': f"-ts_rank({ENTRY_TABLE}.document, to_tsquery('simple', %s))",
+            },
+            select_params=[self.query(tokens, 'A'), self.query(tokens)],
+        )
+
+
+_backends = {}
+
+
+def get_backend():
+    """Pick the backend for the default database, checking for the FTS5 table once"""
+    key = (connection.vendor, connection.settings_dict.get('NAME'))
+    backend = _backends.get(key)
+    if backend is None:
+        if connection.vendor == 'postgresql':
+            backend = PostgresBackend()
+        elif connection.vendor == 'sqlite' and FTS_TABLE in connection.introspection.table_names():
+            backend = SQLiteFTS5Backend()
+        else:
+            backend = BasicBackend()
+        _backends[key] = backend
+    return backend
+
+
+# Public API
+
+def filter_queryset(queryset, kind, query):
+    """Restrict a Card/OtherProduct queryset to search matches.
+
+    The matches are joined in SQL with no cap, so counts, facets and pagination see
+    all of them. Rows get `search_tier` (0 when every word is in the name) and
+    `search_rank` (full-text score, lower is better); views order_by('search_tier',
+    'search_rank', 'name') when the user has not picked another ordering.
+    """
+    tokens = tokenize(query)
+    if not tokens:
+        return queryset.none().extra(select={'search_tier': '0', 'search_rank': '0'})
+    return get_backend().join(queryset, kind, tokens)
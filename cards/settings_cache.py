@@ -0,0 +1,49 @@
+"""
+Process-local cache for the singleton settings models (SiteSettings, ShippingSettings).
+
+Each worker keeps its own copy of the settings rows. A version number lives in the
+shared Django cache; saving a settings row bumps it, and every worker reloads its
+copy once the next time it sees the new version.
+"""
+import threading
+import time
+
+from . import versioning
+
+VERSION_KEY = 'cards:settings:version'
+
+# How long (seconds) a worker trusts its local copy before re-reading the shared version
+CHECK_INTERVAL = 1.0
+
+_local = {}
+_lock = threading.Lock()
+
+
+def get_version():
+    """Return the current shared settings version, initialising it if missing"""
+    return versioning.get_version(VERSION_KEY)
+
+
+def bump_version():
+    """Invalidate every worker's local settings copy"""
+    versioning.bump_version(VERSION_KEY)
+    with _lock:
+        _local.clear()
+
+
+def get_cached(model):
+    """Return the pk=1 row of a settings model, loading it at most once per version"""
+    now = time.monotonic()
+    entry = _local.get(model)
+    if entry is not None and now - entry['checked_at'] < CHECK_INTERVAL:
+        return entry['instance']
+
+    version = get_version()
+    if entry is not None and entry['version'] == version:
+        entry['checked_at'] = now
+        return entry['instance']
+
+    instance, created = model.objects.get_or_create(pk=1)
+    with _lock:
+        _local[model] = {'version': version, 'instance': instance, 'checked_at': now}
+    return instance
@@ -0,0 +1,127 @@
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete, pre_save
+from django.dispatch import receiver
+
+from . import autocomplete, catalog, homepage, navbar_data, search, settings_cache, stock_ledger
+from .models import Card, CardSet, HeroSlider, Order, OrderItem, OtherProduct, SiteSettings, ShippingSettings
+
+
+@receiver(post_save, sender=SiteSettings)
+@receiver(post_delete, sender=SiteSettings)
+@receiver(post_save, sender=ShippingSettings)
+@receiver(post_delete, sender=ShippingSettings)
+def invalidate_settings_cache(sender, **kwargs):
+    """Make every worker reload settings after an admin saves them"""
+    # After commit, or another worker could reload the old row under the new version
+    transaction.on_commit(settings_cache.bump_version)
+
+
+@receiver(post_save, sender=CardSet)
+@receiver(post_delete, sender=CardSet)
+def invalidate_card_set_menu(sender, **kwargs):
+    """Rebuild the navbar card set list after a set is added, edited or removed"""
+    # After commit, or a page rendered in between would cache the old list again
+    transaction.on_commit(navbar_data.invalidate_card_sets)
+
+
+@receiver(post_save, sender=Card)
+def index_card(sender, instance, **kwargs):
+    search.index_card(instance)
+
+
+@receiver(post_save, sender=OtherProduct)
+def index_other_product(sender, instance, **kwargs):
+    search.index_product(instance)
+
+
+@receiver(post_delete, sender=Card)
+def unindex_card(sender, instance, **kwargs):
+    search.remove_entry('card', instance.pk)
+
+
+@receiver(post_delete, sender=OtherProduct)
+def unindex_other_product(sender, instance, **kwargs):
+    search.remove_entry('other_product', instance.pk)
+
+
+@receiver(post_save, sender=CardSet)
+def reindex_card_set(sender, instance, created, **kwargs):
+    """Card entries include the set name, so refresh them when a set changes"""
+    if not created:
+        search.reindex_cards(Card.objects.filter(card_set=instance).select_related('card_set'))
+
+
+@receiver(post_save, sender=CardSet)
+def copy_release_date(sender, instance, created, **kwargs):
+    """Keep Card.set_release_date (the set_release listing key) in step with the set"""
+    if not created:
+        Card.objects.filter(card_set=instance).exclude(set_release_date=instance.release_date).update(
+            set_release_date=instance.release_date,
+        )
+
+
+@receiver(post_save, sender=Card)
+def update_autocomplete_card(sender, instance, created, update_fields, **kwargs):
+    autocomplete.card_changed(instance, created, update_fields)
+
+
+@receiver(post_delete, sender=Card)
+def remove_autocomplete_card(sender, instance, **kwargs):
+    autocomplete.card_removed(instance.pk)
+
+
+@receiver(post_save, sender=CardSet)
+def update_autocomplete_card_set(sender, instance, **kwargs):
+    autocomplete.card_set_changed(instance)
+
+
+@receiver(post_delete, sender=CardSet)
+def remove_autocomplete_card_set(sender, instance, **kwargs):
+    autocomplete.card_set_removed(instance.pk)
+
+
+@receiver(post_save, sender=Card)
+@receiver(post_delete, sender=Card)
+@receiver(post_save, sender=OtherProduct)
+@receiver(post_delete, sender=OtherProduct)
+@receiver(post_save, sender=CardSet)
+@receiver(post_delete, sender=CardSet)
+def bump_catalog_version(sender, **kwargs):
+    """Retire every cache entry derived from the catalog"""
+    # After commit, or a request in between would tag the old rows with the new version
+    transaction.on_commit(catalog.bump_version)
+
+
+@receiver(post_save, sender=Card)
+@receiver(post_delete, sender=Card)
+@receiver(post_save, sender=OtherProduct)
+@receiver(post_delete, sender=OtherProduct)
+@receiver(post_save, sender=CardSet)
+@receiver(post_delete, sender=CardSet)
+@receiver(post_save, sender=HeroSlider)
+@receiver(post_delete, sender=HeroSlider)
+@receiver(post_save, sender=SiteSettings)
+def invalidate_homepage(sender, **kwargs):
+    """Drop the homepage snapshot; the next visit rebuilds it"""
+    # After commit, or a visit in between would rebuild and cache the old rows
+    transaction.on_commit(homepage.invalidate)
+
+
+@receiver(post_save, sender=OrderItem)
+@receiver(post_delete, sender=OrderItem)
+def recount_order_items(sender, instance, **kwargs):
+    """Keep Order.item_count / line_count in step when a line is edited one at a time (admin)"""
+    Order.recount_items(Order.objects.filter(pk=instance.order_id))
+
+
+@receiver(pre_save, sender=Card)
+@receiver(pre_save, sender=OtherProduct)
+def read_stock_before_save(sender, instance, **kwargs):
+    stock_ledger.before_save(sender, instance, **kwargs)
+
+
+@receiver(post_save, sender=Card)
+@receiver(post_save, sender=OtherProduct)
+def record_stock_change(sender, instance, created, **kwargs):
+    """Append the stock change of a single save() to the ledger"""
+    stock_ledger.after_save(sender, instance, created, **kwargs)
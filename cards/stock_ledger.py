@@ -0,0 +1,96 @@
+"""
+Append-only stock movement ledger.
+
+Every change to Card.stock_quantity or OtherProduct.stock_quantity is recorded as a
+StockMovement (signed delta, reason, and the order or user behind it). stock_quantity
+stays on the product rows as a materialized projection: for every product it equals
+the sum of its movements. manage.py reconcile_stock checks that.
+
+Bulk paths (checkout, cancellations) build their movements with movement() and write
+them with record() next to their UPDATE, in the same transaction. Anything that saves
+a single product (admin forms, the warehouse stock field, Django admin list_editable,
+creating a product) is picked up by the pre_save/post_save signals, which diff the new
+stock against the row in the database. Inside a transaction that read locks the row
+(SELECT ... FOR UPDATE), so callers that set an absolute stock should save in
+transaction.atomic() to make the diff exact; changed_by() says who did it. Wrap a loop
+of saves in collect() to write their movements in one bulk_create.
+"""
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.db import transaction
+
+from .models import StockMovement
+
+# Movements buffered by an active collect() block
+_buffer = ContextVar('stock_ledger_buffer', default=None)
+
+FIELDS = {'Card': 'card', 'OtherProduct': 'other_product'}
+
+
+def movement(field, product_id, delta, reason, order=None, user=None, note=''):
+    """Unsaved StockMovement for one product; `field` is 'card' or 'other_product'"""
+    return StockMovement(
+        delta=delta, reason=reason, order=order, user=user, note=note[:200],
+        **{f'{field}_id': product_id},
+    )
+
+
+def record(movements):
+    """Write movements in one bulk_create (or add them to the enclosing collect() block)"""
+    movements = [entry for entry in movements if entry.delta]
+    buffer = _buffer.get()
+    if buffer is not None:
+        buffer.extend(movements)
+    elif movements:
+        StockMovement.objects.bulk_create(movements)
+
+
+@contextmanager
+def collect():
+    """Buffer the movements recorded inside the block and write them together at the end"""
+    buffer = []
+    token = _buffer.set(buffer)
+    try:
+        yield buffer
+    finally:
+        _buffer.reset(token)
+    if buffer:
+        StockMovement.objects.bulk_create(buffer)
+
+
+def changed_by(product, user, reason='adjustment', note=''):
+    """Attribute the stock change of the product's next save()"""
+    product._stock_user = user
+    product._stock_reason = reason
+    product._stock_note = note
+
+
+# Signal handlers (connected in signals.py)
+
+def before_save(sender, instance, update_fields=None, **kwargs):
+    if update_fields is not None and 'stock_quantity' not in update_fields:
+        instance._stock_before = None
+        return
+    if instance.pk is None or instance._state.adding:
+        instance._stock_before = 0
+    else:
+        current = sender.objects.filter(pk=instance.pk)
+        if transaction.get_connection().in_atomic_block:
+            # Held until commit, so nothing can change the stock between this read and the save
+            current = current.select_for_update()
+        instance._stock_before = current.values_list('stock_quantity', flat=True).first() or 0
+
+
+def after_save(sender, instance, created, **kwargs):
+    before = getattr(instance, '_stock_before', None)
+    instance._stock_before = None
+    if before is None:
+        return
+    reason = getattr(instance, '_stock_reason', None) or ('opening' if created else 'adjustment')
+    record([movement(
+        FIELDS[sender.__name__], instance.pk, instance.stock_quantity - before, reason,
+        user=getattr(instance, '_stock_user', None), note=getattr(instance, '_stock_note', ''),
+    )])
+    instance._stock_user = instance._stock_reason = None
+    instance._stock_note = ''
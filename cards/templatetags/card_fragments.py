@@ -0,0 +1,11 @@
+from django import template
+
+from cards.fragments import render_card_grid
+
+register = template.Library()
+
+
+@register.simple_tag(takes_context=True)
+def card_grid(context, cards):
+    """Render card grid items from the per-card fragment cache"""
+    return render_card_grid(cards, context.get('user'))
@@ -1,5 +1,5 @@
 from django import template
-from cards.models import SiteSettings
+from cards.currency import format_amount, get_active_formatter
 
 register = template.Library()
 
@@ -7,43 +7,14 @@ register = template.Library()
 def format_currency(value):
     """Format price based on site currency settings"""
     try:
-        settings = SiteSettings.get_settings()
-        currency = settings.currency
-        
-        # Convert to float
-        amount = float(value)
-        
-        # Format based on currency
-        if currency == 'VND':
-            # VND doesn't use decimal places
-            return f"{int(amount):,}₫"
-        elif currency == 'USD':
-            return f"${amount:,.2f}"
-        elif currency == 'EUR':
-            return f"€{amount:,.2f}"
-        elif currency == 'GBP':
-            return f"£{amount:,.2f}"
-        elif currency == 'JPY':
-            return f"¥{int(amount):,}"
-        else:
-            return f"{amount:,.2f}"
-    except:
+        return format_amount(value)
+    except Exception:
         return value
 
 @register.simple_tag
 def currency_symbol():
     """Get just the currency symbol"""
     try:
-        settings = SiteSettings.get_settings()
-        currency = settings.currency
-        
-        symbols = {
-            'VND': '₫',
-            'USD': '$',
-            'EUR': '€',
-            'GBP': '£',
-            'JPY': '¥'
-        }
-        return symbols.get(currency, '$')
-    except:
-        return '$'
\ No newline at end of file
+        return get_active_formatter().symbol
+    except Exception:
+        return '$'
@@ -1,3 +1,1021 @@
-from django.test import TestCase
+import datetime
+import io
+import tempfile
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+import numpy as np
+
+from django.contrib.auth.models import AnonymousUser, User
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.db import IntegrityError, transaction
+from django.db.models import Q
+from django.http import QueryDict
+from django.template import Context, Template
+from django.test import RequestFactory, TestCase
+from django.urls import reverse
+from django.utils import timezone
+
+from . import (
+    autocomplete, catalog, checkout, conditional, context_processors, copurchase, counts, currency, facets, fragments, homepage, importer, navbar_data,
+    order_numbers, pagination, related, reservations, search, settings_cache, stock_ledger, versioning, warehouse,
+)
+from .models import (
+    Card, CardSet, CartItem, CheckoutKey, CoPurchase, Order, OrderItem, OtherProduct, SiteSettings, StockMovement, StockReservation,
+)
+from .ordering import CARD_ORDERINGS, order_queryset
+
+
+class SettingsCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_version_bumps_only_after_commit(self):
+        before = settings_cache.get_version()
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            with transaction.atomic():
+                SiteSettings.objects.get_or_create(pk=1)[0].save()
+                self.assertEqual(settings_cache.get_version(), before)
+        self.assertTrue(callbacks)
+        self.assertNotEqual(settings_cache.get_version(), before)
+
+
+class VersioningTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_counters_are_independent_and_survive_eviction(self):
+        first = versioning.get_version('test:a')
+        self.assertEqual(versioning.bump_version('test:a'), first + 1)
+        self.assertEqual(versioning.get_version('test:a'), first + 1)
+        before_b = versioning.get_version('test:b')
+        versioning.bump_version('test:a')
+        self.assertEqual(versioning.get_version('test:b'), before_b)
+
+        cache.delete('test:a')
+        self.assertGreater(versioning.bump_version('test:a'), first + 1)
+
+
+class CurrencyTests(TestCase):
+    def test_large_amounts_keep_every_digit(self):
+        formatter = currency.get_formatter('VND')
+        self.assertEqual(formatter(Decimal('98765432109876543.21')), '98,765,432,109,876,543₫')
+        self.assertEqual(currency.get_formatter('USD')(Decimal('1234.5')), '$1,234.50')
+
+
+def make_card(card_set, name, **fields):
+    values = {
+        'description': '', 'card_type': 'monster', 'rarity': 'common', 'condition': 'near_mint',
+        'price': Decimal('10.00'), 'stock_quantity': 10,
+    }
+    values.update(fields)
+    return Card.objects.create(card_set=card_set, name=name, **values)
+
+
+class SearchTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.card_set = CardSet.objects.create(name='Legend of Blue Eyes', code='LOB',
+                                              release_date=datetime.date(2002, 3, 8))
+        # Many short body-only matches, which bm25 alone scores above a long name
+        Card.objects.bulk_create([
+            Card(card_set=cls.card_set, name=f'Zzz Monster {i}', description='dragon',
+                 card_type='monster', rarity='common', condition='near_mint', price=1, stock_quantity=1,
+                 set_release_date=cls.card_set.release_date)
+            for i in range(1100)
+        ])
+        search.reindex_cards(Card.objects.select_related('card_set'))
+        cls.name_match = make_card(
+            cls.card_set, 'Dragon Knight of the Eternal Silver Flame Sanctuary',
+            description=' '.join(['lore'] * 200),
+        )
+
+    def search(self, query):
+        return search.filter_queryset(Card.objects.all(), 'card', query).order_by('search_tier', 'search_rank', 'name')
+
+    def test_matches_are_not_capped(self):
+        self.assertEqual(self.search('dragon').count(), 1101)
+
+    def test_name_matches_rank_above_body_matches(self):
+        results = self.search('dragon')
+        self.assertEqual(results[0], self.name_match)
+        self.assertEqual(results[0].search_tier, 0)
+        self.assertEqual(results[1].search_tier, 1)
+
+    def test_every_word_must_be_in_the_name_for_the_name_tier(self):
+        results = list(self.search('dragon lore'))
+        self.assertEqual(results, [self.name_match])
+        self.assertEqual(results[0].search_tier, 1)
+
+    def test_basic_backend_ranks_the_same_way(self):
+        results = search.BasicBackend().join(Card.objects.all(), 'card', ['dragon'])
+        results = results.order_by('search_tier', 'search_rank', 'name')
+        self.assertEqual(results.count(), 1101)
+        self.assertEqual(results[0], self.name_match)
+        self.assertFalse(search.BasicBackend().join(Card.objects.all(), 'card', ['dragon_']).exists())
+
+    def test_empty_query_matches_nothing(self):
+        self.assertFalse(self.search('  !! ').exists())
+
+
+class AutocompleteTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.card_set = CardSet.objects.create(name='Legend of Blue Eyes', code='LOB', release_date=datetime.date(2002, 3, 8))
+        cls.card = make_card(cls.card_set, 'Dark Magician')
+        cls.other = make_card(cls.card_set, 'Mystical Elf')
+
+    def setUp(self):
+        cache.clear()
+        autocomplete._index = None
+        autocomplete._state.update(version=None, checked_at=0.0, synced_at=None)
+        self.addCleanup(setattr, autocomplete, '_index', None)
+
+    def shared_version(self):
+        return versioning.get_version(autocomplete.VERSION_KEY)
+
+    def delete_elsewhere(self, card, index):
+        """Delete as another worker would: this worker's index and version are not touched"""
+        version = autocomplete._state['version']
+        autocomplete._index = None
+        card.delete()
+        autocomplete._index = index
+        autocomplete._state.update(version=version, checked_at=0.0)
+
+    def test_only_name_changes_are_published(self):
+        card = Card.objects.get(pk=self.card.pk)
+        before = self.shared_version()
+        card.stock_quantity = 3
+        card.price = Decimal('12.00')
+        card.save()
+        card.save(update_fields=['stock_quantity'])
+        self.assertEqual(self.shared_version(), before)
+
+        card.name = 'Dark Magician Girl'
+        card.save()
+        self.assertEqual(self.shared_version(), before + 1)
+        card.save()
+        self.assertEqual(self.shared_version(), before + 1)
+
+    def test_sync_drops_cards_deleted_by_another_worker(self):
+        index = autocomplete.get_index()
+        self.assertIn(('card', self.other.pk), index.entries)
+        self.delete_elsewhere(self.other, index)
+
+        # One query for changed cards and one for the sets; no scan of every card id
+        with mock.patch.object(autocomplete, '_full_load') as full_load, self.assertNumQueries(2):
+            self.assertIs(autocomplete.get_index(), index)
+        full_load.assert_not_called()
+        self.assertNotIn(('card', self.other.pk), index.entries)
+        self.assertIn(('card', self.card.pk), index.entries)
+
+    def test_suggest_skips_entries_removed_meanwhile(self):
+        index = autocomplete.get_index()
+        removed = ('card', self.other.pk)
+        with mock.patch.object(index, 'suggest', return_value=[removed, ('card', self.card.pk)]):
+            index.remove(removed)
+            self.assertEqual([result['id'] for result in autocomplete.suggest('m')], [self.card.pk])
+
+    def test_missing_tombstone_forces_a_full_reload(self):
+        index = autocomplete.get_index()
+        self.delete_elsewhere(self.other, index)
+        cache.delete(autocomplete.REMOVED_KEY.format(self.shared_version()))
+
+        reloaded = autocomplete.get_index()
+        self.assertIsNot(reloaded, index)
+        self.assertNotIn(('card', self.other.pk), reloaded.entries)
+
+
+class PriceFacetTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        card_set = CardSet.objects.create(name='Metal Raiders', code='MRD', release_date=datetime.date(2002, 6, 26))
+        for price in ('49999.99', '50000', '99999.99', '100000'):
+            make_card(card_set, f'Card {price}', price=Decimal(price))
+
+    def setUp(self):
+        cache.clear()
+
+    def test_buckets_are_half_open_and_match_their_links(self):
+        cards = Card.objects.all()
+        price_facets = facets.card_facets(cards, QueryDict(), 'all')['price']
+        self.assertEqual([facet['count'] for facet in price_facets[:3]], [1, 2, 1])
+        for facet in price_facets:
+            link = QueryDict(facet['url'].lstrip('?'))
+            linked = cards.filter(price__gte=link['min_price'])
+            if 'max_price' in link:
+                linked = linked.filter(price__lte=link['max_price'])
+            self.assertEqual(linked.count(), facet['count'], facet['label'])
+
+    def test_buckets_follow_the_shop_currency(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            site = SiteSettings.get_settings(cached=False)
+            site.currency = 'USD'
+            site.save()
+        card_set = CardSet.objects.get()
+        for price in ('1.99', '2.00', '30', '60'):
+            make_card(card_set, f'Cheap {price}', price=Decimal(price))
+        price_facets = facets.card_facets(Card.objects.filter(name__startswith='Cheap'), QueryDict(), 'cheap')['price']
+        self.assertEqual([facet['count'] for facet in price_facets], [1, 1, 0, 0, 1, 1])
+        self.assertEqual(price_facets[1]['label'], '$2.00 - $5.00')
+        self.assertIn('max_price=4.99', price_facets[1]['url'])
+
+
+class ConditionalGetTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        card_set = CardSet.objects.create(name='Legend of Blue Eyes', code='LOB', release_date=datetime.date(2002, 3, 8))
+        cls.card = make_card(card_set, 'Dark Magician')
+        cls.user = User.objects.create_user('bob', password='pw')
+
+    def setUp(self):
+        cache.clear()
+
+    def test_card_detail_revalidates_by_etag_only(self):
+        url = reverse('card_detail', kwargs={'pk': self.card.pk})
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('Last-Modified', response)
+        etag = response['ETag']
+
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        # If-Modified-Since alone never gets a 304, whatever the date
+        self.assertEqual(self.client.get(url, HTTP_IF_MODIFIED_SINCE='Fri, 01 Jan 2100 00:00:00 GMT').status_code, 200)
+
+        self.client.login(username='bob', password='pw')
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_listing_etag_changes_only_when_the_edit_commits(self):
+        request = RequestFactory().get(reverse('card_list'))
+        request.user = AnonymousUser()
+        request._messages = []
+        before = conditional.card_list_etag(request)
+        with self.captureOnCommitCallbacks(execute=True):
+            with transaction.atomic():
+                card = Card.objects.get(pk=self.card.pk)
+                card.price = Decimal('99.00')
+                card.save()
+                # Another request now would still render the old price
+                self.assertEqual(conditional.card_list_etag(request), before)
+        self.assertNotEqual(conditional.card_list_etag(request), before)
+
+
+SHIPPING = {
+    'shipping_full_name': 'Bob', 'shipping_address': '1 Main St', 'shipping_city': 'Hanoi',
+    'shipping_state': 'HN', 'shipping_zip_code': '100000', 'shipping_phone': '0900000000',
+    'payment_method': 'credit_card',
+}
+
+
+class CheckoutTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        card_set = CardSet.objects.create(name='Legend of Blue Eyes', code='LOB', release_date=datetime.date(2002, 3, 8))
+        cls.magician = make_card(card_set, 'Dark Magician', price=Decimal('20.00'), stock_quantity=10)
+        cls.elf = make_card(card_set, 'Mystical Elf', price=Decimal('5.00'), stock_quantity=1)
+        cls.sleeves = OtherProduct.objects.create(
+            name='KMC Sleeves', product_type='sleeves', sku='KMC-1', price=Decimal('7.50'), stock_quantity=4,
+        )
+        cls.buyer = User.objects.create_user('bob', password='pw')
+        cls.rival = User.objects.create_user('alice', password='pw')
+
+    def setUp(self):
+        cache.clear()
+
+    def add_to_cart(self, user, quantity, card=None, other_product=None):
+        return CartItem.objects.create(user=user, card=card, other_product=other_product, quantity=quantity)
+
+    def stock(self, product):
+        return type(product).objects.values_list('stock_quantity', flat=True).get(pk=product.pk)
+
+
+class CheckoutTests(CheckoutTestCase):
+    def test_totals(self):
+        self.assertEqual(checkout.totals(Decimal('100.00')), (Decimal('8.50'), Decimal('0.00'), Decimal('108.50')))
+
+    def test_order_is_priced_from_the_cart(self):
+        self.add_to_cart(self.buyer, 2, card=self.magician)
+        self.add_to_cart(self.buyer, 1, other_product=self.sleeves)
+        order = checkout.place_order(self.buyer, SHIPPING)
+        self.assertEqual(order.subtotal, Decimal('47.50'))
+        self.assertEqual(order.tax + order.shipping_cost, order.total_amount - order.subtotal)
+        self.assertEqual((order.item_count, order.line_count), (3, 2))
+
+    def test_take_stock_rejects_oversell_and_rolls_back(self):
+        with self.assertRaises(checkout.InsufficientStock) as raised, transaction.atomic():
+            checkout.take_stock(Card, {self.magician.pk: 2, self.elf.pk: 3})
+        self.assertEqual((raised.exception.product.pk, raised.exception.available), (self.elf.pk, 1))
+        # The row that had enough stock was decremented by the same UPDATE, then rolled back
+        self.assertEqual(self.stock(self.magician), 10)
+        self.assertEqual(self.stock(self.elf), 1)
+
+    def test_oversold_cart_places_nothing(self):
+        self.add_to_cart(self.buyer, 2, card=self.magician)
+        self.add_to_cart(self.buyer, 2, card=self.elf)
+        with self.assertRaises(checkout.InsufficientStock):
+            checkout.place_order(self.buyer, SHIPPING)
+        self.assertFalse(Order.objects.exists())
+        self.assertEqual(CartItem.objects.filter(user=self.buyer).count(), 2)
+        self.assertEqual(self.stock(self.magician), 10)
+
+    def test_stock_held_by_another_user_is_not_available(self):
+        self.add_to_cart(self.rival, 8, card=self.magician)
+        checkout.reserve_cart(self.rival)
+        self.add_to_cart(self.buyer, 3, card=self.magician)
+        with self.assertRaises(checkout.InsufficientStock) as raised:
+            checkout.place_order(self.buyer, SHIPPING)
+        self.assertEqual(raised.exception.available, 2)
+        self.assertEqual(self.stock(self.magician), 10)
+
+    def test_failed_checkouts_do_not_use_order_numbers(self):
+        self.add_to_cart(self.buyer, 2, card=self.elf)
+        for _ in range(3):
+            with self.assertRaises(checkout.InsufficientStock):
+                checkout.place_order(self.buyer, SHIPPING, key=checkout.new_key())
+        CartItem.objects.filter(user=self.buyer).update(quantity=1)
+        order = checkout.place_order(self.buyer, SHIPPING, key=checkout.new_key())
+        self.assertEqual(order.order_number, order_numbers.format_number(timezone.localdate(), 1))
+
+    def test_order_clears_the_cart_and_releases_holds(self):
+        self.add_to_cart(self.buyer, 3, card=self.magician)
+        self.add_to_cart(self.buyer, 2, other_product=self.sleeves)
+        checkout.reserve_cart(self.buyer)
+        self.assertTrue(StockReservation.objects.filter(user=self.buyer).exists())
+
+        checkout.place_order(self.buyer, SHIPPING)
+        self.assertFalse(CartItem.objects.filter(user=self.buyer).exists())
+        self.assertFalse(StockReservation.objects.filter(user=self.buyer).exists())
+        self.assertEqual(self.stock(self.magician), 7)
+        self.assertEqual(self.stock(self.sleeves), 2)
+
+
+class IdempotentCheckoutTests(CheckoutTestCase):
+    def test_same_key_replays_the_order(self):
+        key = checkout.new_key()
+        self.add_to_cart(self.buyer, 2, card=self.magician)
+        first = checkout.place_order(self.buyer, SHIPPING, key=key)
+        self.assertFalse(first.replayed)
+
+        self.add_to_cart(self.buyer, 1, card=self.magician)
+        again = checkout.place_order(self.buyer, SHIPPING, key=key)
+        self.assertTrue(again.replayed)
+        self.assertEqual(again.pk, first.pk)
+        self.assertEqual(Order.objects.count(), 1)
+        # No second decrement, and the new cart line is left alone
+        self.assertEqual(self.stock(self.magician), 8)
+        self.assertEqual(CartItem.objects.filter(user=self.buyer).count(), 1)
+
+    def test_failed_attempt_frees_the_key(self):
+        key = checkout.new_key()
+        line = self.add_to_cart(self.buyer, 2, card=self.elf)
+        with self.assertRaises(checkout.InsufficientStock):
+            checkout.place_order(self.buyer, SHIPPING, key=key)
+        self.assertFalse(CheckoutKey.objects.filter(user=self.buyer, key=key).exists())
+
+        line.quantity = 1
+        line.save()
+        order = checkout.place_order(self.buyer, SHIPPING, key=key)
+        self.assertFalse(order.replayed)
+        self.assertEqual(CheckoutKey.objects.get(user=self.buyer, key=key).order, order)
+        self.assertEqual(self.stock(self.elf), 0)
+
+
+class ReservationTests(CheckoutTestCase):
+    def hold(self, user, quantity, minutes):
+        return StockReservation.objects.create(
+            user=user, card=self.magician, quantity=quantity,
+            expires_at=timezone.now() + datetime.timedelta(minutes=minutes),
+        )
+
+    def test_only_other_users_active_holds_count(self):
+        self.hold(self.rival, 3, minutes=5)
+        self.hold(self.buyer, 4, minutes=5)
+        self.hold(self.rival, 2, minutes=-1)  # expired
+        ids = [self.magician.pk]
+        self.assertEqual(reservations.held('card', ids, exclude_user=self.buyer), {self.magician.pk: 3})
+        self.assertEqual(reservations.held('card', ids), {self.magician.pk: 7})
+
+        # The buyer's own 4 do not reduce what they can buy: 10 - 3 = 7
+        self.add_to_cart(self.buyer, 7, card=self.magician)
+        checkout.place_order(self.buyer, SHIPPING)
+        self.assertEqual(self.stock(self.magician), 3)
+
+    def test_replace_swaps_the_users_holds(self):
+        self.hold(self.buyer, 1, minutes=5)
+        expires_at = reservations.replace(self.buyer, {'card': {self.magician.pk: 2}, 'other_product': {self.sleeves.pk: 1}})
+        holds = StockReservation.objects.filter(user=self.buyer)
+        self.assertEqual(sorted(holds.values_list('quantity', flat=True)), [1, 2])
+        self.assertEqual({hold.expires_at for hold in holds}, {expires_at})
+
+    def test_expire_deletes_only_expired_holds(self):
+        live = self.hold(self.rival, 1, minutes=5)
+        for minutes in (-1, -2, -3):
+            self.hold(self.rival, 1, minutes=minutes)
+        self.assertEqual(reservations.expire(batch_size=2), 3)
+        self.assertEqual(list(StockReservation.objects.values_list('pk', flat=True)), [live.pk])
+
+
+class CancelOrdersTests(CheckoutTestCase):
+    def order(self, *lines):
+        for quantity, product in lines:
+            field = 'card' if isinstance(product, Card) else 'other_product'
+            self.add_to_cart(self.buyer, quantity, **{field: product})
+        return checkout.place_order(self.buyer, SHIPPING)
+
+    def test_restocks_every_product_across_orders(self):
+        first = self.order((2, self.magician), (1, self.sleeves))
+        second = self.order((3, self.magician), (1, self.elf))
+        self.assertEqual(self.stock(self.magician), 5)
+
+        cancelled = checkout.cancel_orders(Order.objects.filter(pk__in=[first.pk, second.pk]))
+        self.assertEqual({order.pk for order in cancelled}, {first.pk, second.pk})
+        self.assertEqual(self.stock(self.magician), 10)
+        self.assertEqual(self.stock(self.elf), 1)
+        self.assertEqual(self.stock(self.sleeves), 4)
+        self.assertEqual(set(Order.objects.values_list('status', flat=True)), {'cancelled'})
+
+    def test_skips_orders_that_cannot_be_cancelled(self):
+        orders = [self.order((1, self.magician)) for _ in range(4)]
+        for order, status in zip(orders, ('shipped', 'delivered', 'cancelled')):
+            Order.objects.filter(pk=order.pk).update(status=status)
+
+        cancelled = checkout.cancel_orders(Order.objects.all())
+        self.assertEqual([order.pk for order in cancelled], [orders[3].pk])
+        self.assertEqual(self.stock(self.magician), 7)
+        self.assertEqual(checkout.cancel_orders(Order.objects.all()), [])
+        self.assertEqual(self.stock(self.magician), 7)
+
+    def test_ignores_lines_whose_product_was_deleted(self):
+        order = self.order((2, self.magician), (1, self.elf))
+        self.elf.delete()
+        self.assertEqual(checkout.cancel_orders(Order.objects.filter(pk=order.pk)), [order])
+        self.assertEqual(self.stock(self.magician), 10)
+
+
+class OrderItemCountTests(CheckoutTestCase):
+    def setUp(self):
+        super().setUp()
+        self.add_to_cart(self.buyer, 2, card=self.magician)
+        self.add_to_cart(self.buyer, 1, other_product=self.sleeves)
+        self.order = checkout.place_order(self.buyer, SHIPPING)
+
+    def counts(self, order=None):
+        return Order.objects.values_list('item_count', 'line_count').get(pk=(order or self.order).pk)
+
+    def test_checkout_stores_the_counts(self):
+        self.assertEqual(self.counts(), (3, 2))
+
+    def test_counts_follow_line_edits(self):
+        line = self.order.items.get(card=self.magician)
+        line.quantity = 5
+        line.save()
+        self.assertEqual(self.counts(), (6, 2))
+
+        OrderItem.objects.create(order=self.order, card=self.elf, product_name=self.elf.name,
+                                 quantity=1, price=self.elf.price)
+        self.assertEqual(self.counts(), (7, 3))
+
+        line.delete()
+        self.assertEqual(self.counts(), (2, 2))
+        self.order.items.all().delete()
+        self.assertEqual(self.counts(), (0, 0))
+
+    def test_cancelling_keeps_the_counts(self):
+        checkout.cancel_orders(Order.objects.filter(pk=self.order.pk))
+        self.assertEqual(Order.objects.get(pk=self.order.pk).status, 'cancelled')
+        self.assertEqual(self.counts(), (3, 2))
+
+    def test_backfill_command_recounts_every_order(self):
+        self.add_to_cart(self.buyer, 1, card=self.elf)
+        second = checkout.place_order(self.buyer, SHIPPING)
+        Order.objects.update(item_count=0, line_count=0)
+
+        out = io.StringIO()
+        call_command('backfill_order_counts', batch_size=1, stdout=out)
+        self.assertEqual(self.counts(), (3, 2))
+        self.assertEqual(self.counts(second), (1, 1))
+        self.assertIn('Recounted items on 2 orders', out.getvalue())
+
+
+class AdminOrderStatusTests(CheckoutTestCase):
+    def setUp(self):
+        super().setUp()
+        self.client.force_login(User.objects.create_user('admin', password='pw', is_staff=True))
+        self.add_to_cart(self.buyer, 2, card=self.magician)
+        self.order = checkout.place_order(self.buyer, SHIPPING)
+
+    def set_status(self, status):
+        response = self.client.post(
+            reverse('admin_dashboard:update_order_status', args=[self.order.pk]), {'status': status}, follow=True,
+        )
+        return [str(message) for message in response.context['messages']]
+
+    def test_cancelling_a_confirmed_order_restocks(self):
+        messages = self.set_status('cancelled')
+        self.assertEqual(Order.objects.get(pk=self.order.pk).status, 'cancelled')
+        self.assertEqual(self.stock(self.magician), 10)
+        self.assertIn('hoàn lại tồn kho', messages[0])
+
+    def test_cancelling_a_shipped_order_keeps_the_stock(self):
+        self.set_status('shipped')
+        messages = self.set_status('cancelled')
+        self.assertEqual(Order.objects.get(pk=self.order.pk).status, 'cancelled')
+        self.assertEqual(self.stock(self.magician), 8)
+        self.assertIn('KHÔNG hoàn lại tồn kho', messages[0])
+        self.assertFalse(StockMovement.objects.filter(reason='cancellation').exists())
+
+        self.set_status('cancelled')
+        self.assertEqual(self.stock(self.magician), 8)
+
+
+class StockLedgerTests(CheckoutTestCase):
+    def movements(self, **filters):
+        return list(StockMovement.objects.filter(**filters).values_list('reason', 'delta'))
+
+    def reconcile(self):
+        out = io.StringIO()
+        call_command('reconcile_stock', stdout=out)
+        return out.getvalue()
+
+    def test_sale_and_cancellation_write_one_movement_each(self):
+        self.add_to_cart(self.buyer, 2, card=self.magician)
+        self.add_to_cart(self.buyer, 1, card=self.magician)
+        self.add_to_cart(self.buyer, 1, other_product=self.sleeves)
+        order = checkout.place_order(self.buyer, SHIPPING)
+        self.assertEqual(self.movements(card=self.magician, order=order), [('sale', -3)])
+        self.assertEqual(self.movements(other_product=self.sleeves, order=order), [('sale', -1)])
+
+        checkout.cancel_orders(Order.objects.filter(pk=order.pk), user=self.rival)
+        self.assertEqual(self.movements(card=self.magician, reason='cancellation', user=self.rival), [('cancellation', 3)])
+        self.assertEqual(self.movements(other_product=self.sleeves, reason='cancellation'), [('cancellation', 1)])
+        self.assertIn('Stock matches the ledger', self.reconcile())
+
+    def test_admin_edit_writes_one_movement(self):
+        card = Card.objects.get(pk=self.magician.pk)
+        card.stock_quantity = 7
+        stock_ledger.changed_by(card, self.rival, note='Recount')
+        with transaction.atomic():
+            card.save()
+        self.assertEqual(
+            list(StockMovement.objects.filter(card=card, user=self.rival).values_list('reason', 'delta', 'note')),
+            [('adjustment', -3, 'Recount')],
+        )
+        # A save that leaves the stock alone writes nothing
+        card.price = Decimal('25.00')
+        card.save()
+        self.assertEqual(StockMovement.objects.filter(card=card).count(), 2)  # opening + adjustment
+        self.assertIn('Stock matches the ledger', self.reconcile())
+
+    def test_reconcile_reports_drift(self):
+        Card.objects.filter(pk=self.elf.pk).update(stock_quantity=5)
+        with self.assertRaises(CommandError):
+            self.reconcile()
+
+
+class BatchStockUpdateTests(CheckoutTestCase):
+    def setUp(self):
+        super().setUp()
+        self.staff = User.objects.create_user('admin', password='pw', is_staff=True)
+
+    def post(self, changes):
+        self.client.force_login(self.staff)
+        return self.client.post(
+            reverse('admin_dashboard:batch_update_stock'), {'changes': changes}, content_type='application/json',
+        )
+
+    def test_each_row_gets_its_own_result(self):
+        response = self.post([
+            {'card_id': self.magician.pk, 'delta': -4},
+            {'card_id': self.magician.pk, 'quantity': 3, 'delta': 1},
+            {'card_id': 999999, 'delta': 1},
+            {'card_id': self.elf.pk, 'delta': -2},
+            {'card_id': self.elf.pk, 'quantity': 6},
+            {'card_id': self.magician.pk, 'delta': 1},
+        ])
+        data = response.json()
+        self.assertFalse(data['success'])
+        self.assertEqual(
+            [(result['index'], result['success']) for result in data['results']],
+            [(0, True), (1, False), (2, False), (3, False), (4, True), (5, True)],
+        )
+        # Changes to one card apply in order; failed rows change nothing
+        self.assertEqual(data['results'][5]['stock_quantity'], 7)
+        self.assertEqual(self.stock(self.magician), 7)
+        self.assertEqual(self.stock(self.elf), 6)
+        self.assertEqual(
+            list(StockMovement.objects.filter(reason='adjustment', user=self.staff).order_by('card_id').values_list('delta', flat=True)),
+            [-3, 5],
+        )
+
+    def test_delta_keeps_a_sale_made_after_page_load(self):
+        # The page showed 10 and the admin counted 15 more; a checkout then sold 2
+        self.add_to_cart(self.buyer, 2, card=self.magician)
+        checkout.place_order(self.buyer, SHIPPING)
+        self.assertTrue(self.post([{'card_id': self.magician.pk, 'delta': 5}]).json()['success'])
+        self.assertEqual(self.stock(self.magician), 13)
+        # An absolute quantity overwrites the sale
+        self.post([{'card_id': self.magician.pk, 'quantity': 15}])
+        self.assertEqual(self.stock(self.magician), 15)
+
+    def test_parse_change_needs_exactly_one_of_quantity_and_delta(self):
+        self.assertEqual(warehouse.parse_change({'card_id': '3', 'delta': -2}), (3, 'delta', -2))
+        self.assertEqual(warehouse.parse_change({'card_id': 3, 'quantity': 0}), (3, 'quantity', 0))
+        for raw in ({'card_id': 3}, {'card_id': 3, 'quantity': 1, 'delta': 1}, {'card_id': 3, 'quantity': -1},
+                    {'card_id': 3, 'delta': 1.5}, {'card_id': True, 'delta': 1}, [3, 1]):
+            with self.assertRaises(warehouse.ChangeError, msg=raw):
+                warehouse.parse_change(raw)
+
+
+class ImporterTests(TestCase):
+    HEADER = 'name,card_type,rarity,card_set_code,condition,price,stock_quantity,attack\n'
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.card_set = CardSet.objects.create(name='Legend of Blue Eyes', code='LOB', release_date=datetime.date(2002, 3, 8))
+        cls.magician = make_card(cls.card_set, 'Dark Magician', stock_quantity=10)
+
+    def setUp(self):
+        cache.clear()
+
+    def run_import(self, rows, size=None):
+        return importer.import_cards(io.StringIO(self.HEADER + ''.join(row + '\n' for row in rows)), size=size)
+
+    def test_existing_card_is_updated_in_place(self):
+        result = self.run_import(['Dark Magician,monster,common,lob,near_mint,30.00,4,2500'])
+        self.assertEqual((result.created, result.updated, result.failed), (0, 1, 0))
+        card = Card.objects.get()
+        self.assertEqual((card.pk, card.price, card.stock_quantity, card.attack), (self.magician.pk, Decimal('30.00'), 4, 2500))
+        self.assertEqual(list(StockMovement.objects.filter(reason='import').values_list('delta', flat=True)), [-6])
+
+    def test_row_errors_report_their_line(self):
+        result = self.run_import([
+            'Mystical Elf,monster,common,LOB,near_mint,5,3,800',
+            'Bad Price,monster,common,LOB,near_mint,abc,3,',
+            'Trap Hole,trap,common,XXX,near_mint,5,3,',
+            'Sogen,spell,common,LOB,mint,2.50,-1,',
+        ])
+        self.assertEqual((result.rows, result.created, result.failed), (4, 1, 3))
+        self.assertEqual([line for line, _ in result.errors], [3, 4, 5])
+        self.assertIn('price', result.errors[0][1])
+        self.assertIn('XXX', result.errors[1][1])
+        self.assertFalse(Card.objects.filter(name__in=['Bad Price', 'Trap Hole', 'Sogen']).exists())
+
+    def test_missing_columns_reject_the_file(self):
+        with self.assertRaises(importer.CSVFormatError):
+            importer.import_cards(io.StringIO('name,price\nDark Magician,1\n'))
+
+    def test_batches_and_one_bump_per_batch(self):
+        rows = [f'Card {number},spell,common,LOB,near_mint,1.00,{number},' for number in range(4)]
+        # Cards written by the first batch
+        rows += ['Card 0,spell,common,LOB,near_mint,1.00,9,', 'Card 1,spell,common,LOB,near_mint,1.00,8,']
+        catalog_before = catalog.get_version()
+        autocomplete_before = versioning.get_version(autocomplete.VERSION_KEY)
+        with self.captureOnCommitCallbacks(execute=True):
+            result = self.run_import(rows, size=2)
+
+        self.assertEqual((result.rows, result.created, result.updated), (6, 4, 2))
+        self.assertEqual(Card.objects.get(name='Card 0').stock_quantity, 9)
+        # Three batches of 2 rows: one catalog bump each, and one autocomplete bump for
+        # each batch that created cards (the last one only updates)
+        self.assertEqual(catalog.get_version() - catalog_before, 3)
+        self.assertEqual(versioning.get_version(autocomplete.VERSION_KEY) - autocomplete_before, 2)
+
+    def test_database_rejects_a_second_copy_of_a_card(self):
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            make_card(self.card_set, 'Dark Magician')
+        make_card(self.card_set, 'Dark Magician', condition='lightly_played')
+
+    def test_card_missed_by_the_lookup_is_updated_not_duplicated(self):
+        # As if another writer added the card between the lookup and the upsert
+        with mock.patch.object(Card.objects, 'select_for_update', return_value=Card.objects.none()):
+            result = self.run_import(['Dark Magician,monster,common,LOB,near_mint,30.00,4,2500'])
+        self.assertEqual(result.failed, 0)
+        card = Card.objects.get()
+        self.assertEqual((card.pk, card.stock_quantity, card.attack), (self.magician.pk, 4, 2500))
+
+
+class NavbarDataTests(CheckoutTestCase):
+    def cached_count(self):
+        return cache.get(navbar_data.CART_COUNT_KEY.format(self.buyer.pk))
+
+    def test_cart_count_follows_cart_views(self):
+        self.client.force_login(self.buyer)
+        self.assertEqual(navbar_data.get_cart_count(self.buyer), 0)
+
+        self.client.post(reverse('add_to_cart', kwargs={'pk': self.magician.pk}), {'quantity': 2})
+        self.assertEqual(self.cached_count(), 2)
+        self.client.get(reverse('add_other_product_to_cart', kwargs={'pk': self.sleeves.pk}))
+        self.assertEqual(self.cached_count(), 3)
+
+        line = CartItem.objects.get(user=self.buyer, card=self.magician)
+        self.client.post(reverse('update_cart_quantity', kwargs={'pk': line.pk}), {'quantity': 5})
+        self.assertEqual(self.cached_count(), 6)
+        self.client.post(reverse('remove_from_cart', kwargs={'pk': line.pk}))
+        self.assertEqual(self.cached_count(), 1)
+
+        self.client.get(reverse('checkout'))
+        response = self.client.post(reverse('process_checkout'), {
+            'full_name': 'Bob', 'address': '1 Main St', 'city': 'Hanoi', 'state': 'HN',
+            'zip_code': '100000', 'phone': '0900000000', 'checkout_key': checkout.new_key(),
+        })
+        self.assertTrue(Order.objects.filter(user=self.buyer).exists(), response)
+        self.assertEqual(self.cached_count(), 0)
+
+    def test_card_set_menu_is_invalidated_after_commit(self):
+        self.assertEqual(len(navbar_data.get_card_sets()), 1)
+        with self.captureOnCommitCallbacks(execute=True):
+            with transaction.atomic():
+                CardSet.objects.create(name='Metal Raiders', code='MRD', release_date=datetime.date(2002, 6, 26))
+                # Still the committed list: a render here must not cache the new set too early
+                self.assertIsNotNone(cache.get(navbar_data.CARD_SETS_KEY))
+        self.assertEqual([card_set.code for card_set in navbar_data.get_card_sets()], ['MRD', 'LOB'])
+
+
+class LazyContextTests(CheckoutTestCase):
+    def request(self):
+        request = RequestFactory().get('/')
+        request.user = self.buyer
+        request.context_usage = context_processors.ContextUsage()
+        return request
+
+    def render(self, source, context):
+        return Template(source).render(Context(context))
+
+    def test_unread_values_cost_no_queries(self):
+        request = self.request()
+        with self.assertNumQueries(0):
+            context = context_processors.card_sets_processor(request)
+            self.render('<nav>{{ all_product_types|length }}</nav>', context)
+        self.assertEqual(request.context_usage.resolved, [])
+        self.assertEqual(request.context_usage.provided, ['all_card_sets', 'cart_count'])
+
+    def test_values_are_looked_up_when_read(self):
+        self.add_to_cart(self.buyer, 2, card=self.magician)
+        request = self.request()
+        context = context_processors.card_sets_processor(request)
+        with self.assertNumQueries(1):
+            self.assertEqual(self.render('{{ cart_count }}', context), '2')
+        with self.assertNumQueries(1):
+            self.assertEqual(self.render('{% for s in all_card_sets %}{{ s.code }}{% endfor %}', context), 'LOB')
+        self.assertEqual(request.context_usage.resolved, ['cart_count', 'all_card_sets'])
+
+
+class KeysetPaginationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        # Two sets released the same day, and repeated names (in other conditions), prices
+        # and timestamps, so every ordering has ties that only the later keys and the pk break
+        first = CardSet.objects.create(name='Legend of Blue Eyes', code='LOB', release_date=datetime.date(2002, 3, 8))
+        second = CardSet.objects.create(name='Metal Raiders', code='MRD', release_date=datetime.date(2002, 3, 8))
+        conditions = [value for value, _ in Card.CONDITION_CHOICES]
+        for number in range(11):
+            make_card(
+                (first, second)[number % 2], f'Card {number % 4}', condition=conditions[number // 4],
+                price=Decimal(5 + number % 3), stock_quantity=number + 1,
+            )
+        stamp = timezone.now()
+        Card.objects.filter(pk__in=Card.objects.order_by('pk').values('pk')[:6]).update(created_at=stamp)
+
+    def walk(self, queryset, per_page=3):
+        """Ids of every page forwards, then of every page backwards from the last one"""
+        page = pagination.cursor_page(queryset, per_page)
+        forward = [card.pk for card in page]
+        while page.has_next():
+            page = pagination.cursor_page(queryset, per_page, page.next_token)
+            forward += [card.pk for card in page]
+        backward = [card.pk for card in page]
+        while page.has_previous():
+            page = pagination.cursor_page(queryset, per_page, page.previous_token)
+            backward = [card.pk for card in page] + backward
+        return forward, backward
+
+    def test_every_ordering_pages_through_ties_both_ways(self):
+        for key in CARD_ORDERINGS:
+            with self.subTest(ordering=key):
+                queryset = order_queryset(Card.objects.all(), CARD_ORDERINGS, key)
+                self.assertIsNotNone(pagination.keyset_fields(queryset))
+                expected = list(queryset.values_list('pk', flat=True))
+                forward, backward = self.walk(queryset)
+                self.assertEqual(forward, expected)
+                self.assertEqual(backward, expected)
+
+    def test_seek_predicate_breaks_ties_on_later_keys(self):
+        keys = [('price', False), ('pk', False)]
+        condition = pagination._seek(keys, ['6', 4], reverse=False)
+        matched = Card.objects.filter(condition)
+        self.assertTrue(all(
+            card.price > 6 or (card.price == 6 and card.pk > 4) for card in matched
+        ))
+        self.assertEqual(matched.count(), Card.objects.filter(Q(price__gt=6) | Q(price=6, pk__gt=4)).count())
+
+    def test_tampered_and_stale_tokens_are_rejected(self):
+        by_name = order_queryset(Card.objects.all(), CARD_ORDERINGS, 'name')
+        by_price = order_queryset(Card.objects.all(), CARD_ORDERINGS, 'price')
+        token = pagination.cursor_page(by_name, 3).next_token
+        self.assertIsNone(pagination.cursor_page(by_name, 3, token[:-2] + 'xx'))
+        # Issued for another ordering (the sort was changed after the link was made)
+        self.assertIsNone(pagination.cursor_page(by_price, 3, token))
+
+        request = RequestFactory().get('/', {'cursor': 'garbage', 'page': '2'})
+        page = pagination.paginate(request, by_name, 3)
+        self.assertFalse(getattr(page, 'is_cursor', False))
+        self.assertEqual(page.number, 2)
+
+    def test_set_release_sort_reads_only_the_card_table(self):
+        queryset = order_queryset(Card.objects.filter(stock_quantity__gt=0), CARD_ORDERINGS, 'set_release')
+        self.assertNotIn('JOIN', str(queryset.query))
+
+    def test_release_date_follows_the_set(self):
+        later = CardSet.objects.create(name='Spell Ruler', code='SRL', release_date=datetime.date(2002, 9, 1))
+        card = Card.objects.get(pk=Card.objects.order_by('pk')[0].pk)
+        card.card_set = later
+        card.save(update_fields=['card_set'])
+        self.assertEqual(Card.objects.get(pk=card.pk).set_release_date, later.release_date)
+
+        later.release_date = datetime.date(2003, 1, 1)
+        later.save()
+        self.assertEqual(Card.objects.get(pk=card.pk).set_release_date, datetime.date(2003, 1, 1))
+        first = order_queryset(Card.objects.all(), CARD_ORDERINGS, 'set_release')[0]
+        self.assertEqual(first.pk, card.pk)
+
+    def test_unkeyable_orderings_keep_numbered_pages(self):
+        self.assertIsNone(pagination.keyset_fields(Card.objects.order_by('?')))
+        self.assertIsNone(pagination.keyset_fields(Card.objects.order_by('attack')))  # nullable
+        ranked = search.filter_queryset(Card.objects.all(), 'card', 'card').order_by('search_tier', 'search_rank')
+        self.assertIsNone(pagination.keyset_fields(ranked))
+
+
+class CountTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        card_set = CardSet.objects.create(name='Legend of Blue Eyes', code='LOB', release_date=datetime.date(2002, 3, 8))
+        for number in range(5):
+            make_card(card_set, f'Card {number}')
+
+    def setUp(self):
+        cache.clear()
+
+    def test_count_is_cached_per_catalog_version(self):
+        cards = Card.objects.filter(stock_quantity__gt=0)
+        with self.assertNumQueries(1):
+            self.assertEqual(counts.get_count(cards), 5)
+        with self.assertNumQueries(0):
+            self.assertEqual(counts.get_count(cards.order_by('-price')), 5)
+        catalog.bump_version()
+        with self.assertNumQueries(1):
+            self.assertEqual(counts.get_count(cards), 5)
+
+    def test_bounded_count_stops_at_the_limit(self):
+        cards = Card.objects.all()
+        self.assertEqual(counts.bounded_count(cards, 3), 4)
+        # Over the limit is not an exact count, so it is not cached
+        with self.assertNumQueries(1):
+            self.assertEqual(counts.bounded_count(cards, 10), 5)
+        with self.assertNumQueries(0):
+            self.assertEqual(counts.bounded_count(cards, 10), 5)
+
+    def test_planner_estimate_replaces_the_count(self):
+        self.assertIsNone(counts.estimated_count(Card.objects.all()))  # not PostgreSQL
+        with mock.patch.object(counts, 'estimated_count', return_value=250000), self.assertNumQueries(0):
+            paginator = counts.CachedCountPaginator(Card.objects.all(), 20)
+            self.assertEqual(paginator.count, 250000)
+            self.assertEqual(paginator.num_pages, 12500)
+
+
+class HomepageSnapshotTests(CheckoutTestCase):
+    def test_snapshot_is_reused_until_a_card_save_commits(self):
+        with self.assertNumQueries(7):
+            first = homepage.get_snapshot()
+        with self.assertNumQueries(0):
+            self.assertEqual(homepage.get_snapshot()['snapshot_built_at'], first['snapshot_built_at'])
+        self.assertEqual(first['total_cards_available'], 2)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            with transaction.atomic():
+                Card.objects.filter(pk=self.elf.pk).update(stock_quantity=0)
+                card = Card.objects.get(pk=self.elf.pk)
+                card.save()
+                # Not yet: a rebuild here would cache the rows from before the commit
+                self.assertIsNotNone(cache.get(homepage.SNAPSHOT_KEY))
+        self.assertIsNone(cache.get(homepage.SNAPSHOT_KEY))
+        self.assertEqual(homepage.get_snapshot()['total_cards_available'], 1)
+
+    def test_home_page_is_served_from_the_snapshot(self):
+        self.assertEqual(self.client.get(reverse('home')).status_code, 200)
+        with mock.patch.object(homepage, 'build_snapshot') as build:
+            self.assertContains(self.client.get(reverse('home')), 'Dark Magician')
+        build.assert_not_called()
+
+
+class CardFragmentTests(CheckoutTestCase):
+    def render(self, user=None):
+        return str(fragments.render_card_grid(Card.objects.filter(pk=self.magician.pk), user or AnonymousUser()))
+
+    def test_key_covers_everything_the_markup_shows(self):
+        card = Card.objects.get(pk=self.magician.pk)
+        key = fragments.fragment_key(card, False, 'VND')
+        self.assertEqual(fragments.fragment_key(Card.objects.get(pk=card.pk), False, 'VND'), key)
+        variants = [
+            fragments.fragment_key(card, True, 'VND'),
+            fragments.fragment_key(card, False, 'USD'),
+        ]
+        for field, value in (('price', Decimal('21.00')), ('stock_quantity', 0),
+                             ('updated_at', card.updated_at + datetime.timedelta(seconds=1))):
+            changed = Card.objects.get(pk=card.pk)
+            setattr(changed, field, value)
+            variants.append(fragments.fragment_key(changed, False, 'VND'))
+        self.assertEqual(len({key, *variants}), len(variants) + 1)
+
+    def test_bulk_price_and_stock_updates_render_fresh(self):
+        self.assertIn('20₫', self.render())
+        with self.assertNumQueries(1):
+            self.render()  # the card query only; the fragment comes from the cache
+
+        # QuerySet.update() leaves updated_at alone; price and stock are in the key anyway
+        Card.objects.filter(pk=self.magician.pk).update(price=Decimal('35.00'), stock_quantity=0)
+        html = self.render()
+        self.assertIn('35₫', html)
+        self.assertIn('Hết hàng', html)
+
+    def test_currency_and_login_get_their_own_fragments(self):
+        anonymous = self.render()
+        self.assertNotEqual(self.render(self.buyer), anonymous)
+        with self.captureOnCommitCallbacks(execute=True):
+            site = SiteSettings.get_settings(cached=False)
+            site.currency = 'USD'
+            site.save()
+        self.assertIn('$20.00', self.render())
+
+
+class RelatedItemTests(CheckoutTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.trap_hole = make_card(cls.magician.card_set, 'Trap Hole', card_type='trap')
+        other_set = CardSet.objects.create(name='Metal Raiders', code='MRD', release_date=datetime.date(2002, 6, 26))
+        cls.kuriboh = make_card(other_set, 'Kuriboh')
+
+    def test_same_set_and_type_rank_first(self):
+        related.rebuild()
+        self.assertEqual(related.related_cards(self.magician), [self.elf, self.trap_hole])
+
+    def test_co_purchases_outrank_set_and_type(self):
+        CoPurchase.objects.create(item_kind='card', item_id=self.magician.pk, other_kind='card',
+                                  other_id=self.kuriboh.pk, orders=3, rank=0)
+        related.rebuild()
+        self.assertEqual(related.related_cards(self.magician), [self.kuriboh, self.elf, self.trap_hole])
+        # Only the magician's own pairs count; the reverse direction is a separate row
+        self.assertEqual(related.related_cards(self.kuriboh), [])
+
+
+class CoPurchaseTests(CheckoutTestCase):
+    def order(self, *products):
+        for product in products:
+            field = 'card' if isinstance(product, Card) else 'other_product'
+            self.add_to_cart(self.buyer, 1, **{field: product})
+        return checkout.place_order(self.buyer, SHIPPING)
+
+    def pairs(self):
+        return list(CoPurchase.objects.order_by('item_kind', 'item_id', 'rank').values_list(
+            'item_kind', 'item_id', 'other_kind', 'other_id', 'orders', 'rank'))
+
+    def counts(self, model):
+        matrix = model.matrix.tocoo()
+        return {
+            (int(model.codes[row]), int(model.codes[column])): int(count)
+            for row, column, count in zip(matrix.row, matrix.col, matrix.data)
+        }
+
+    def test_counts_orders_containing_both_items(self):
+        model = copurchase.CoPurchaseModel()
+        # Codes: 2 = card 1, 4 = card 2, 3 = product 1; order 2 lists card 1 twice, order 3 has one item
+        model.add_lines(np.array([1, 1, 1, 2, 2, 2, 3]), np.array([2, 4, 3, 2, 3, 2, 4]))
+        self.assertEqual(self.counts(model), {
+            (2, 4): 1, (4, 2): 1,
+            (2, 3): 2, (3, 2): 2,
+            (4, 3): 1, (3, 4): 1,
+        })
+        self.assertEqual(model.last_order_id, 3)
+
+    def test_update_matches_a_full_build(self):
+        self.order(self.magician, self.elf)
+        with tempfile.TemporaryDirectory() as directory:
+            incremental = f'{directory}/incremental.npz'
+            copurchase.build(incremental)
+            self.assertEqual(self.pairs(), [
+                ('card', self.magician.pk, 'card', self.elf.pk, 1, 0),
+                ('card', self.elf.pk, 'card', self.magician.pk, 1, 0),
+            ])
+
+            # The sleeves get a column after the elf here, but before it in a full build
+            self.order(self.sleeves, self.magician)
+            self.order(self.sleeves)
+            checkout.cancel_orders(Order.objects.filter(pk=self.order(self.magician, self.sleeves).pk))
+            updated = copurchase.update(incremental)
+            incremental_pairs = self.pairs()
+
+            full = copurchase.build(f'{directory}/full.npz')
+            self.assertEqual(self.counts(updated), self.counts(full))
+            self.assertEqual(incremental_pairs, self.pairs())
+            self.assertEqual(copurchase.CoPurchaseModel.load(incremental).last_order_id, updated.last_order_id)
@@ -24,6 +24,7 @@ urlpatterns = [
     # Main pages
     path('', views.home, name='home'),
     path('cards/', views.card_list, name='card_list'),
+    path('cards/autocomplete/', views.card_autocomplete, name='card_autocomplete'),
     path('card-detail/<int:pk>/', views.card_detail, name='card_detail'),
     
     # List view (no pk required)
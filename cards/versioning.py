@@ -0,0 +1,31 @@
+"""
+Version counters in the shared cache.
+
+A counter is one integer key that every worker reads; bumping it retires whatever the
+workers derived from the old value (settings copies, catalog caches, the autocomplete
+index). Counters are seeded from the clock, so a cleared or restarted cache never hands
+out a version that was already used.
+"""
+import time
+
+from django.core.cache import cache
+
+
+def get_version(key):
+    """Return the counter's current value, initialising it if missing"""
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, time.time_ns(), timeout=None)
+        version = cache.get(key)
+    return version
+
+
+def bump_version(key):
+    """Increment the counter and return the new value"""
+    try:
+        return cache.incr(key)
+    except ValueError:
+        # The key was evicted; start again from the clock
+        version = time.time_ns()
+        cache.set(key, version, timeout=None)
+        return version
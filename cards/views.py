@@ -4,51 +4,27 @@ from django.shortcuts import render, get_object_or_404, redirect
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
 from django.db.models import Q
-from django.core.paginator import Paginator
-from django.http import QueryDict
-from .models import Card, CardSet, CartItem, OtherProduct, Order, OrderItem
-from django.db import transaction
-from decimal import Decimal
+from django.http import JsonResponse
+from django.views.decorators.http import condition
+from .models import Card, CardSet, CartItem, OtherProduct, Order
 from django.contrib.auth.models import User
 from django.contrib.auth.forms import UserCreationForm
 from django import forms
 from .forms import OtherProductForm
+from . import autocomplete, conditional, homepage, recommendations, related, search
+from . import checkout as checkout_service
+from .currency import attach_price_display
+from .facets import card_facets, filter_key
+from .navbar_data import adjust_cart_count, reset_cart_count
+from .ordering import (
+    CARD_ORDERINGS, OTHER_PRODUCT_ORDERINGS, order_queryset, ordering_choices, resolve_ordering,
+)
+from .pagination import paginate, query_params
 
 def home(request):
     """Enhanced homepage view with featured cards and other products"""
-    from .models import HeroSlider
-    
-    # Get featured cards (in stock only)
-    featured_cards = Card.objects.filter(stock_quantity__gt=0).select_related('card_set')[:8]
-    
-    # Get active hero slider images ordered by order field
-    hero_slides = HeroSlider.objects.filter(is_active=True).order_by('order')[:10]
-    
-    # Get featured accessories/other products (optional)
-    featured_accessories = OtherProduct.objects.filter(
-        stock_quantity__gt=0, 
-        is_active=True
-    ).order_by('-created_at')[:4]
-    
-    # Get new arrivals (recently added cards)
-    new_arrivals = Card.objects.filter(stock_quantity__gt=0).select_related('card_set').order_by('-created_at')[:8]
-    
-    # Get new card sets (latest 8 card sets)
-    new_card_sets = CardSet.objects.all().order_by('-release_date')[:8]
-    
-    # Get some statistics for the homepage
-    total_cards_available = Card.objects.filter(stock_quantity__gt=0).count()
-    total_accessories = OtherProduct.objects.filter(stock_quantity__gt=0, is_active=True).count()
-    
-    context = {
-        'featured_cards': featured_cards,
-        'hero_slides': hero_slides,  # Changed from latest_sets
-        'featured_accessories': featured_accessories,
-        'new_arrivals': new_arrivals,
-        'new_card_sets': new_card_sets,
-        'total_cards_available': total_cards_available,
-        'total_accessories': total_accessories,
-    }
+    # Lists and counts come from the cached snapshot (see homepage.py)
+    context = homepage.get_snapshot()
     return render(request, 'home.html', context)
 
 
@@ -59,11 +35,7 @@ def other_products_list(request):
     # Search functionality
     query = request.GET.get('q', '')
     if query:
-        products = products.filter(
-            Q(name__icontains=query) | 
-            Q(description__icontains=query) |
-            Q(brand__icontains=query)
-        )
+        products = search.filter_queryset(products, 'other_product', query)
     
     # Filter by product type
     product_type = request.GET.get('type', '')
@@ -84,31 +56,29 @@ def other_products_list(request):
         products = products.filter(price__lte=max_price)
     
     # Ordering
-    ordering = request.GET.get('ordering', '')
+    # Ordering: only whitelisted, index-backed sorts
+    ordering = resolve_ordering(OTHER_PRODUCT_ORDERINGS, request.GET.get('ordering', ''))
     if ordering:
-        products = products.order_by(ordering)
+        products = order_queryset(products, OTHER_PRODUCT_ORDERINGS, ordering)
+    elif query:
+        products = products.order_by('search_tier', 'search_rank', 'name')
     else:
-        products = products.order_by('name')
+        products = order_queryset(products, OTHER_PRODUCT_ORDERINGS, 'name')
     
     # Pagination
-    paginator = Paginator(products, 12)  # 12 products per page
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    # Cursor pages for large result sets, numbered pages for small ones
+    page_obj = paginate(request, products, 12)  # 12 products per page
     
     # Get filter options for the template
     product_types = OtherProduct.objects.values_list('product_type', flat=True).distinct()
     brands = OtherProduct.objects.exclude(brand='').values_list('brand', flat=True).distinct()
     
-    # Build query parameters for pagination links
-    query_params = QueryDict(mutable=True)
-    for key, value in request.GET.items():
-        if key != 'page' and value:
-            query_params[key] = value
-    
     context = {
         'page_obj': page_obj,
         'products': page_obj,
         'query': query,
+        'ordering': ordering,
+        'ordering_choices': ordering_choices(OTHER_PRODUCT_ORDERINGS),
         'selected_type': product_type,
         'selected_brand': brand,
         'min_price': min_price,
@@ -116,20 +86,23 @@ def other_products_list(request):
         'product_types': product_types,
         'brands': brands,
         'product_type_choices': OtherProduct.PRODUCT_TYPE_CHOICES,
-        'query_params': query_params.urlencode(),
+        'query_params': query_params(request),
     }
     return render(request, 'other_products/other_products_list.html', context)
 
+@condition(etag_func=conditional.product_detail_etag)
 def other_products_detail(request, pk):
     """Display individual other product details"""
     product = get_object_or_404(OtherProduct, pk=pk, is_active=True)
     
-    # Get related products (same type or brand)
-    related_products = OtherProduct.objects.filter(
-        Q(product_type=product.product_type) | Q(brand=product.brand),
-        is_active=True,
-        stock_quantity__gt=0
-    ).exclude(pk=product.pk)[:4]
+    # Precomputed neighbours; products the job has not scored yet use same type or brand
+    related_products = related.related_products(product)
+    if not related_products:
+        related_products = OtherProduct.objects.filter(
+            Q(product_type=product.product_type) | Q(brand=product.brand),
+            is_active=True,
+            stock_quantity__gt=0
+        ).exclude(pk=product.pk)[:4]
     
     context = {
         'product': product,
@@ -157,6 +130,7 @@ def add_other_product_to_cart(request, pk):
         return redirect(next_url)
     return redirect('other_product_detail', pk=pk)
 
+@condition(etag_func=conditional.card_list_etag)
 def card_list(request):
     """Display all cards with filtering and search"""
     cards = Card.objects.filter(stock_quantity__gt=0).select_related('card_set')
@@ -164,10 +138,16 @@ def card_list(request):
     # Search functionality
     query = request.GET.get('q', '')
     if query:
-        cards = cards.filter(
-            Q(name__icontains=query) | 
-            Q(description__icontains=query)
-        )
+        cards = search.filter_queryset(cards, 'card', query)
+    
+    # Price range filter
+    min_price = request.GET.get('min_price', '')
+    max_price = request.GET.get('max_price', '')
+    if min_price:
+        cards = cards.filter(price__gte=min_price)
+    if max_price:
+        cards = cards.filter(price__lte=max_price)
+    facet_base = cards
     
     # Filter by card type
     card_type = request.GET.get('type', '')
@@ -197,39 +177,40 @@ def card_list(request):
             # If set doesn't exist, show all cards
             pass
     
-    # Price range filter
-    min_price = request.GET.get('min_price', '')
-    max_price = request.GET.get('max_price', '')
-    if min_price:
-        cards = cards.filter(price__gte=min_price)
-    if max_price:
-        cards = cards.filter(price__lte=max_price)
+    # Facet counts (type, rarity, set, price bucket) for the filters picked so far
+    facets = card_facets(
+        facet_base, request.GET, filter_key(query, min_price, max_price),
+        selected_type=card_type, selected_rarity=rarity,
+        selected_set=selected_card_set.id if selected_card_set else None,
+    )
     
     # Ordering
-    ordering = request.GET.get('ordering', '')
+    # Ordering: only whitelisted, index-backed sorts
+    ordering = resolve_ordering(CARD_ORDERINGS, request.GET.get('ordering', ''))
     if ordering:
-        cards = cards.order_by(ordering)
+        cards = order_queryset(cards, CARD_ORDERINGS, ordering)
+    elif query:
+        cards = cards.order_by('search_tier', 'search_rank', 'name')
     else:
-        cards = cards.order_by('name')
+        cards = order_queryset(cards, CARD_ORDERINGS, 'name')
     
     # Pagination
-    paginator = Paginator(cards, 12)  # 12 cards per page
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    # Cursor pages for large result sets, numbered pages for small ones
+    page_obj = paginate(request, cards, 12)  # 12 cards per page
+    
+    # Format the whole page of prices in one pass
+    attach_price_display(page_obj)
     
     # Get filter options
     card_sets = CardSet.objects.all()
     
-    # Build query parameters for pagination links
-    query_params = QueryDict(mutable=True)
-    for key, value in request.GET.items():
-        if key != 'page' and value:
-            query_params[key] = value
-    
     context = {
         'page_obj': page_obj,
         'card_sets': card_sets,
+        'facets': facets,
         'query': query,
+        'ordering': ordering,
+        'ordering_choices': ordering_choices(CARD_ORDERINGS),
         'selected_type': card_type,
         'selected_rarity': rarity,
         'selected_set': card_set_param,  # Keep the original param
@@ -238,21 +219,38 @@ def card_list(request):
         'max_price': max_price,
         'card_type_choices': Card.CARD_TYPE_CHOICES,
         'rarity_choices': Card.RARITY_CHOICES,
-        'query_params': query_params.urlencode(),
+        'query_params': query_params(request),
     }
     return render(request, 'cards/card_list.html', context)
 
+def card_autocomplete(request):
+    """JSON suggestions for card and card set names (typo tolerant)"""
+    query = request.GET.get('q', '').strip()
+    try:
+        limit = int(request.GET.get('limit', 8))
+    except ValueError:
+        limit = 8
+    limit = max(1, min(limit, autocomplete.TOP_K))
+    
+    suggestions = autocomplete.suggest(query, limit) if query else []
+    return JsonResponse({'query': query, 'suggestions': suggestions})
+
+@condition(etag_func=conditional.card_detail_etag)
 def card_detail(request, pk):
     """Display individual card details"""
     card = get_object_or_404(Card, pk=pk)
-    related_cards = Card.objects.filter(
-        card_set=card.card_set,
-        stock_quantity__gt=0
-    ).exclude(pk=card.pk)[:4]
+    # Precomputed neighbours; cards the job has not scored yet use the same set
+    related_cards = related.related_cards(card)
+    if not related_cards:
+        related_cards = Card.objects.filter(
+            card_set=card.card_set,
+            stock_quantity__gt=0
+        ).exclude(pk=card.pk)[:4]
     
     context = {
         'card': card,
         'related_cards': related_cards,
+        'bought_together': recommendations.for_item('card', card.pk),
     }
     return render(request, 'cards/card_detail.html', context)
 
@@ -282,12 +280,16 @@ def add_to_cart(request, pk):
             defaults={'quantity': quantity}
         )
         
-        if not created:
+        if created:
+            adjust_cart_count(request.user, quantity)
+        else:
             # Item already exists, update quantity
+            old_quantity = cart_item.quantity
             cart_item.quantity += quantity
             if cart_item.quantity > product.stock_quantity:
                 cart_item.quantity = product.stock_quantity
             cart_item.save()
+            adjust_cart_count(request.user, cart_item.quantity - old_quantity)
             
     else:  # card
         product = get_object_or_404(Card, pk=pk)
@@ -304,12 +306,16 @@ def add_to_cart(request, pk):
             defaults={'quantity': quantity}
         )
         
-        if not created:
+        if created:
+            adjust_cart_count(request.user, quantity)
+        else:
             # Item already exists, update quantity
+            old_quantity = cart_item.quantity
             cart_item.quantity += quantity
             if cart_item.quantity > product.stock_quantity:
                 cart_item.quantity = product.stock_quantity
             cart_item.save()
+            adjust_cart_count(request.user, cart_item.quantity - old_quantity)
     
     messages.success(request, f'Đã thêm {product.name} vào giỏ hàng!')
     return redirect(request.META.get('HTTP_REFERER', 'home'))
@@ -341,11 +347,15 @@ def add_other_product_to_cart(request, pk):
         defaults={'quantity': quantity}
     )
     
-    if not created:
+    if created:
+        adjust_cart_count(request.user, quantity)
+    else:
+        old_quantity = cart_item.quantity
         cart_item.quantity += quantity
         if cart_item.quantity > product.stock_quantity:
             cart_item.quantity = product.stock_quantity
         cart_item.save()
+        adjust_cart_count(request.user, cart_item.quantity - old_quantity)
         
     messages.success(request, f'Đã thêm {product.name} vào giỏ hàng!')
     return redirect(request.META.get('HTTP_REFERER', 'home'))
@@ -373,6 +383,7 @@ def update_cart_quantity(request, pk):
             # Check stock
             product = cart_item.card if cart_item.card else cart_item.other_product
             if quantity <= product.stock_quantity:
+                adjust_cart_count(request.user, quantity - cart_item.quantity)
                 cart_item.quantity = quantity
                 cart_item.save()
                 messages.success(request, 'Đã cập nhật số lượng!')
@@ -380,6 +391,7 @@ def update_cart_quantity(request, pk):
                 messages.error(request, f'Chỉ còn {product.stock_quantity} sản phẩm!')
         else:
             cart_item.delete()
+            adjust_cart_count(request.user, -cart_item.quantity)
             messages.success(request, 'Đã xóa sản phẩm khỏi giỏ hàng!')
     
     return redirect('cart')
@@ -389,6 +401,7 @@ def remove_from_cart(request, pk):
     cart_item = get_object_or_404(CartItem, pk=pk, user=request.user)
     product_name = cart_item.card.name if cart_item.card else cart_item.other_product.name
     cart_item.delete()
+    adjust_cart_count(request.user, -cart_item.quantity)
     messages.success(request, f'Đã xóa {product_name} khỏi giỏ hàng!')
     return redirect('cart')
 
@@ -407,6 +420,7 @@ def cart(request):
     context = {
         'cart_items': cart_items,
         'total': total,
+        'bought_together': recommendations.for_cart(cart_items),
     }
     return render(request, 'cards/cart.html', context)
 
@@ -422,18 +436,24 @@ def cart(request):
 @login_required
 def checkout(request):
     """Display checkout page with cart items and shipping form"""
-    cart_items = CartItem.objects.filter(user=request.user).select_related('card', 'card__card_set')
+    cart_items = CartItem.objects.filter(user=request.user).select_related(
+        'card', 'card__card_set', 'other_product'
+    )
     
     if not cart_items:
         messages.warning(request, 'Your cart is empty.')
         return redirect('cart')
     
+    # Hold the stock while the form is filled in (see reservations.py)
+    try:
+        reserved_until = checkout_service.reserve_cart(request.user)
+    except (checkout_service.EmptyCart, checkout_service.InsufficientStock) as e:
+        messages.error(request, str(e))
+        return redirect('cart')
+    
     # Calculate totals
     subtotal = sum(item.total_price for item in cart_items)
-    tax_rate = Decimal('0.085')  # 8.5% tax
-    tax = subtotal * tax_rate
-    shipping = Decimal('0.00')  # Free shipping
-    total = subtotal + tax + shipping
+    tax, shipping, total = checkout_service.totals(subtotal)
     
     context = {
         'cart_items': cart_items,
@@ -441,89 +461,54 @@ def checkout(request):
         'tax': tax,
         'shipping': shipping,
         'total': total,
+        'reserved_until': reserved_until,
+        'checkout_key': checkout_service.new_key(),
     }
     return render(request, 'cards/checkout.html', context)
 
 
 @login_required
-@transaction.atomic
 def process_checkout(request):
     """Process the checkout and create order"""
     if request.method != 'POST':
         return redirect('checkout')
     
-    # Get cart items
-    cart_items = CartItem.objects.filter(user=request.user).select_related('card')
-    
-    if not cart_items:
-        messages.error(request, 'Your cart is empty.')
-        return redirect('cart')
-    
-    # Validate stock availability
-    for item in cart_items:
-        product = item.card
-        if product.stock_quantity < item.quantity:
-            messages.error(request, f'Insufficient stock for {product.name}. Available: {product.stock_quantity}')
-            return redirect('cart')
+    shipping = {
+        'shipping_full_name': request.POST.get('full_name'),
+        'shipping_address': request.POST.get('address'),
+        'shipping_city': request.POST.get('city'),
+        'shipping_state': request.POST.get('state'),
+        'shipping_zip_code': request.POST.get('zip_code'),
+        'shipping_phone': request.POST.get('phone'),
+        'payment_method': request.POST.get('payment_method', 'credit_card'),
+        'order_notes': request.POST.get('order_notes', ''),
+    }
     
-    # Calculate totals
-    subtotal = sum(item.total_price for item in cart_items)
-    tax_rate = Decimal('0.085')
-    tax = subtotal * tax_rate
-    shipping = Decimal('0.00')
-    total = subtotal + tax + shipping
+    # Sent with the form so a double-click or retry cannot place the order twice
+    key = request.POST.get('checkout_key', '').strip()
+    if not key or len(key) > 64:
+        messages.error(request, 'Phiên thanh toán không hợp lệ, vui lòng thử lại.')
+        return redirect('checkout')
     
+    # Stock is locked, checked and taken in one transaction (see checkout.py)
     try:
-        # Create order
-        order = Order.objects.create(
-            user=request.user,
-            subtotal=subtotal,
-            tax=tax,
-            shipping_cost=shipping,
-            total_amount=total,
-            shipping_full_name=request.POST.get('full_name'),
-            shipping_address=request.POST.get('address'),
-            shipping_city=request.POST.get('city'),
-            shipping_state=request.POST.get('state'),
-            shipping_zip_code=request.POST.get('zip_code'),
-            shipping_phone=request.POST.get('phone'),
-            payment_method=request.POST.get('payment_method', 'credit_card'),
-            order_notes=request.POST.get('order_notes', ''),
-        )
-        
-        # Create order items and update stock
-        for item in cart_items:
-            product = item.card
-            
-            # Create order item
-            OrderItem.objects.create(
-                order=order,
-                card=product,
-                product_name=product.name,
-                product_sku='',  # Cards don't have SKU
-                quantity=item.quantity,
-                price=product.price,
-                subtotal=item.total_price
-            )
-            
-            # Update stock
-            product.stock_quantity -= item.quantity
-            product.save()
-        
-        # Mark order as confirmed and paid
-        order.status = 'confirmed'
-        order.payment_status = 'paid'
-        order.save()
-        
-        # Clear cart
-        cart_items.delete()
-        
-        messages.success(request, f'Order {order.order_number} placed successfully!')
-        return redirect('order_confirmation', order_id=order.id)
-        
+        order = checkout_service.place_order(request.user, shipping, key=key)
+    except (checkout_service.EmptyCart, checkout_service.InsufficientStock) as e:
+        messages.error(request, str(e))
+        return redirect('cart')
     except Exception as e:
         messages.error(request, f'Error processing order: {str(e)}')
         return redirect('checkout')
+    
+    if order.replayed:
+        # Same submit again: just show the original order
+        return redirect('order_confirmation', order_id=order.id)
+    
+    # Clear cart
+    reset_cart_count(request.user, 0)
+    
+    messages.success(request, f'Order {order.order_number} placed successfully!')
+    return redirect('order_confirmation', order_id=order.id)
 
 
 @login_required
@@ -540,7 +525,8 @@ def order_confirmation(request, order_id):
 @login_required
 def my_orders(request):
     """Display user's order history with search and filter"""
-    orders = Order.objects.filter(user=request.user).prefetch_related('items')
+    # item_count / line_count live on Order, so no item prefetch
+    orders = Order.objects.filter(user=request.user)
     
     # Search by order number
     search_query = request.GET.get('q', '').strip()
@@ -584,18 +570,8 @@ def cancel_order(request, order_id):
     """Cancel an order (only if status is pending or confirmed)"""
     order = get_object_or_404(Order, id=order_id, user=request.user)
     
-    if order.status in ['pending', 'confirmed']:
-        # Restore stock
-        for item in order.items.all():
-            if item.card:
-                item.card.stock_quantity += item.quantity
-                item.card.save()
-            elif item.other_product:
-                item.other_product.stock_quantity += item.quantity
-                item.other_product.save()
-        
-        order.status = 'cancelled'
-        order.save()
+    # Status check, stock restore and status update in one transaction (see checkout.py)
+    if checkout_service.cancel_orders(Order.objects.filter(pk=order.pk), user=request.user):
         messages.success(request, f'Order {order.order_number} has been cancelled.')
     else:
         messages.error(request, 'This order cannot be cancelled.')
@@ -627,6 +603,7 @@ def contact_us(request):
     """Display contact us page"""
     return render(request, 'contact_us.html')
 
+@condition(etag_func=conditional.shipping_info_etag)
 def shipping_info(request):
     """Display shipping information page"""
     from .models import ShippingSettings
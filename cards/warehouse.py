@@ -0,0 +1,100 @@
+"""
+Batch stock edits for the warehouse dashboard.
+
+The warehouse table queues stock edits in the browser and sends them together as
+[{card_id, delta}, ...], each delta taken from the stock the page loaded, so a checkout
+that sold some of the card in the meantime is kept; an absolute {card_id, quantity}
+overwrites whatever the stock is by then. apply_stock_changes() validates every row, locks
+the cards it touches in id order (the lock order checkout uses), writes all the new
+stock values with one bulk_update (an UPDATE ... CASE) and the matching ledger
+movements with one bulk_create, in a single transaction. Every row gets its own result,
+so one bad row does not throw away the rest of the batch.
+"""
+from django.db import transaction
+from django.utils import timezone
+
+from . import checkout, stock_ledger
+from .models import Card
+
+# Largest batch accepted in one request
+MAX_CHANGES = 1000
+
+
+class ChangeError(ValueError):
+    pass
+
+
+def _integer(value, name):
+    if isinstance(value, bool):
+        raise ChangeError(f'{name} phải là số nguyên')
+    try:
+        number = int(value)
+    except (TypeError, ValueError):
+        raise ChangeError(f'{name} phải là số nguyên')
+    if isinstance(value, float) and number != value:
+        raise ChangeError(f'{name} phải là số nguyên')
+    return number
+
+
+def parse_change(raw):
+    """Return (card_id, 'quantity' | 'delta', value) for one change, or raise ChangeError"""
+    if not isinstance(raw, dict):
+        raise ChangeError('Thay đổi không hợp lệ')
+    card_id = _integer(raw.get('card_id'), 'card_id')
+    has_quantity = raw.get('quantity') is not None
+    has_delta = raw.get('delta') is not None
+    if has_quantity == has_delta:
+        raise ChangeError('Cần đúng một trong hai trường quantity hoặc delta')
+    if has_quantity:
+        quantity = _integer(raw['quantity'], 'quantity')
+        if quantity < 0:
+            raise ChangeError('Số lượng kho không thể âm')
+        return card_id, 'quantity', quantity
+    return card_id, 'delta', _integer(raw['delta'], 'delta')
+
+
+def apply_stock_changes(changes, user=None):
+    """Apply a list of stock changes in order; return one result dict per change"""
+    results = [None] * len(changes)
+    parsed = []
+    for index, raw in enumerate(changes):
+        try:
+            parsed.append((index, *parse_change(raw)))
+        except ChangeError as e:
+            card_id = raw.get('card_id') if isinstance(raw, dict) else None
+            results[index] = {'index': index, 'card_id': card_id, 'success': False, 'message': str(e)}
+
+    with transaction.atomic():
+        cards = checkout.lock(Card, {card_id for _, card_id, _, _ in parsed})
+        before = {pk: card.stock_quantity for pk, card in cards.items()}
+        # Several changes to one card apply one after another
+        for index, card_id, kind, value in parsed:
+            card = cards.get(card_id)
+            if card is None:
+                results[index] = {'index': index, 'card_id': card_id, 'success': False,
+                                  'message': 'Không tìm thấy thẻ'}
+                continue
+            new_stock = value if kind == 'quantity' else card.stock_quantity + value
+            if new_stock < 0:
+                results[index] = {'index': index, 'card_id': card_id, 'success': False,
+                                  'message': f'Kho không thể âm (hiện có {card.stock_quantity})'}
+                continue
+            card.stock_quantity = new_stock
+            results[index] = {'index': index, 'card_id': card_id, 'success': True, 'stock_quantity': new_stock}
+
+        changed = [card for pk, card in cards.items() if card.stock_quantity != before[pk]]
+        if changed:
+            now = timezone.now()
+            for card in changed:
+                card.updated_at = now
+            Card.objects.bulk_update(changed, ['stock_quantity', 'updated_at'])
+            stock_ledger.record([
+                stock_ledger.movement(
+                    'card', card.pk, card.stock_quantity - before[card.pk], 'adjustment',
+                    user=user, note='Cập nhật kho hàng loạt',
+                )
+                for card in changed
+            ])
+            # bulk_update skips post_save, so retire the catalog caches here
+            checkout.stock_changed()
+    return results